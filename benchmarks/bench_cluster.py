@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+""" End-to-end benchmark of the plugin on a CPU-only LocalCluster. """
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from distributed import Client, LocalCluster
+
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import plugin
+
+SAMPLER = "benchmarks.simulated.simulated_gpu_memory_used"
+
+
+def inc(x):
+    """ Tiny task. """
+    return x + 1
+
+
+def add(*args):
+    """ Tiny reduction. """
+    return sum(args)
+
+
+def tree_graph(n_tasks, fanin):
+    """
+    Graph of `n_tasks` independent tasks reduced by a tree.
+
+    Parameters
+    ----------
+    n_tasks : int
+        Number of leaf tasks.
+    fanin : int
+        Number of inputs of each reduction task.
+
+    Returns
+    -------
+    tuple
+        The graph and the key of its root.
+    """
+    dsk = {f"inc-{i}": (inc, i) for i in range(n_tasks)}
+
+    level, layer = 0, list(dsk)
+    while len(layer) > 1:
+        next_layer = []
+        for i in range(0, len(layer), fanin):
+            key = f"add-{level}-{i}"
+            dsk[key] = (add, *layer[i:i + fanin])
+            next_layer.append(key)
+
+        level, layer = level + 1, next_layer
+
+    return dsk, layer[0]
+
+
+GRAPHS = {
+    "map-reduce": lambda n: tree_graph(n, 100),
+    "tree": lambda n: tree_graph(n, 2),
+}
+
+
+def find_plugin(scheduler):
+    """ Plugin instance preloaded into the scheduler. """
+    for instance in scheduler.plugins.values():
+        if isinstance(instance, plugin.MemoryUsageGPUsPlugin):
+            return instance
+
+    return None
+
+
+def run(dsk, key, n_workers, preload_argv=None):
+    """
+    Compute the graph on a new LocalCluster.
+
+    Returns
+    -------
+    tuple
+        The wall time in seconds and the plugin instance, if preloaded.
+    """
+    scheduler_kwargs = {}
+    if preload_argv is not None:
+        scheduler_kwargs = {"preload": ["dask_memusage_gpus_plugin"],
+                            "preload_argv": [preload_argv]}
+
+    with LocalCluster(n_workers=n_workers, threads_per_worker=1, processes=False,
+                      dashboard_address=None,
+                      scheduler_kwargs=scheduler_kwargs) as cluster, \
+            Client(cluster) as client:
+        dask_plugin = find_plugin(cluster.scheduler)
+
+        start = time.perf_counter()
+        client.get(dsk, key)
+        elapsed = time.perf_counter() - start
+
+    return elapsed, dask_plugin
+
+
+def plugin_footprint():
+    """ Memory currently allocated by the plugin code in MiB. """
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, "*dask_memusage_gpus*", all_frames=True)]
+    )
+
+    return sum(stat.size for stat in snapshot.statistics("filename")) / 2**20
+
+
+def fmt(summary, field, scale=1e3):
+    """ Format a field of a histogram summary in milliseconds. """
+    if summary.get("count", 0) == 0:
+        return "-"
+
+    return f"{summary[field] * scale:.3f}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the plugin on a LocalCluster.')
+    parser.add_argument('--sizes', type=str, default='10000',
+                        help='Comma separated numbers of leaf tasks '
+                             '(e.g. 10000,100000,1000000).')
+    parser.add_argument('--graphs', type=str, default=','.join(GRAPHS),
+                        help='Comma separated graph generators.')
+    parser.add_argument('--types', type=str, default=','.join(defs.FILE_TYPES),
+                        help='Comma separated list of record types.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of workers.')
+    parser.add_argument('--interval', type=float, default=0.1,
+                        help='Sampling interval in seconds.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Batch size of the record writes.')
+    parser.add_argument('--memory', action='store_true',
+                        help='Trace the plugin memory footprint '
+                             '(slows down every run).')
+
+    args = parser.parse_args()
+
+    if args.memory:
+        tracemalloc.start(10)
+
+    print(f"{'graph':<12}{'tasks':>9}{'type':>9}{'tasks/s':>10}{'overhead%':>11}"
+          f"{'poll p95 ms':>13}{'sampler p95 ms':>16}{'write us/task':>15}"
+          f"{'footprint MiB':>15}")
+
+    for graph in args.graphs.split(','):
+        for size in map(int, args.sizes.split(',')):
+            dsk, key = GRAPHS[graph](size)
+
+            baseline, _ = run(dsk, key, args.workers)
+
+            print(f"{graph:<12}{len(dsk):>9}{'-':>9}{len(dsk) / baseline:>10.0f}"
+                  f"{'-':>11}")
+
+            for filetype in args.types.split(','):
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    path = os.path.join(tmpdir, "memusage")
+                    preload_argv = ["--memusage-gpus-path", path,
+                                    "--memusage-gpus-record-type", filetype,
+                                    "--memusage-gpus-interval", str(args.interval),
+                                    "--memusage-gpus-batch-size", str(args.batch_size),
+                                    "--memusage-gpus-sampler", SAMPLER]
+
+                    elapsed, dask_plugin = run(dsk, key, args.workers, preload_argv)
+
+                    footprint = f"{plugin_footprint():.2f}" if args.memory else "-"
+
+                overhead = dask_plugin.overhead()
+                write = overhead.get("record_write", {"count": 0})
+                write_per_task = write.get("total", 0) / len(dsk) * 1e6
+
+                print(f"{graph:<12}{len(dsk):>9}{filetype:>9}{len(dsk) / elapsed:>10.0f}"
+                      f"{(elapsed / baseline - 1) * 100:>11.1f}"
+                      f"{fmt(overhead.get('poll_round_trip', {}), 'p95'):>13}"
+                      f"{fmt(overhead.get('sampler', {}), 'p95'):>16}"
+                      f"{write_per_task:>15.1f}{footprint:>15}")
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+""" Benchmark the plugin throughput when a storm of tasks finishes. """
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from mock import Mock
+
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import plugin
+
+
+class StubWorkersThread:
+    """ Workers thread replacement that always has a sample ready. """
+    def fetch_task_used_memory(self, worker_address, key=None):
+        """ Return a constant GPU memory usage. """
+        return (100, 200)
+
+    def stop(self):
+        """ Nothing to stop. """
+
+
+def run(filetype, n_tasks, n_workers, batch_size):
+    """ Drive `n_tasks` synthetic transitions and return tasks/second. """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        scheduler = Mock()
+        scheduler.address = '127.0.0.1'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=os.path.join(tmpdir, "memusage"),
+                                                   filetype=filetype,
+                                                   interval=1,
+                                                   mem_max=False,
+                                                   run_on_client=True,
+                                                   batch_size=batch_size)
+        dask_plugin._workers_thread = StubWorkersThread()
+
+        workers = [f"tcp://10.0.0.{i}:34567" for i in range(n_workers)]
+
+        start = time.perf_counter()
+
+        for i in range(n_tasks):
+            dask_plugin.transition(f"func-{i}", "processing", "memory",
+                                   worker=workers[i % n_workers])
+
+        asyncio.run(dask_plugin.before_close())
+
+        return n_tasks / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched transitions.')
+    parser.add_argument('--tasks', type=int, default=2000,
+                        help='Number of finished tasks.')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of workers.')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='Batch size compared with the unbatched path.')
+    parser.add_argument('--types', type=str, default=defs.CSV,
+                        help='Comma separated list of record types.')
+
+    args = parser.parse_args()
+
+    print(f"{'type':<10}{'batch':>8}{'tasks/s':>14}")
+    for filetype in args.types.split(','):
+        for batch_size in (1, args.batch_size):
+            throughput = run(filetype, args.tasks, args.workers, batch_size)
+
+            print(f"{filetype:<10}{batch_size:>8}{throughput:>14.1f}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+""" Simulated GPU memory model to benchmark the plugin without GPUs. """
+
+import random
+import time
+import zlib
+
+from dask.utils import key_split
+
+
+class SimulatedGPU:
+    """
+    Memory model of a GPU used by a single worker.
+
+    Every executing task allocates memory in a ramp towards its own peak and
+    the peak depends on the task prefix, like a real kernel for a given
+    chunk size. A caching allocator keeps the reserved memory after the
+    tasks finish and only releases a fraction of it at every sample.
+
+    Parameters
+    ----------
+    seed : string
+        Seed of the random noise, usually the worker address.
+    base_mb : int
+        Memory used by the CUDA context (default=300).
+    ramp : float
+        Time in seconds a task takes to reach its peak (default=0.05).
+    release : float
+        Fraction of the idle reserved memory released at every sample
+        (default=0.1).
+    """
+    def __init__(self, seed: str, base_mb: int = 300, ramp: float = 0.05,
+                 release: float = 0.1):
+        """ Constructor of the SimulatedGPU class. """
+        self._rng = random.Random(seed)
+        self._base_mb = base_mb
+        self._ramp = ramp
+        self._release = release
+        self._started: dict = {}
+        self._reserved: float = base_mb
+
+    @staticmethod
+    def task_peak(key) -> float:
+        """ Deterministic peak in MiB of a task prefix, from 64 MiB to 2 GiB. """
+        return 64 + zlib.crc32(key_split(key).encode()) % 1984
+
+    def sample(self, executing_keys, now: float) -> int:
+        """
+        Sample the used memory.
+
+        Parameters
+        ----------
+        executing_keys : iterable
+            Keys of the tasks executing on the worker.
+        now : float
+            Monotonic time of the sample.
+
+        Returns
+        -------
+        integer
+            The used memory in MiB.
+        """
+        started = {key: self._started.get(key, now) for key in executing_keys}
+        self._started = started
+
+        demand = self._base_mb
+        for key, start in started.items():
+            demand += self.task_peak(key) * min(1.0, (now - start) / self._ramp)
+
+        if demand >= self._reserved:
+            self._reserved = demand
+        else:
+            self._reserved -= (self._reserved - demand) * self._release
+
+        return int(self._reserved * self._rng.uniform(0.98, 1.02))
+
+
+_GPUS: dict[str, SimulatedGPU] = {}
+
+
+def simulated_gpu_memory_used(dask_worker):
+    """
+    Sampler that replaces `nvidia-smi` by the simulated memory model.
+
+    It can be preloaded with `--memusage-gpus-sampler
+    benchmarks.simulated.simulated_gpu_memory_used`.
+    """
+    gpu = _GPUS.get(dask_worker.address)
+    if gpu is None:
+        gpu = _GPUS[dask_worker.address] = SimulatedGPU(dask_worker.address)
+
+    executing = [ts.key for ts in list(dask_worker.state.executing)]
+
+    return gpu.sample(executing, time.monotonic())
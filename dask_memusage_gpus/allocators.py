@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+""" In-process trackers of the GPU memory allocated by RMM or CuPy. """
+
+import logging
+from functools import partial
+from threading import RLock
+
+from dask_memusage_gpus import definitions as defs
+
+logger = logging.getLogger(__name__)
+
+MIB = 2**20
+
+
+class AllocatorTracker:
+    """
+    Base class of the allocator trackers.
+
+    A tracker runs inside the worker process and reads the allocator
+    counters, so it reports what the tasks actually allocated instead of
+    the memory reserved by the pool, and no peak is lost between samples.
+    The peak is shared by the whole process, so it is exact per task when
+    the worker runs one thread per GPU.
+    """
+    def current(self) -> float:
+        """ Memory currently allocated in MiB. """
+        raise NotImplementedError
+
+    def peak(self) -> float:
+        """ Highest memory allocated since the last reset in MiB. """
+        raise NotImplementedError
+
+    def reset_peak(self):
+        """ Restart the peak tracking from the current allocation. """
+        raise NotImplementedError
+
+
+class RMMTracker(AllocatorTracker):
+    """
+    Tracker based on the RMM statistics resource adaptor.
+
+    Each reset pushes a new statistics scope whose counters start from
+    zero, so the peak of the scope plus the allocation at the reset is the
+    peak since the reset.
+
+    Parameters
+    ----------
+    statistics : module
+        The `rmm.statistics` module or an object with the same API.
+    """
+    def __init__(self, statistics):
+        """ Constructor of the RMMTracker class. """
+        self._statistics = statistics
+        self._statistics.enable_statistics()
+        self._base: int = 0
+        self._scoped: bool = False
+
+    def current(self) -> float:
+        """ Memory currently allocated in MiB. """
+        return (self._base + self._statistics.get_statistics().current_bytes) / MIB
+
+    def peak(self) -> float:
+        """ Highest memory allocated since the last reset in MiB. """
+        return (self._base + self._statistics.get_statistics().peak_bytes) / MIB
+
+    def reset_peak(self):
+        """ Restart the peak tracking from the current allocation. """
+        if self._scoped:
+            self._statistics.pop_statistics()
+
+        self._base = self._statistics.get_statistics().current_bytes
+
+        self._statistics.push_statistics()
+        self._scoped = True
+
+
+class CuPyTracker(AllocatorTracker):
+    """
+    Tracker of the memory allocated through the allocator of CuPy.
+
+    The allocator installed in the worker, like the default memory pool or
+    the RMM allocator of Dask CUDA, is wrapped to count the bytes it
+    returns until CuPy frees them, so the tasks still allocate from the
+    same place. Peaks can only happen right after an allocation, so the
+    peak is exact. If a task installs another allocator, it is wrapped in
+    turn when the next task starts.
+
+    Parameters
+    ----------
+    get_allocator : callable
+        Function that returns the current allocator.
+    set_allocator : callable
+        Function that installs the wrapper as the allocator.
+    wrap_pointer : callable
+        Called with a pointer returned by the allocator, its size and a
+        `release` callable. It returns the pointer given to CuPy, which
+        must call `release` once CuPy frees it.
+    """
+    def __init__(self, get_allocator, set_allocator, wrap_pointer):
+        """ Constructor of the CuPyTracker class. """
+        self._get_allocator = get_allocator
+        self._set_allocator = set_allocator
+        self._wrap_pointer = wrap_pointer
+        self._allocator = None
+        self._current: int = 0
+        self._peak: int = 0
+
+        # Freed pointers may be released by the garbage collector of any thread
+        self._lock = RLock()
+
+        # Bound once, so the installed allocator can be compared with it
+        self._wrapper = self._malloc
+        self._install()
+
+    def _install(self):
+        """ Wrap the current allocator unless it is already the wrapper. """
+        allocator = self._get_allocator()
+        if allocator is self._wrapper:
+            return
+
+        if self._allocator is not None:
+            logger.warning("The CuPy allocator was replaced, tracking the new one.")
+
+        self._allocator = allocator
+        self._set_allocator(self._wrapper)
+
+    def _malloc(self, size):
+        """ Allocate with the wrapped allocator and update the peak. """
+        pointer = self._allocator(size)
+        if size == 0:
+            return pointer
+
+        with self._lock:
+            self._current += size
+            if self._current > self._peak:
+                self._peak = self._current
+
+        return self._wrap_pointer(pointer, size, partial(self._free, size))
+
+    def _free(self, size):
+        """ Account the memory freed by CuPy. """
+        with self._lock:
+            self._current -= size
+
+    def current(self) -> float:
+        """ Memory currently allocated in MiB. """
+        return self._current / MIB
+
+    def peak(self) -> float:
+        """ Highest memory allocated since the last reset in MiB. """
+        return self._peak / MIB
+
+    def reset_peak(self):
+        """ Restart the peak tracking from the current allocation. """
+        self._install()
+
+        with self._lock:
+            self._peak = self._current
+
+
+class _Allocation:
+    """ Owner of a pointer wrapped by `CuPyTracker`, released with it. """
+    def __init__(self, pointer, release):
+        """ Constructor of the _Allocation class. """
+        self._pointer = pointer
+        self._release = release
+
+    def __del__(self):
+        """ Account the memory as freed and drop the wrapped pointer. """
+        self._release()
+
+
+def _cupy_pointer(pointer, size, release):
+    """
+    CuPy pointer to the memory of `pointer` that calls `release` and frees
+    `pointer` once CuPy frees it.
+    """
+    import cupy  # type: ignore[import-not-found, import-untyped]
+
+    memory = cupy.cuda.UnownedMemory(pointer.ptr, size, _Allocation(pointer, release),
+                                     device_id=pointer.device_id)
+
+    return cupy.cuda.MemoryPointer(memory, 0)
+
+
+def get_tracker(name):
+    """
+    Create the tracker of an allocator if its library is available.
+
+    Parameters
+    ----------
+    name : string
+        One of `defs.ALLOCATORS`.
+
+    Returns
+    -------
+    AllocatorTracker or None
+        The tracker, or None if the library is not installed.
+
+    Raises
+    ------
+    AllocatorException
+        If the allocator is not supported.
+    """
+    if name not in defs.ALLOCATORS:
+        raise defs.AllocatorException(f"'{name}' is not a valid allocator.")
+
+    try:
+        if name == defs.RMM:
+            import rmm.statistics  # type: ignore[import-not-found, import-untyped]
+
+            return RMMTracker(rmm.statistics)
+
+        import cupy  # type: ignore[import-not-found, import-untyped]
+
+        return CuPyTracker(cupy.cuda.get_allocator, cupy.cuda.set_allocator,
+                           _cupy_pointer)
+    except ImportError as e:
+        logger.warning(f"Allocator '{name}' is not available: {e}")
+
+    return None
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+
+""" Vectorized diagnostics and downsampling of the records of the plugin. """
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from dask.utils import key_split
+
+# Value recorded when no sample was taken while the task was running
+MISSED = -1
+
+# Words of a key that are inspected without falling back to key_split
+_MAX_WORDS = 4
+
+# Keys shortened by each thread
+_CHUNK_SIZE = 1_000_000
+
+
+def _split_names(keys):
+    """
+    Shorten the keys into names that have the same `key_split` prefix.
+
+    `key_split` keeps the first word and the following words made only of
+    letters, and ignores anything after the first other word. That word is
+    replaced by a constant one, so keys that only differ in their token or
+    index, like `('make_blobs-3a9c', 0)` and `('make_blobs-3a9c', 1)`, get
+    the same name. Keys with more words than `_MAX_WORDS` are kept as they
+    are.
+
+    Parameters
+    ----------
+    keys : pyarrow.LargeStringArray
+        Task keys.
+
+    Returns
+    -------
+    pyarrow.LargeStringArray
+        The shortened keys.
+    """
+    import pyarrow as pa  # type: ignore[import-untyped]
+    import pyarrow.compute as pc  # type: ignore[import-untyped]
+
+    words = pc.split_pattern(keys, "-", max_splits=_MAX_WORDS)
+
+    offsets = words.offsets.to_numpy()
+    flat = words.values
+    n_words = np.diff(offsets)
+
+    letters = pc.utf8_is_alpha(flat).to_numpy(zero_copy_only=False)
+    initial = pc.utf8_slice_codeunits(flat, 0, 1)
+    hex_like = pc.and_(pc.equal(pc.utf8_length(flat), 8),
+                       pc.and_(pc.greater_equal(initial, "a"),
+                               pc.less_equal(initial, "f")))
+    hex_like = hex_like.to_numpy(zero_copy_only=False)
+    kept_word = letters & ~hex_like
+
+    # The first word of tuple keys only matters until its first comma
+    first = pc.take(flat, offsets[:-1])
+    until_comma = pc.list_element(pc.split_pattern(first, ",", max_splits=1), 0)
+    starts_with_letter = pc.utf8_is_alpha(pc.utf8_slice_codeunits(first, 0, 1))
+    first = pc.if_else(pc.and_(pc.invert(starts_with_letter),
+                               pc.not_equal(until_comma, "")),
+                       until_comma, first)
+
+    # Number of consecutive words kept after the first one
+    kept = np.zeros(len(keys), dtype=int)
+    alive = np.ones(len(keys), dtype=bool)
+    indices = []
+    for j in range(1, _MAX_WORDS):
+        index = np.minimum(offsets[:-1] + j, max(len(flat) - 1, 0))
+        indices.append(index)
+
+        alive &= (j < n_words) & kept_word[index]
+        kept += alive
+
+    parts = [first]
+    for j, index in enumerate(indices, start=1):
+        parts.append(pc.if_else(pa.array(kept >= j), pc.take(flat, index), None))
+
+    # Any word after the kept ones stops key_split
+    parts.append(pc.if_else(pa.array(kept + 1 < n_words),
+                            pa.scalar("0", pa.large_string()), None))
+
+    names = pc.binary_join_element_wise(*parts, pa.scalar("-", pa.large_string()),
+                                        null_handling="skip")
+
+    # The last part holds the rest of the key, which was not inspected
+    undecided = (kept == _MAX_WORDS - 1) & (n_words > _MAX_WORDS)
+
+    return pc.if_else(pa.array(undecided), keys, names)
+
+
+def task_prefixes(keys):
+    """
+    Prefix of each task key, as `dask.utils.key_split`.
+
+    The keys are shortened with vectorized string kernels first, so
+    `key_split` only runs once per distinct name.
+
+    Parameters
+    ----------
+    keys : Series
+        Task keys.
+
+    Returns
+    -------
+    Series
+        The categorical prefix of each key.
+    """
+    import pyarrow as pa  # type: ignore[import-untyped]
+
+    if len(keys) == 0:
+        return pd.Series(pd.Categorical([]), index=keys.index, name="prefix")
+
+    arrow_keys = pa.array(keys.astype(str)).cast(pa.large_string())
+
+    # The string kernels release the GIL
+    chunks = [arrow_keys.slice(start, _CHUNK_SIZE)
+              for start in range(0, len(arrow_keys), _CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        names = list(pool.map(_split_names, chunks))
+
+    names = pa.concat_arrays(names).dictionary_encode()
+
+    prefixes = [key_split(name) for name in names.dictionary.to_pylist()]
+    categories, codes = np.unique(np.array(prefixes, dtype=object), return_inverse=True)
+
+    indices = names.indices.to_numpy(zero_copy_only=False)
+    prefix = pd.Categorical.from_codes(codes[indices], categories=categories)
+
+    return pd.Series(prefix, index=keys.index, name="prefix")
+
+
+def task_durations(df):
+    """
+    Duration of each task in seconds.
+
+    The `duration` column is used when the records have it. Otherwise, the
+    duration is inferred as the gap between consecutive completions on the
+    same worker, which is an upper bound when workers are not always busy.
+    The first task of each worker has no duration (NaN).
+
+    Parameters
+    ----------
+    df : DataFrame
+        Records with `time` and `worker_id` columns.
+
+    Returns
+    -------
+    numpy.ndarray
+        Duration of each row, in the order of `df`.
+    """
+    if "duration" in df.columns:
+        return df["duration"].to_numpy(dtype=float)
+
+    times = df["time"].to_numpy(dtype=float)
+    workers, uniques = pd.factorize(df["worker_id"])
+    if len(uniques) < 2**16:
+        # Stable sorts of small integers are radix sorts
+        workers = workers.astype(np.uint16)
+
+    # Records are usually written in time order already
+    order = np.arange(len(times))
+    if np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind="stable")
+    order = order[np.argsort(workers[order], kind="stable")]
+
+    gaps = np.empty(len(order))
+    gaps[0:1] = np.nan
+    gaps[1:] = np.diff(times[order])
+    gaps[1:][workers[order][1:] != workers[order][:-1]] = np.nan
+
+    durations = np.empty(len(order))
+    durations[order] = gaps
+
+    return durations
+
+
+def _sorted(durations):
+    """ Sorted durations without NaNs. """
+    d = np.sort(np.asarray(durations, dtype=float))
+
+    return d[:len(d) - np.count_nonzero(np.isnan(d))]
+
+
+def _coverage_sorted(d, intervals):
+    """ Coverage of sorted durations without NaNs. """
+    if len(d) == 0:
+        return np.full(len(intervals), np.nan)
+
+    sums = np.concatenate([[0.0], np.cumsum(d)])
+
+    # Tasks shorter than the interval count d / I, the others count 1
+    shorter = np.searchsorted(d, intervals, side="left")
+
+    return (sums[shorter] / intervals + len(d) - shorter) / len(d)
+
+
+def _recommend_sorted(d, target):
+    """ Recommended interval of sorted durations without NaNs. """
+    n = len(d)
+    if n == 0:
+        return np.nan
+
+    k = np.arange(n + 1)
+    sums = np.concatenate([[0.0], np.cumsum(d)])
+    low = np.concatenate([[0.0], d])
+    high = np.concatenate([d, [np.inf]])
+
+    required = target * n - n + k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bound = np.where(required > 0, sums / required, np.inf)
+
+    upper = np.minimum(high, bound)
+
+    return float(upper[upper >= low].max())
+
+
+def coverage(durations, intervals):
+    """
+    Expected fraction of the tasks hit by at least one periodic sample.
+
+    A task of duration `d` is hit by a sampler with period `I` and random
+    phase with probability `min(1, d / I)`.
+
+    Parameters
+    ----------
+    durations : array_like
+        Task durations in seconds. NaNs are ignored.
+    intervals : array_like
+        Sampling intervals in seconds.
+
+    Returns
+    -------
+    numpy.ndarray
+        The coverage of each interval.
+    """
+    intervals = np.atleast_1d(np.asarray(intervals, dtype=float))
+
+    return _coverage_sorted(_sorted(durations), intervals)
+
+
+def recommend_interval(durations, target=0.95):
+    """
+    Largest sampling interval whose coverage reaches a target.
+
+    The largest interval polls the workers the least, so it has the lowest
+    overhead. Coverage decreases with the interval, and it is
+    `(S_k / I + n - k) / n` while exactly `k` tasks are shorter than `I`,
+    with `S_k` their total duration, so the bound is solved in closed form
+    for every `k` at once.
+
+    Parameters
+    ----------
+    durations : array_like
+        Task durations in seconds. NaNs are ignored.
+    target : float, optional
+        Coverage between 0 and 1 (default=0.95).
+
+    Returns
+    -------
+    float
+        The interval in seconds, or NaN without durations.
+    """
+    return _recommend_sorted(_sorted(durations), target)
+
+
+def miss_report(df, interval=None, target=0.95):
+    """
+    Miss rate and task durations per prefix.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Records with `task_key`, `time`, `max_gpu_memory_mb` and
+        `worker_id` columns.
+    interval : float, optional
+        Sampling interval of the run in seconds. If set, the fraction of
+        the tasks shorter than it and its expected coverage are reported.
+    target : float, optional
+        Coverage used to recommend an interval (default=0.95).
+
+    Returns
+    -------
+    DataFrame
+        One row per prefix, sorted by the number of misses, with the
+        number of `tasks`, `misses`, `miss_rate`, the `p50` and `p95`
+        durations and the `recommended_interval`.
+    """
+    prefixes = task_prefixes(df["task_key"]).array
+    codes = prefixes.codes.astype(np.uint16 if len(prefixes.categories) < 2**16
+                                  else np.int64)
+    n_prefixes = len(prefixes.categories)
+
+    durations = task_durations(df)
+    missed = df["max_gpu_memory_mb"].to_numpy() == MISSED
+
+    tasks = np.bincount(codes, minlength=n_prefixes)
+    misses = np.bincount(codes, weights=missed, minlength=n_prefixes).astype(int)
+
+    # Sort once by prefix and duration, NaNs last, and slice each prefix
+    order = np.argsort(durations, kind="stable")
+    order = order[np.argsort(codes[order], kind="stable")]
+    sorted_durations = durations[order]
+    bounds = np.concatenate([[0], np.cumsum(tasks)])
+
+    rows = []
+    for i in range(n_prefixes):
+        d = sorted_durations[bounds[i]:bounds[i + 1]]
+        d = d[:len(d) - np.count_nonzero(np.isnan(d))]
+
+        row = {"p50": np.quantile(d, 0.5) if len(d) else np.nan,
+               "p95": np.quantile(d, 0.95) if len(d) else np.nan}
+
+        if interval is not None:
+            row["shorter_than_interval"] = \
+                np.searchsorted(d, interval) / len(d) if len(d) else np.nan
+            row["coverage"] = _coverage_sorted(d, np.array([interval], dtype=float))[0]
+
+        row["recommended_interval"] = _recommend_sorted(d, target)
+        rows.append(row)
+
+    report = pd.DataFrame(rows, index=pd.Index(prefixes.categories, name="prefix"))
+    report.insert(0, "tasks", tasks)
+    report.insert(1, "misses", misses)
+    report.insert(2, "miss_rate", misses / np.maximum(tasks, 1))
+
+    report = report[report["tasks"] > 0]
+
+    return report.sort_values(["misses", "tasks"], ascending=False)
+
+
+def minmax_downsample(x, y, n_points):
+    """
+    Keep the lowest and the highest point of each bin of consecutive points.
+
+    Peaks survive the downsampling, which matters for memory usage. The
+    first and the last points are always kept.
+
+    Parameters
+    ----------
+    x : array_like
+        Times of the points, unused but kept for the API of the others.
+    y : array_like
+        Values of the points.
+    n_points : int
+        Maximum number of points to keep, at least 4.
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted indices of the points to keep.
+    """
+    if len(y) <= n_points or n_points < 4:
+        return np.arange(len(y))
+
+    # The endpoints take two points of the budget
+    n_bins = (n_points - 2) // 2
+    size = -(-len(y) // n_bins)
+
+    padded = np.full(n_bins * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(n_bins, size)
+
+    # Bins made only of padding do not exist
+    valid = ~np.all(np.isnan(padded), axis=1)
+    padded = padded[valid]
+    offsets = np.flatnonzero(valid) * size
+
+    lows = offsets + np.nanargmin(padded, axis=1)
+    highs = offsets + np.nanargmax(padded, axis=1)
+
+    return np.unique(np.concatenate([[0, len(y) - 1], lows, highs]))
+
+
+def lttb_downsample(x, y, n_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and the last points and, from each bucket in between,
+    the point that forms the largest triangle with the point kept in the
+    previous bucket and the average of the next bucket.
+
+    Parameters
+    ----------
+    x : array_like
+        Times of the points.
+    y : array_like
+        Values of the points.
+    n_points : int
+        Number of points to keep, at least 3.
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted indices of the points to keep.
+    """
+    if len(y) <= n_points or n_points < 3:
+        return np.arange(len(y))
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(1, len(y) - 1, n_points - 1).astype(int)
+
+    indices = np.empty(n_points, dtype=int)
+    indices[0], indices[-1] = 0, len(y) - 1
+
+    for i in range(n_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else len(y)
+
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        a = indices[i]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (avg_y - y[a]))
+
+        indices[i + 1] = start + np.argmax(areas)
+
+    return indices
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+""" Command line tools to digest the records of the plugin. """
+
+import click
+import numpy as np
+import pandas as pd
+
+from dask_memusage_gpus import analysis
+from dask_memusage_gpus import compare as cmp
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import model as mdl
+from dask_memusage_gpus import reader, summary
+
+
+@click.group()
+def main():
+    """ Digest the records of the GPU memory usage plugin. """
+
+
+@main.command()
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--type", "filetype", type=click.Choice(defs.FILE_TYPES), default=None,
+              help="Type of the records (inferred by default).")
+@click.option("--format", "fmt", type=click.Choice(summary.FORMATS),
+              default=summary.MARKDOWN, help="Format of the report.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default=None,
+              help="Write the report into this file instead of stdout.")
+@click.option("--top", type=int, default=10, help="Number of heaviest tasks.")
+@click.option("--gpu-memory", type=float, default=None,
+              help="Memory of a GPU in MiB, to recommend the largest input per prefix.")
+@click.option("--min-tasks", type=int, default=mdl.MIN_TASKS,
+              help="Minimum number of sampled tasks of a prefix to recommend an input.")
+@click.option("--chunksize", type=int, default=reader.CHUNK_SIZE,
+              help="Number of records read at once.")
+def report(path: str, filetype: str, fmt: str, output: str, top: int,
+           gpu_memory: float, min_tasks: int, chunksize: int):
+    """
+    Summarize the records per task prefix and per worker.
+
+    The records are streamed in chunks, so PATH can be larger than the
+    memory. It can be a record file or a directory of record files.
+    Records of the memory model also get a model of the peak of each
+    prefix over the input bytes of its tasks.
+    """
+    record_summary = summary.RecordSummary(top=top, gpu_memory_mb=gpu_memory,
+                                           min_tasks=min_tasks)
+
+    columns = ["task_key", "time", "max_gpu_memory_mb", "worker_id"]
+
+    # The input bytes are only recorded with the memory model
+    files = reader.list_files(path)
+    metadata = reader.read_metadata(files[0]) if files else None
+    if metadata and "input_nbytes" in metadata["config"].get("columns", []):
+        columns.append("input_nbytes")
+
+    for chunk in reader.iter_records(path, filetype=filetype, columns=columns,
+                                     chunksize=chunksize):
+        record_summary.add(chunk)
+
+    _write(record_summary.render(fmt), output)
+
+
+@main.command()
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("runs", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--type", "filetype", type=click.Choice(defs.FILE_TYPES), default=None,
+              help="Type of the records (inferred by default).")
+@click.option("--format", "fmt", type=click.Choice(summary.FORMATS),
+              default=summary.MARKDOWN, help="Format of the comparison.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default=None,
+              help="Write the comparison into this file instead of stdout.")
+@click.option("--alpha", type=float, default=0.01,
+              help="Family-wise significance level of the tests.")
+@click.option("--min-tasks", type=int, default=5,
+              help="Minimum number of sampled tasks of a prefix to test it.")
+@click.option("--min-change", type=float, default=0.0,
+              help="Minimum relative change of the mean peak to report, e.g. 0.05.")
+@click.option("--chunksize", type=int, default=reader.CHUNK_SIZE,
+              help="Number of records read at once.")
+@click.option("--fail-on-regression", is_flag=True,
+              help="Exit with status 1 if any prefix regressed.")
+def compare(baseline: str, runs: tuple, filetype: str, fmt: str, output: str,
+            alpha: float, min_tasks: int, min_change: float, chunksize: int,
+            fail_on_regression: bool):
+    """
+    Compare the GPU memory peaks per task prefix of RUNS to BASELINE.
+
+    Each run is streamed in chunks and reduced to the mean and variance of
+    the peaks of each prefix, which are compared with Welch's t-test.
+    """
+    stats = [cmp.RunStats.from_path(path, filetype=filetype, chunksize=chunksize)
+             for path in (baseline, *runs)]
+
+    comparison = cmp.compare_runs(stats, alpha=alpha, min_tasks=min_tasks,
+                                  min_change=min_change)
+
+    _write(cmp.render(stats, comparison, fmt), output)
+
+    if fail_on_regression and (comparison["status"] == cmp.REGRESSION).any():
+        raise SystemExit(1)
+
+
+@main.command()
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--type", "filetype", type=click.Choice(defs.FILE_TYPES), default=None,
+              help="Type of the records (inferred by default).")
+@click.option("--interval", type=float, default=None,
+              help="Sampling interval of the run in seconds.")
+@click.option("--target", type=float, default=0.95,
+              help="Target coverage of the recommended interval.")
+@click.option("--top", type=int, default=20, help="Number of prefixes to show.")
+def analyze(path: str, filetype: str, interval: float, target: float, top: int):
+    """
+    Diagnose the tasks missed by the sampling per task prefix.
+
+    It reports the tasks that got no sample, the distribution of the task
+    durations against the sampling interval, and the largest interval
+    that samples a TARGET share of the tasks.
+    """
+    columns = ["task_key", "time", "max_gpu_memory_mb", "worker_id"]
+    dataframe = reader.read_records(path, filetype=filetype, columns=columns)
+
+    report = analysis.miss_report(dataframe, interval=interval, target=target)
+
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        click.echo(report.head(top).to_string(float_format=lambda v: f"{v:.4g}"))
+
+    durations = analysis.task_durations(dataframe)
+    missed = np.mean(dataframe["max_gpu_memory_mb"].to_numpy() == analysis.MISSED)
+    recommended = analysis.recommend_interval(durations, target)
+
+    click.echo(f"\n{len(dataframe)} tasks, {missed:.1%} missed.")
+
+    if interval is not None:
+        click.echo(f"Expected coverage of the {interval} s interval: "
+                   f"{analysis.coverage(durations, interval)[0]:.1%}.")
+
+    click.echo(f"Interval to sample {target:.0%} of the tasks: {recommended:.5g} s.")
+
+
+def _write(rendered: str, output: str):
+    """ Write a rendered report into a file or stdout. """
+    if output is None:
+        click.echo(rendered)
+    else:
+        with open(output, "w", encoding="utf-8") as fp:
+            fp.write(rendered)
+
+
+if __name__ == '__main__':
+    main()
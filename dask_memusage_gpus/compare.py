@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+""" Streaming comparison of the peaks per task prefix of several runs. """
+
+import json
+import math
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from dask_memusage_gpus import analysis, reader, summary
+
+REGRESSION = "regression"
+IMPROVEMENT = "improvement"
+UNCHANGED = "unchanged"
+NEW = "new"
+REMOVED = "removed"
+
+
+class PeakStats:
+    """
+    Running mean and variance of the peaks of a task prefix.
+
+    Chunks are merged with the parallel form of Welford's algorithm, so
+    the statistics do not lose precision over many chunks.
+
+    Parameters
+    ----------
+    count : int
+        Number of sampled tasks.
+    mean : float
+        Mean peak in MiB.
+    m2 : float
+        Sum of the squared differences to the mean.
+    peak : float
+        Highest peak in MiB.
+    """
+    __slots__ = ("count", "mean", "m2", "peak")
+
+    def __init__(self):
+        """ Constructor of the PeakStats class. """
+        self.count: int = 0
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+        self.peak: float = -1
+
+    def merge(self, count, mean, m2, peak):
+        """ Merge the statistics of another set of tasks. """
+        if count == 0:
+            return
+
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.peak = max(self.peak, peak)
+
+    @property
+    def variance(self) -> float:
+        """ Sample variance of the peaks. """
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+
+class RunStats:
+    """
+    Per prefix peak statistics of a run, aggregated chunk by chunk.
+
+    Parameters
+    ----------
+    label : string
+        Name of the run in the comparison.
+    metadata : dict, optional
+        Run metadata written by the plugin.
+    """
+    def __init__(self, label: str, metadata: Optional[dict] = None):
+        """ Constructor of the RunStats class. """
+        self.label: str = label
+        self.metadata: dict = metadata or {}
+        self.prefixes: dict[str, PeakStats] = {}
+        self.n_records: int = 0
+        self.n_missed: int = 0
+
+    def add(self, chunk):
+        """
+        Aggregate a chunk of records.
+
+        Parameters
+        ----------
+        chunk : DataFrame
+            Records with `task_key` and `max_gpu_memory_mb` columns.
+        """
+        memory = chunk["max_gpu_memory_mb"].to_numpy(dtype=float)
+        sampled = memory != analysis.MISSED
+
+        self.n_records += len(chunk)
+        self.n_missed += int(np.count_nonzero(~sampled))
+
+        prefixes = analysis.task_prefixes(chunk["task_key"][sampled]).array
+        codes = prefixes.codes
+        memory = memory[sampled]
+        n_prefixes = len(prefixes.categories)
+
+        count = np.bincount(codes, minlength=n_prefixes)
+        mean = np.bincount(codes, weights=memory, minlength=n_prefixes) / \
+            np.maximum(count, 1)
+        m2 = np.bincount(codes, weights=(memory - mean[codes]) ** 2, minlength=n_prefixes)
+
+        peak = np.full(n_prefixes, -1.0)
+        np.maximum.at(peak, codes, memory)
+
+        for i, prefix in enumerate(map(str, prefixes.categories)):
+            stats = self.prefixes.get(prefix)
+            if stats is None:
+                stats = self.prefixes[prefix] = PeakStats()
+
+            stats.merge(int(count[i]), float(mean[i]), float(m2[i]), float(peak[i]))
+
+    @classmethod
+    def from_path(cls, path, filetype=None, chunksize=reader.CHUNK_SIZE, label=None):
+        """
+        Aggregate a record file or directory in streaming.
+
+        Parameters
+        ----------
+        path : string
+            Record file or directory with record files.
+        filetype : string, optional
+            One of `defs.FILE_TYPES` (default=None, inferred).
+        chunksize : int, optional
+            Number of records read at once (default=`reader.CHUNK_SIZE`).
+        label : string, optional
+            Name of the run (default=None, the run id of the metadata or
+            the path).
+
+        Returns
+        -------
+        RunStats
+            The statistics of the run.
+        """
+        metadata = reader.read_metadata(path)
+        if label is None:
+            label = metadata["run_id"] if metadata else path
+
+        run = cls(label, metadata)
+
+        for chunk in reader.iter_records(path, filetype=filetype,
+                                         columns=["task_key", "max_gpu_memory_mb"],
+                                         chunksize=chunksize):
+            run.add(chunk)
+
+        return run
+
+
+def _incomplete_beta(a: float, b: float, x: float) -> float:
+    """
+    Regularized incomplete beta function `I_x(a, b)`.
+
+    It is evaluated with the continued fraction of Numerical Recipes, by
+    the modified Lentz's method, so there is no need for scipy.
+    """
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+
+    # The continued fraction converges fast below the mean of the distribution
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _incomplete_beta(b, a, 1.0 - x)
+
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+                     a * math.log(x) + b * math.log1p(-x)) / a
+
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    result = d
+
+    for m in range(1, 300):
+        # Even and odd steps of the continued fraction
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            result *= c * d
+
+        if abs(c * d - 1.0) < 1e-15:
+            break
+
+    return front * result
+
+
+def welch_test(baseline: PeakStats, candidate: PeakStats):
+    """
+    Welch's t-test of the difference between the mean peaks of two runs.
+
+    The p-value is the one of the Student's t distribution with the
+    Welch-Satterthwaite degrees of freedom. The normal approximation gives
+    too small p-values for the few tasks of some prefixes.
+
+    Returns
+    -------
+    tuple
+        The t statistic and the two-sided p-value, NaNs if either side has
+        less than two tasks.
+    """
+    if baseline.count < 2 or candidate.count < 2:
+        return math.nan, math.nan
+
+    diff = candidate.mean - baseline.mean
+    before = baseline.variance / baseline.count
+    after = candidate.variance / candidate.count
+    stderr = math.sqrt(before + after)
+
+    if stderr == 0:
+        return (0.0, 1.0) if diff == 0 else (math.copysign(math.inf, diff), 0.0)
+
+    t = diff / stderr
+    dof = (before + after) ** 2 / (before ** 2 / (baseline.count - 1) +
+                                   after ** 2 / (candidate.count - 1))
+
+    return t, _incomplete_beta(dof / 2, 0.5, dof / (dof + t * t))
+
+
+def compare_runs(runs, alpha=0.01, min_tasks=5, min_change=0.0):
+    """
+    Compare the mean peak of each prefix of the runs to the first run.
+
+    Parameters
+    ----------
+    runs : list
+        `RunStats` of the runs, the first one is the baseline.
+    alpha : float, optional
+        Family-wise significance level, split over all the tests with the
+        Bonferroni correction (default=0.01).
+    min_tasks : int, optional
+        Minimum number of sampled tasks on both sides to test a prefix
+        (default=5).
+    min_change : float, optional
+        Minimum relative change of the mean peak to flag a prefix, to
+        ignore significant but negligible changes (default=0.0).
+
+    Returns
+    -------
+    DataFrame
+        One row per run and prefix with the `baseline_tasks`, `tasks`,
+        `baseline_mean` and `mean` peaks, the `change_mb` and `change_pct`,
+        the `t` statistic, the `p_value` and the `status`, sorted by run and
+        p-value.
+    """
+    baseline, *candidates = runs
+
+    rows = []
+    for run in candidates:
+        for prefix in sorted(set(baseline.prefixes) | set(run.prefixes)):
+            before = baseline.prefixes.get(prefix, PeakStats())
+            after = run.prefixes.get(prefix, PeakStats())
+
+            t, p_value = welch_test(before, after)
+            change = math.nan
+            if before.count and after.count:
+                change = after.mean - before.mean
+
+            rows.append({"run": run.label,
+                         "prefix": prefix,
+                         "baseline_tasks": before.count,
+                         "tasks": after.count,
+                         "baseline_mean": before.mean if before.count else math.nan,
+                         "mean": after.mean if after.count else math.nan,
+                         "baseline_peak": before.peak,
+                         "peak": after.peak,
+                         "change_mb": change,
+                         "change_pct": (100 * change / before.mean if before.mean
+                                        else math.nan),
+                         "t": t,
+                         "p_value": p_value})
+
+    columns = ["run", "prefix", "baseline_tasks", "tasks", "baseline_mean", "mean",
+               "baseline_peak", "peak", "change_mb", "change_pct", "t", "p_value"]
+    df = pd.DataFrame(rows, columns=columns)
+
+    tested = (df["baseline_tasks"] >= min_tasks) & (df["tasks"] >= min_tasks)
+    n_tests = max(int(tested.sum()), 1)
+
+    significant = tested & (df["p_value"] < alpha / n_tests) & \
+        (df["change_pct"].abs() >= 100 * min_change)
+
+    df["status"] = np.select([df["baseline_tasks"] == 0,
+                              df["tasks"] == 0,
+                              significant & (df["change_mb"] > 0),
+                              significant & (df["change_mb"] < 0)],
+                             [NEW, REMOVED, REGRESSION, IMPROVEMENT],
+                             default=UNCHANGED)
+
+    return df.sort_values(["run", "p_value"], kind="stable", na_position="last") \
+        .reset_index(drop=True)
+
+
+def render(runs, comparison, fmt=summary.MARKDOWN) -> str:
+    """
+    Render a comparison.
+
+    Parameters
+    ----------
+    runs : list
+        `RunStats` of the compared runs.
+    comparison : DataFrame
+        Result of `compare_runs()`.
+    fmt : string, optional
+        One of `summary.FORMATS` (default=`summary.MARKDOWN`).
+
+    Returns
+    -------
+    string
+        The rendered comparison.
+    """
+    runs_table = pd.DataFrame([{"run": run.label,
+                                "start": run.metadata.get("start"),
+                                "records": run.n_records,
+                                "missed": run.n_missed,
+                                "prefixes": len(run.prefixes)} for run in runs])
+
+    if fmt == summary.JSON:
+        return json.dumps({"baseline": runs[0].label,
+                           "runs": [{**{str(name): value for name, value in row.items()},
+                                     "metadata": run.metadata} for row, run in
+                                    zip(runs_table.to_dict(orient="records"), runs)],
+                           "prefixes": json.loads(comparison.to_json(orient="records"))},
+                          indent=2)
+
+    changed = comparison[comparison["status"] != UNCHANGED]
+    tables = {"Runs": runs_table, "Changes": changed}
+
+    if fmt == summary.HTML:
+        return summary.html_page("GPU memory usage comparison",
+                                 f"Baseline: {runs[0].label}", tables)
+
+    if fmt != summary.MARKDOWN:
+        raise ValueError(f"Format '{fmt}' is not supported.")
+
+    sections = [f"# GPU memory usage comparison\n\nBaseline: {runs[0].label}\n"]
+    for title, table in tables.items():
+        sections.append(f"## {title}\n\n{summary.markdown_table(table)}\n")
+
+    return "\n".join(sections)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+""" Live GPU memory usage page of the Dask dashboard. """
+
+import logging
+import time
+import zlib
+from collections import OrderedDict, deque
+from functools import partial
+from itertools import islice
+from threading import Lock
+from typing import Optional
+
+from dask.utils import key_split
+
+logger = logging.getLogger(__name__)
+
+# Path of the page on the dashboard
+ROUTE = "/gpu-memory-usage"
+
+# Timeline segments kept by the feed and by each page
+ROLLOVER = 100_000
+
+# Refresh interval of each page in milliseconds
+UPDATE_INTERVAL = 500
+
+# Category20 palette, so worker colors do not depend on Bokeh
+PALETTE = ["#1f77b4", "#aec7e8", "#ff7f0e", "#ffbb78", "#2ca02c",
+           "#98df8a", "#d62728", "#ff9896", "#9467bd", "#c5b0d5",
+           "#8c564b", "#c49c94", "#e377c2", "#f7b6d2", "#7f7f7f",
+           "#c7c7c7", "#bcbd22", "#dbdb8d", "#17becf", "#9edae5"]
+
+SEGMENT_COLUMNS = ["x0", "y0", "x1", "y1", "worker", "color"]
+PREFIX_COLUMNS = ["prefix", "tasks", "missed", "peak"]
+
+
+class MemoryFeed:
+    """
+    Bounded in-memory aggregates of the plugin for the dashboard pages.
+
+    Each sample of a worker is a segment from its previous sample, so the
+    timelines of all the workers fit a single glyph. Segments and prefixes
+    carry increasing sequence numbers, so each page only pulls what changed
+    since its previous refresh.
+
+    Parameters
+    ----------
+    rollover : int, optional
+        Maximum number of segments kept (default=`ROLLOVER`).
+    start : float, optional
+        `time.perf_counter()` value of time zero, to match the `time`
+        column of the records (default=None, now).
+    """
+    def __init__(self, rollover: int = ROLLOVER, start: Optional[float] = None):
+        """ Constructor of the MemoryFeed class. """
+        self.rollover: int = rollover
+        self._start: float = time.perf_counter() if start is None else start
+        self._lock = Lock()
+
+        self._segments: deque = deque(maxlen=rollover)
+        self._n_segments: int = 0
+        self._last_sample: dict[str, tuple] = {}
+
+        # Prefixes ordered from the least to the most recently changed
+        self._prefixes: OrderedDict = OrderedDict()
+        self._version: int = 0
+
+    def add_sample(self, worker: str, memory, when: Optional[float] = None):
+        """
+        Extend the timeline of a worker with a new sample taken at the
+        `time.perf_counter()` value `when` (default=None, now).
+        """
+        now = (time.perf_counter() if when is None else when) - self._start
+
+        with self._lock:
+            last = self._last_sample.get(worker)
+            self._last_sample[worker] = (now, memory)
+
+            if last is not None:
+                color = PALETTE[zlib.crc32(worker.encode()) % len(PALETTE)]
+
+                self._segments.append((*last, now, memory, worker, color))
+                self._n_segments += 1
+
+    def add_task(self, key: str, memory):
+        """ Aggregate the peak of a finished task into its prefix. """
+        prefix = key_split(key)
+
+        with self._lock:
+            self._version += 1
+
+            stats = self._prefixes.get(prefix)
+            if stats is None:
+                stats = self._prefixes[prefix] = [0, 0, -1, 0]
+            else:
+                self._prefixes.move_to_end(prefix)
+
+            stats[0] += 1
+            stats[1] += int(memory < 0)
+            stats[2] = max(stats[2], memory)
+            stats[3] = self._version
+
+    def remove_worker(self, worker: str):
+        """ End the timeline of a worker that left the cluster. """
+        with self._lock:
+            self._last_sample.pop(worker, None)
+
+    def segments_since(self, sequence: int):
+        """
+        Segments added after a sequence number.
+
+        Returns
+        -------
+        tuple
+            The current sequence number and the new segments, oldest
+            first. Segments already dropped by the rollover are skipped.
+        """
+        with self._lock:
+            new = min(self._n_segments - sequence, len(self._segments))
+            segments = list(islice(reversed(self._segments), new))
+
+            return self._n_segments, segments[::-1]
+
+    def prefixes_since(self, version: int):
+        """
+        Prefixes changed after a version.
+
+        Returns
+        -------
+        tuple
+            The current version and the (prefix, tasks, missed, peak) rows
+            changed since `version`, least recently changed first.
+        """
+        with self._lock:
+            changed = []
+            for prefix, stats in reversed(self._prefixes.items()):
+                tasks, missed, peak, changed_at = stats
+                if changed_at <= version:
+                    break
+
+                changed.append((prefix, tasks, missed, peak))
+
+            return self._version, changed[::-1]
+
+
+class MemoryPage:
+    """
+    Bokeh models of the GPU memory page, updated from a `MemoryFeed`.
+
+    Every update streams the new segments with rollover, streams the new
+    prefixes and patches the changed ones, so its cost only depends on
+    what changed since the previous update and the history is never sent
+    again.
+
+    Parameters
+    ----------
+    feed : MemoryFeed
+        Aggregates of the plugin.
+    """
+    def __init__(self, feed: MemoryFeed):
+        """ Constructor of the MemoryPage class. """
+        from bokeh.layouts import column
+        from bokeh.models import ColumnDataSource, HoverTool
+        from bokeh.models.widgets import DataTable, NumberFormatter, TableColumn
+        from bokeh.plotting import figure
+
+        self._feed = feed
+        self._sequence = 0
+        self._version = 0
+        self._rows: dict[str, int] = {}
+
+        self.segments = ColumnDataSource({name: [] for name in SEGMENT_COLUMNS})
+        self.prefixes = ColumnDataSource({name: [] for name in PREFIX_COLUMNS})
+
+        timeline = figure(title="GPU memory per worker",
+                          x_axis_label="Time (s)",
+                          y_axis_label="GPU memory (MiB)",
+                          height=400,
+                          sizing_mode="stretch_width",
+                          tools="pan,wheel_zoom,box_zoom,reset",
+                          output_backend="webgl")
+        timeline.segment("x0", "y0", "x1", "y1", color="color", line_width=2,
+                         source=self.segments)
+        timeline.add_tools(HoverTool(tooltips=[("worker", "@worker"),
+                                               ("GPU memory (MiB)", "@y1")]))
+
+        mib = NumberFormatter(format="0,0.00")
+        table = DataTable(source=self.prefixes,
+                          columns=[TableColumn(field="prefix", title="Task prefix"),
+                                   TableColumn(field="tasks", title="Tasks"),
+                                   TableColumn(field="missed", title="Missed"),
+                                   TableColumn(field="peak", title="Peak (MiB)",
+                                               formatter=mib)],
+                          height=300,
+                          sizing_mode="stretch_width")
+
+        self.root = column(timeline, table, sizing_mode="stretch_width")
+
+    def update(self):
+        """ Send the changes of the feed since the previous update. """
+        self._sequence, segments = self._feed.segments_since(self._sequence)
+
+        if segments:
+            self.segments.stream(dict(zip(SEGMENT_COLUMNS, map(list, zip(*segments)))),
+                                 rollover=self._feed.rollover)
+
+        self._version, changed = self._feed.prefixes_since(self._version)
+
+        new_rows = {name: [] for name in PREFIX_COLUMNS}
+        patches = {name: [] for name in PREFIX_COLUMNS[1:]}
+
+        for prefix, *values in changed:
+            index = self._rows.get(prefix)
+
+            if index is None:
+                self._rows[prefix] = len(self._rows)
+
+                for name, value in zip(PREFIX_COLUMNS, (prefix, *values)):
+                    new_rows[name].append(value)
+            else:
+                for name, value in zip(PREFIX_COLUMNS[1:], values):
+                    patches[name].append((index, value))
+
+        if new_rows["prefix"]:
+            self.prefixes.stream(new_rows)
+
+        if patches["tasks"]:
+            self.prefixes.patch(patches)
+
+
+def gpu_memory_doc(feed, interval, scheduler, extra, doc):
+    """ Bokeh document of the GPU memory page. """
+    page = MemoryPage(feed)
+    page.update()
+
+    doc.add_periodic_callback(page.update, interval)
+    doc.add_root(page.root)
+    doc.title = "Dask: GPU memory usage"
+
+
+def register(scheduler, feed: MemoryFeed, route: str = ROUTE,
+             interval: int = UPDATE_INTERVAL):
+    """
+    Add the GPU memory page to the dashboard of a scheduler.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        Dask Scheduler object, running on the current event loop.
+    feed : MemoryFeed
+        Aggregates shown by the page.
+    route : string, optional
+        Path of the page (default=`ROUTE`).
+    interval : int, optional
+        Refresh interval of the page in milliseconds
+        (default=`UPDATE_INTERVAL`).
+
+    Returns
+    -------
+    string or None
+        The path of the page, or None if the scheduler has no HTTP server
+        or Bokeh is not installed.
+    """
+    application = getattr(scheduler, "http_application", None)
+    if application is None:
+        logger.warning("The scheduler has no HTTP server, the GPU memory page is "
+                       "disabled.")
+        return None
+
+    try:
+        from distributed.dashboard.core import BokehApplication
+        from tornado.ioloop import IOLoop
+    except ImportError:
+        logger.warning("A compatible version of Bokeh is not installed, the GPU memory "
+                       "page is disabled.")
+        return None
+
+    # Serve the page under the same prefix as the Dask dashboard
+    prefix = next((app.prefix for app in application.applications
+                   if hasattr(app, "prefix")), "/")
+
+    bokeh_app = BokehApplication({route: partial(gpu_memory_doc, feed, interval)},
+                                 scheduler, prefix=prefix)
+    application.add_application(bokeh_app)
+    bokeh_app.initialize(IOLoop.current())
+    bokeh_app.start()
+
+    return prefix.rstrip("/") + route
@@ -7,16 +7,49 @@ from dataclasses import dataclass
 # Variable definitions
 DEFAULT_DATA_FILE = "memory_usage_gpus.csv"
 
+# Suffix of the plugin overhead summary written next to the record file
+OVERHEAD_FILE_SUFFIX = ".overhead.json"
+
+# Suffix of the run metadata written next to the record file
+META_FILE_SUFFIX = ".meta.json"
+
+# Suffix of the samples that preceded each erred task, as JSON lines
+FORENSICS_FILE_SUFFIX = ".forensics.jsonl"
+
 CSV = "csv"
 PARQUET = "parquet"
 JSON = "json"
 EXCEL = "excel"
 XML = "xml"
+SQLITE = "sqlite"
+
+FILE_TYPES = [CSV, PARQUET, JSON, EXCEL, XML, SQLITE]
 
-FILE_TYPES = [CSV, PARQUET, JSON, EXCEL, XML]
+# Files kept by SQLite next to a database in WAL mode
+SQLITE_WAL_SUFFIXES = ("-wal", "-shm")
+
+RMM = "rmm"
+CUPY = "cupy"
+
+ALLOCATORS = [RMM, CUPY]
 
 NVIDIA_SMI_QUERY_XML_CMD = "nvidia-smi -q -x"
 
+# Stream operation of the samples sent by workers at task boundaries
+SAMPLE_STREAM_OP = "memusage-gpus-sample"
+TASK_START = "start"
+TASK_END = "end"
+
+# Scheduler handlers of the peak predictions and the chunk size advice
+PREDICT_OP = "memusage_gpus_predict"
+ADVICE_OP = "memusage_gpus_advice"
+
+# Extra columns recorded when the host memory is sampled too
+HOST_MEMORY_COLUMNS = ["min_host_memory_mb", "max_host_memory_mb", "max_pinned_memory_mb"]
+
+# Extra columns recorded with the timestamps, in seconds like the `time` column
+TIMESTAMP_COLUMNS = ["peak_time", "compute_start", "compute_stop"]
+
 
 # Exception definitions
 class CMDException(Exception):
@@ -27,6 +60,14 @@ class FileTypeException(Exception):
     """ File Type Validation Exception. """
 
 
+class SamplerException(Exception):
+    """ Sampler Validation Exception. """
+
+
+class AllocatorException(Exception):
+    """ Allocator Validation Exception. """
+
+
 @dataclass
 class GPUProcess(dict):
     """ Object that represents a Process using GPU. """
@@ -4,21 +4,251 @@
 
 import asyncio
 import logging
-from collections import defaultdict
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from contextlib import suppress
+from functools import partial
 from threading import Lock, Thread
 
 import dask
+import numpy as np
 from distributed.client import Client
+from distributed.protocol import pickle
+from distributed.protocol.serialize import Serialize, Serialized, deserialize
 
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import metrics as mtr
 from dask_memusage_gpus import utils
 
 logger = logging.getLogger(__name__)
 
+# Samples kept per worker for the forensics of erred tasks
+RING_SIZE = 4096
 
-class WorkersThread(Thread):
+# Rings of departed workers kept for the tasks that err after them
+REMOVED_RINGS = 16
+
+# Seconds the late samples of a departed worker are still ignored
+REMOVED_TTL = 60
+
+# Seconds the samples of a finished task wait for its transition
+FINISHED_TTL = 60
+
+# Latest round trips of each worker used to estimate its clock offset
+CLOCK_WINDOW = 16
+
+
+class WorkerMemory:
+    """
+    Partial aggregate of the GPU used memory samples of a single worker.
+
+    Only the running minimum and maximum are kept, so the state of each
+    worker has a constant size no matter how many samples it receives. The
+    host memory of the samples that have one is aggregated the same way,
+    and `max_time` is the time of the first sample of the maximum.
+    """
+    __slots__ = ("mem_min", "mem_max", "count", "host_min", "host_max", "pinned_max",
+                 "max_time")
+
+    def __init__(self):
+        """ Constructor of the WorkerMemory class. """
+        self.clear()
+
+    def add(self, memory, host=None, pinned=None, when=-1):
+        """ Aggregate a new sample. """
+        if self.count == 0:
+            self.mem_min = self.mem_max = memory
+            self.max_time = when
+        else:
+            self.mem_min = min(self.mem_min, memory)
+
+            if memory > self.mem_max:
+                self.mem_max = memory
+                self.max_time = when
+
+        self.count += 1
+
+        if host is not None:
+            self.host_min = host if self.host_min < 0 else min(self.host_min, host)
+            self.host_max = max(self.host_max, host)
+
+        if pinned is not None:
+            self.pinned_max = max(self.pinned_max, pinned)
+
+    def clear(self):
+        """ Drop all the aggregated samples. """
+        self.mem_min = -1
+        self.mem_max = -1
+        self.count = 0
+        self.host_min = -1
+        self.host_max = -1
+        self.pinned_max = -1
+        self.max_time = -1
+
+
+class ClockOffset:
     """
-    Worker stanza to fetch GPU used memory
+    Offset of the `time.perf_counter()` clock of a worker to the one of the
+    scheduler.
+
+    Every poll is a round trip: the worker took its sample between the
+    request and the response, so, as in NTP, the offset is the middle of
+    the round trip minus the time of the sample, within half of the network
+    delay. The round trip with the lowest delay among the latest `window`
+    ones is used, which keeps up with the drift of the clocks. Samples the
+    workers send on their own only bound the offset from above by their
+    transit time, so the lowest bound is used until there is a round trip.
+
+    Parameters
+    ----------
+    window : int, optional
+        Number of round trips and one-way samples kept
+        (default=`CLOCK_WINDOW`).
+    """
+    __slots__ = ("round_trips", "one_way", "clock", "scheduler_delay")
+
+    def __init__(self, window: int = CLOCK_WINDOW):
+        """ Constructor of the ClockOffset class. """
+        self.round_trips: deque = deque(maxlen=window)
+        self.one_way: deque = deque(maxlen=window)
+        self.clock = None
+        self.scheduler_delay: float = 0.0
+
+    def add_round_trip(self, sent, received, remote, elapsed=0.0):
+        """
+        Add a sample taken by the worker during a request.
+
+        Parameters
+        ----------
+        sent : float
+            Scheduler time when the request was sent.
+        received : float
+            Scheduler time when the response was received.
+        remote : float
+            Worker time of the sample.
+        elapsed : float, optional
+            Time the worker took to sample, which is not network delay.
+        """
+        delay = max(received - sent - elapsed, 0.0)
+
+        self.round_trips.append((delay, (sent + received) / 2 - remote))
+
+    def add_one_way(self, received, remote):
+        """ Add a sample sent by the worker, received at `received`. """
+        self.one_way.append(received - remote)
+
+    def add_clock(self, sample):
+        """ Keep the wall clock of the worker reported with a sample. """
+        self.clock = sample.get("clock", self.clock)
+        self.scheduler_delay = sample.get("scheduler_delay", self.scheduler_delay)
+
+    @property
+    def offset(self):
+        """ Offset to add to the worker times, None if there is no sample. """
+        if self.round_trips:
+            return min(self.round_trips)[1]
+
+        if self.one_way:
+            return min(self.one_way)
+
+        return None
+
+    @property
+    def error(self):
+        """ Bound of the error of the offset, None without round trips. """
+        if not self.round_trips:
+            return None
+
+        return min(self.round_trips)[0] / 2
+
+    def to_scheduler(self, when):
+        """ Worker time `when` in the scheduler clock, None if unknown. """
+        offset = self.offset
+
+        return None if offset is None else when + offset
+
+    def wall_shift(self):
+        """
+        Shift from the wall times of the Dask task timings to the scheduler
+        clock, or None if unknown.
+
+        Dask reports the `startstops` of a task in the wall clock of the
+        worker plus its `scheduler_delay`, which are both removed here.
+        """
+        offset = self.offset
+        if offset is None or self.clock is None:
+            return None
+
+        return offset - self.clock - self.scheduler_delay
+
+
+class SampleRing:
+    """
+    Fixed-size ring of the latest samples of a worker.
+
+    The arrays are preallocated, so adding a sample only stores scalars.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of samples kept (default=`RING_SIZE`).
+    n_values : int, optional
+        Number of values of each sample (default=1).
+    """
+    __slots__ = ("times", "columns", "count")
+
+    def __init__(self, size: int = RING_SIZE, n_values: int = 1):
+        """ Constructor of the SampleRing class. """
+        self.times = np.zeros(size)
+        self.columns = [np.full(size, -1.0) for _ in range(n_values)]
+        self.count: int = 0
+
+    def add(self, when, *values):
+        """ Store a sample, overwriting the oldest one when full. """
+        index = self.count % len(self.times)
+
+        self.times[index] = when
+        for column, value in zip(self.columns, values):
+            column[index] = -1 if value is None else value
+
+        self.count += 1
+
+    def window(self, since):
+        """
+        Copy of the samples taken at or after `since`, oldest first.
+
+        Returns
+        -------
+        tuple
+            The times and the list of the value columns.
+        """
+        size = len(self.times)
+        order = np.arange(self.count - min(self.count, size), self.count) % size
+
+        times = self.times[order]
+        keep = times >= since
+
+        return times[keep], [column[order][keep] for column in self.columns]
+
+
+def _unwrap(result):
+    """ Result of a broadcast, which the scheduler does not deserialize. """
+    if isinstance(result, Serialize):
+        # In-process comms pass the object as it was sent
+        return result.data
+
+    if isinstance(result, Serialized):
+        return deserialize(result.header, result.frames)
+
+    return result
+
+
+class WorkersMonitor:
+    """
+    Aggregate the GPU used memory samples of the workers per task.
+
+    Subclasses only drive the periodic polling of the workers.
 
     Parameters
     ----------
@@ -29,17 +259,72 @@ class WorkersThread(Thread):
         daemon.
     mem_max : bool
         Collect only maximum memory usage.
+    scheduler : Scheduler, optional
+        Dask Scheduler object used to find out which workers are busy. It is
+        only required when `idle_interval` is set.
+    sampler : callable, optional
+        Function executed on each worker to fetch its GPU used memory
+        (default=`utils.get_worker_gpu_memory_used`).
+    idle_interval : float, optional
+        If set, only workers with tasks in processing are polled at every
+        `interval` and idle workers are polled once every `idle_interval`
+        seconds as a heartbeat (default=None, poll every worker).
+    metrics : Metrics, optional
+        Instrumentation of the polling loop and of the samplers.
+    event_sampling : bool, optional
+        Workers send samples when their tasks start and finish, so only the
+        workers running a task for longer than `interval` are polled
+        (default=False).
+    host_memory : bool, optional
+        Sample the host memory of the workers in the same call and return
+        its aggregates after the GPU ones (default=False).
+    on_sample : callable, optional
+        Called with the worker address, the GPU used memory and the time of
+        every sample, like `MemoryFeed.add_sample` (default=None).
+    ring_size : int, optional
+        Keep the latest `ring_size` samples of each worker for
+        `recent_samples()` (default=None, do not keep them).
+    timestamps : bool, optional
+        Return the time of the peak sample, in the scheduler
+        `time.perf_counter()` clock or -1, after the other aggregates
+        (default=False).
+
+    Samples are timed by the workers and converted to the scheduler clock
+    with the `ClockOffset` of each worker, estimated from the polls and the
+    samples themselves. Until a worker has an offset, its samples are timed
+    when the scheduler receives them.
     """
-    def __init__(self, scheduler_address: str, interval: int, mem_max: bool):
-        """ Constructor of the WorkersThread class. """
-        super().__init__()
-
+    def __init__(self, scheduler_address: str, interval: int, mem_max: bool,
+                 scheduler=None, sampler=None, idle_interval=None, metrics=None,
+                 event_sampling=False, host_memory=False, on_sample=None,
+                 ring_size=None, timestamps=False):
+        """ Constructor of the WorkersMonitor class. """
         self._scheduler_address: str = scheduler_address
         self._interval: int = interval
         self._mem_max: bool = mem_max
-        self._worker_memory: dict[str, list] = defaultdict()
+        self._scheduler = scheduler
+        self._sampler = sampler or utils.get_worker_gpu_memory_used
+        self._idle_interval = idle_interval
+        self._metrics = metrics or mtr.Metrics()
+        self._event_sampling: bool = event_sampling
+        self._host_memory: bool = host_memory
+        self._on_sample = on_sample
+        self._ring_size = ring_size
+        self._timestamps: bool = timestamps
+        self._clocks: dict[str, ClockOffset] = {}
+        self._rings: dict[str, SampleRing] = {}
+        self._removed_rings: OrderedDict = OrderedDict()
+        self._executing: dict[str, dict] = {}
+        self._finished: dict[str, dict] = {}
+        self._worker_memory: dict[str, WorkerMemory] = {}
+        self._removed_workers: OrderedDict = OrderedDict()
+        self._last_polled: dict[str, float] = {}
         self._mutex = Lock()
 
+        # Function run on the polled workers
+        self._poll_function = partial(utils.timed_sample, self._sampler,
+                                      host_memory=self._host_memory)
+
         try:
             logger.setLevel(
                     dask.config.get("distributed.logging.distributed__scheduler")
@@ -47,9 +332,429 @@ class WorkersThread(Thread):
         except KeyError:
             logger.setLevel(logging.INFO)
 
+        self._poll_task = None
+
+    def add_worker(self, worker_address):
+        """
+        Allocate the memory state of a worker that joined the cluster.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the new worker.
+        """
+        with self._mutex:
+            self._removed_workers.pop(worker_address, None)
+            self._worker_memory.setdefault(worker_address, WorkerMemory())
+
+    def remove_worker(self, worker_address):
+        """
+        Release the memory state of a worker that left the cluster.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the departing worker.
+
+        Returns
+        -------
+        tuple or None
+            The pending (min, max) GPU used memory that was not assigned to
+            any task yet, or None if there is nothing to flush. The host
+            memory aggregates follow when `host_memory` is set.
+        """
+        with self._mutex:
+            # Ignore the in-flight and late samples of this worker for a while
+            self._removed_workers.pop(worker_address, None)
+            self._removed_workers[worker_address] = time.monotonic() + REMOVED_TTL
+            self._last_polled.pop(worker_address, None)
+            self._executing.pop(worker_address, None)
+            self._finished.pop(worker_address, None)
+            self._clocks.pop(worker_address, None)
+
+            worker_memory = self._worker_memory.pop(worker_address, None)
+
+            ring = self._rings.pop(worker_address, None)
+            if ring is not None:
+                self._removed_rings[worker_address] = ring
+
+                if len(self._removed_rings) > REMOVED_RINGS:
+                    self._removed_rings.popitem(last=False)
+
+        self._metrics.discard(f"sampler[{worker_address}]")
+
+        if worker_memory is None or worker_memory.count == 0 or self._mem_max:
+            return None
+
+        return self._aggregates(worker_memory)
+
+    def _aggregates(self, memory):
+        """ Tuple of the aggregates of a worker or task to be recorded. """
+        aggregates = (memory.mem_min, memory.mem_max)
+
+        if self._host_memory:
+            aggregates += (memory.host_min, memory.host_max, memory.pinned_max)
+
+        if self._timestamps:
+            aggregates += (memory.max_time,)
+
+        return aggregates
+
+    def _fill(self, value):
+        """ Tuple of aggregates that are all `value`, with an unknown time. """
+        return (value,) * (5 if self._host_memory else 2) + \
+            ((-1,) if self._timestamps else ())
+
+    def _sample_time(self, worker_address, sample, received, sent=None):
+        """
+        Time of a sample in the scheduler clock. The mutex must be held.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the worker.
+        sample : dict
+            Sample returned by `utils.timed_sample`.
+        received : float
+            Scheduler time when the sample was received.
+        sent : float, optional
+            Scheduler time when the sample was requested, None if the worker
+            sent it on its own.
+        """
+        remote = sample.get("time")
+        if remote is None:
+            return received
+
+        clock = self._clocks.get(worker_address)
+        if clock is None:
+            clock = self._clocks[worker_address] = ClockOffset()
+
+        if sent is None:
+            clock.add_one_way(received, remote)
+        else:
+            clock.add_round_trip(sent, received, remote, sample["elapsed"])
+
+        clock.add_clock(sample)
+
+        return clock.to_scheduler(remote)
+
+    def _is_removed(self, worker_address) -> bool:
+        """
+        Whether a worker left the cluster recently. The mutex must be held.
+
+        The workers are kept in the order they left, so the ones whose
+        `REMOVED_TTL` expired are dropped from the front.
+        """
+        now = time.monotonic()
+        while self._removed_workers and \
+                next(iter(self._removed_workers.values())) <= now:
+            self._removed_workers.popitem(last=False)
+
+        return worker_address in self._removed_workers
+
+    def _add_sample(self, worker_address, sample, received=None, sent=None):
+        """
+        Aggregate a sample of a worker. The mutex must be held.
+
+        `received` and `sent` are the scheduler times of the response and
+        of the request of the sample, see `_sample_time()`.
+        """
+        if self._is_removed(worker_address):
+            return
+
+        if received is None:
+            received = time.perf_counter()
+
+        when = received
+        host = pinned = None
+
+        if isinstance(sample, dict):
+            self._metrics.record("sampler", sample["elapsed"])
+            self._metrics.record(f"sampler[{worker_address}]", sample["elapsed"])
+
+            when = self._sample_time(worker_address, sample, received, sent)
+            host = sample.get("host_memory")
+            pinned = sample.get("pinned_memory")
+            sample = sample["memory"]
+
+        if worker_address not in self._worker_memory:
+            self._worker_memory[worker_address] = WorkerMemory()
+
+        self._worker_memory[worker_address].add(sample, host, pinned, when)
+
+        if self._ring_size is not None:
+            ring = self._rings.get(worker_address)
+            if ring is None:
+                ring = self._rings[worker_address] = \
+                    SampleRing(self._ring_size, 3 if self._host_memory else 1)
+
+            ring.add(when, sample, host, pinned)
+
+        if self._on_sample is not None:
+            self._on_sample(worker_address, sample, when)
+
+        # Samples also belong to the tasks executing on the worker
+        for _, task_memory in self._executing.get(worker_address, {}).values():
+            task_memory.add(sample, host, pinned, when)
+
+        logger.debug(f"Appending {sample} MiB into worker ID "
+                     f"'{worker_address}'")
+
+    def recent_samples(self, worker_address, seconds):
+        """
+        Samples of a worker from the last seconds.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the worker, which may have left the cluster recently.
+        seconds : float
+            Length of the window.
+
+        Returns
+        -------
+        dict or None
+            Arrays with the `time` of each sample, in the scheduler
+            `time.perf_counter()` clock, its `gpu_memory_mb` and, when
+            `host_memory` is set, its `host_memory_mb` and
+            `pinned_memory_mb`. None if there is no ring for the worker.
+        """
+        with self._mutex:
+            ring = self._rings.get(worker_address,
+                                   self._removed_rings.get(worker_address))
+            if ring is None:
+                return None
+
+            times, columns = ring.window(time.perf_counter() - seconds)
+
+        names = ["gpu_memory_mb", "host_memory_mb", "pinned_memory_mb"]
+
+        return {"time": times, **dict(zip(names, columns))}
+
+    def add_task_sample(self, worker_address, key, event, sample):
+        """
+        Aggregate a sample taken by a worker when a task starts or finishes.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the worker.
+        key : string
+            Identifier of the task.
+        event : string
+            Either `defs.TASK_START` or `defs.TASK_END`.
+        sample : dict
+            Sample returned by `utils.timed_sample`.
+        """
+        with self._mutex:
+            if self._is_removed(worker_address):
+                return
+
+            executing = self._executing.setdefault(worker_address, {})
+
+            if event == defs.TASK_START:
+                executing[key] = (time.monotonic(), WorkerMemory())
+
+            self._add_sample(worker_address, sample)
+
+            if event == defs.TASK_END and key in executing:
+                _, task_memory = executing.pop(key)
+
+                self._finished.setdefault(worker_address, {})[key] = \
+                    (time.monotonic(), task_memory)
+
+    def wall_shift(self, worker_address) -> float:
+        """
+        Shift from the wall times of the Dask task timings of a worker, like
+        the `startstops` of a finished task, to the scheduler
+        `time.perf_counter()` clock.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the worker.
+
+        Returns
+        -------
+        float
+            The shift estimated from the samples of the worker or, if there
+            is none yet, from the clocks of the scheduler, as Dask already
+            aligns the task timings to it roughly.
+        """
+        with self._mutex:
+            clock = self._clocks.get(worker_address)
+            shift = None if clock is None else clock.wall_shift()
+
+        if shift is None:
+            shift = time.perf_counter() - time.time()
+
+        return shift
+
+    def fetch_task_used_memory(self, worker_address, key=None):
+        """
+        The GPU used memory of the finished previous task.
+
+        Parameters
+        ----------
+        worker_address : string
+            Address of the worker that executed the task.
+        key : string, optional
+            Identifier of the task. If the worker sent samples when the task
+            started and finished, only those and the periodic samples taken
+            while it was executing are used.
+
+        Returns
+        -------
+        tuple
+            Tracked (min, max) memory usage of the worker. It is (-1, -1)
+            when there is no sample since the previous task and (0, 0) for
+            an unknown worker. When `host_memory` is set, the (min, max)
+            host memory and the max pinned memory follow.
+        """
+        wait_start = time.perf_counter()
+
+        with self._mutex:
+            self._metrics.record("fetch_lock_wait", time.perf_counter() - wait_start)
+
+            worker_memory = self._worker_memory.get(worker_address)
+
+            finished = self._finished.get(worker_address)
+            if finished:
+                _, task_memory = finished.pop(key, (None, None))
+
+                # Other threads of the worker may have finished tasks that did
+                # not transition yet, so only the ones that never will expire
+                now = time.monotonic()
+                for stale in [other for other, (end, _) in finished.items()
+                              if now - end > FINISHED_TTL]:
+                    del finished[stale]
+
+                if task_memory is not None and not self._mem_max:
+                    worker_memory.clear()
+
+                    return self._aggregates(task_memory)
+
+            if worker_memory is None:
+                logger.error(f"Worker '{worker_address}' is unknown.")
+
+                return self._fill(0)
+
+            if worker_memory.count == 0:
+                logger.debug(f"There is no GPU memory sample of worker "
+                             f"'{worker_address}' since the previous task.")
+
+                return self._fill(-1)
+
+            ret = self._aggregates(worker_memory)
+
+            if not self._mem_max:
+                logger.debug("Cleaning the worker memory list.")
+
+                worker_memory.clear()
+
+        return ret
+
+    def _busy_snapshot(self) -> dict:
+        """
+        Whether each worker of the scheduler has tasks in processing.
+
+        It reads the scheduler state, so it must run on its event loop.
+        """
+        return {address: bool(ws.processing)
+                for address, ws in self._scheduler.workers.items()}
+
+    async def _busy_workers(self) -> dict:
+        """ Snapshot of `_busy_snapshot()` for the polling loop. """
+        return self._busy_snapshot()
+
+    async def _select_workers(self):
+        """
+        Select the workers that need to be polled in this iteration.
+
+        Returns
+        -------
+        list or None
+            Addresses of the busy workers plus the idle workers whose
+            heartbeat is due, or None to poll every worker.
+        """
+        now = time.monotonic()
+
+        if self._event_sampling:
+            # Short tasks are already covered by their start and end samples
+            with self._mutex:
+                return [address for address, executing in self._executing.items()
+                        if any(now - start >= self._interval
+                               for start, _ in executing.values())]
+
+        if self._idle_interval is None or self._scheduler is None:
+            return None
+
+        workers = []
+        for address, busy in (await self._busy_workers()).items():
+            last_polled = self._last_polled.get(address)
+
+            if busy or last_polled is None or \
+                    now - last_polled >= self._idle_interval:
+                workers.append(address)
+                self._last_polled[address] = now
+
+        return workers
+
+    async def _poll_loop(self, run):
+        """
+        Poll the workers periodically.
+
+        Parameters
+        ----------
+        run : coroutine function
+            Run `_poll_function` on a list of workers, or on every worker
+            if it is None, and return the samples by worker address. A
+            sample may carry the (received, sent) `round_trip` times of its
+            own worker, otherwise the round trip of the whole call is used.
+        """
+        logger.debug("Main memory loop function running.")
+
+        while True:
+            workers = await self._select_workers()
+
+            if workers is not None and len(workers) == 0:
+                logger.debug("There is no busy worker to poll.")
+
+                await asyncio.sleep(self._interval)
+                continue
+
+            sent = time.perf_counter()
+
+            with self._metrics.timer("poll_round_trip"):
+                worker_gpu_mem = await run(workers)
+
+            received = time.perf_counter()
+
+            with self._mutex:
+                for address, sample in worker_gpu_mem.items():
+                    if isinstance(sample, dict) and "round_trip" in sample:
+                        # Round trip of this worker alone
+                        self._add_sample(address, sample, *sample.pop("round_trip"))
+                    else:
+                        self._add_sample(address, sample, received, sent)
+
+            await asyncio.sleep(self._interval)
+
+
+class WorkersThread(WorkersMonitor, Thread):
+    """
+    Poll the workers from a thread with its own event loop and Client.
+
+    It works from any process that reaches the scheduler. The parameters
+    are the ones of `WorkersMonitor`.
+    """
+    def __init__(self, *args, **kwargs):
+        """ Constructor of the WorkersThread class. """
+        Thread.__init__(self)
+        WorkersMonitor.__init__(self, *args, **kwargs)
+
         # create other internal variables
         self._loop = None
-        self._poll_task = None
 
     def run(self):
         """ Main thread loop. """
@@ -87,62 +792,117 @@ class WorkersThread(Thread):
 
         logger.info("Memory loop thread is cancelled.")
 
-    def fetch_task_used_memory(self, worker_address):
+    async def _busy_workers(self) -> dict:
         """
-        The GPU used memory of the finished previous task.
-
-        Returns
-        -------
-        list
-            Tracked memory usage per worker
+        Snapshot of `_busy_snapshot()` taken on the scheduler event loop, as
+        the scheduler changes its workers and their tasks meanwhile.
         """
-        with self._mutex:
-            ret = (0, 0)
+        future: Future = Future()
 
+        def snapshot():
+            """ Take the snapshot on the scheduler loop. """
             try:
-                mem_min = min(self._worker_memory[worker_address])
-                mem_max = max(self._worker_memory[worker_address])
+                future.set_result(self._busy_snapshot())
+            except Exception as e:
+                future.set_exception(e)
 
-                logger.debug("Cleaning the worker memory list.")
+        self._scheduler.loop.add_callback(snapshot)
+
+        return await asyncio.wrap_future(future)
+
+    async def _memory_loop(self):
+        """ Background function to monitor GPU used memory per process. """
 
-                self._worker_memory[worker_address].clear()
+        client = Client(self._scheduler_address, timeout=30)
 
-                if self._mem_max:
-                    # Lets make sure the array is not fully empty
-                    self._worker_memory[worker_address].append(mem_min)
-                    self._worker_memory[worker_address].append(mem_max)
+        async def run(workers):
+            """ Run the sampler through the client. """
+            return client.run(self._poll_function, workers=workers)
 
-                ret = (mem_min, mem_max)
-            except ValueError as ve:
-                logger.error(str(ve))
+        try:
+            await self._poll_loop(run)
+        finally:
+            client.close()
 
-                ret = (-1, -1)
-            except Exception as e:
-                logger.error(str(e))
 
-        return ret
+class WorkersLoop(WorkersMonitor):
+    """
+    Poll the workers from the event loop of the scheduler it runs in.
 
-    async def _memory_loop(self):
-        """ Background function to monitor GPU used memory per process. """
+    The sampler is sent with the broadcast RPC of the scheduler, the same
+    message `Client.run` sends, so there is no loopback client connection,
+    no extra thread and the sampler is pickled only once. The parameters
+    are the ones of `WorkersMonitor`, and `scheduler` is required.
+    """
+    def __init__(self, *args, **kwargs):
+        """ Constructor of the WorkersLoop class. """
+        super().__init__(*args, **kwargs)
 
-        client = Client(self._scheduler_address, timeout=30)
+        if self._scheduler is None:
+            raise ValueError("The in-process mode requires the scheduler object.")
 
-        logger.debug("Main memory loop function running.")
+        self._message = {"op": "run",
+                         "function": pickle.dumps(self._poll_function),
+                         "wait": True}
 
-        while True:
-            worker_gpu_mem = client.run(utils.get_worker_gpu_memory_used)
+    def start(self):
+        """ Start polling on the scheduler event loop. """
+        self._scheduler.loop.add_callback(self._start)
 
-            with open("test", "w", encoding="utf-8") as fp:
-                fp.write(str(worker_gpu_mem))
+    def _start(self):
+        """ Create the polling task. It must run on the scheduler loop. """
+        if not self.is_alive():
+            self._poll_task = asyncio.ensure_future(self._poll_loop(self._broadcast))
 
-            with self._mutex:
-                for address, memory in worker_gpu_mem.items():
-                    if address not in self._worker_memory:
-                        self._worker_memory[address] = []
+            logger.info("Memory loop is running on the scheduler event loop.")
 
-                    self._worker_memory[address].append(memory)
+    def is_alive(self) -> bool:
+        """ Whether the polling task is running. """
+        return self._poll_task is not None and not self._poll_task.done()
 
-                    logger.debug(f"Appending {memory} MiB into worker ID "
-                                 f"'{address}'")
+    def stop(self):
+        """ Stop polling. """
+        self._scheduler.loop.add_callback(self.cancel)
 
-            await asyncio.sleep(self._interval)
+    def cancel(self):
+        """ Cancel the polling task. """
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+        logger.info("Memory loop is stopped.")
+
+    async def _send(self, address):
+        """ Run the sampler on a worker, timing its own round trip. """
+        sent = time.perf_counter()
+
+        responses = await self._scheduler.broadcast(msg=self._message, workers=[address],
+                                                    on_error="ignore")
+
+        return responses.get(address), (time.perf_counter(), sent)
+
+    async def _broadcast(self, workers):
+        """ Run the sampler on the workers through the scheduler RPC. """
+        if workers is None:
+            workers = list(self._scheduler.workers)
+
+        # One request per worker, as the broadcast does, but each one timed
+        responses = await asyncio.gather(*map(self._send, workers))
+
+        samples = {}
+        for address, (response, round_trip) in zip(workers, responses):
+            if response is None:
+                continue
+
+            if isinstance(response, dict) and response.get("status") == "OK":
+                sample = _unwrap(response["result"])
+
+                if isinstance(sample, dict):
+                    sample["round_trip"] = round_trip
+
+                samples[address] = sample
+            else:
+                logger.warning(f"Sampler failed on worker '{address}': "
+                               f"{response.get('exception', response)}")
+
+        return samples
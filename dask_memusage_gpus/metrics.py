@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+""" In-memory instrumentation of the plugin hot paths. """
+
+import math
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+
+class Histogram:
+    """
+    Histogram with logarithmic buckets.
+
+    Each bucket `i` holds the values in the range [2^(i - 1), 2^i) of
+    `unit`, so the memory footprint is constant and a quantile is off by at
+    most a factor of two.
+
+    Parameters
+    ----------
+    unit : float
+        Resolution of the first bucket (default=1e-6, one microsecond).
+    """
+    N_BUCKETS = 48
+
+    def __init__(self, unit: float = 1e-6):
+        """ Constructor of the Histogram class. """
+        self._unit: float = unit
+        self.buckets: list[int] = [0] * self.N_BUCKETS
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+
+    def record(self, value: float):
+        """ Add a new value to the histogram. """
+        index = 0
+        if value >= self._unit:
+            index = min(int(value / self._unit).bit_length(), self.N_BUCKETS - 1)
+
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximated quantile of the recorded values.
+
+        Parameters
+        ----------
+        q : float
+            Quantile between 0 and 1.
+
+        Returns
+        -------
+        float
+            Upper bound of the bucket that holds the quantile, clipped to the
+            range of the recorded values.
+        """
+        if self.count == 0:
+            return math.nan
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(max(self._unit * (1 << i), self.min), self.max)
+
+        return self.max
+
+    def to_dict(self) -> dict:
+        """ Summary of the histogram. """
+        if self.count == 0:
+            return {"count": 0}
+
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count,
+                "min": self.min,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "max": self.max}
+
+
+class Metrics:
+    """ Thread-safe collection of named duration histograms. """
+    def __init__(self):
+        """ Constructor of the Metrics class. """
+        self._histograms: dict[str, Histogram] = {}
+        self._lock = Lock()
+
+    def record(self, name: str, value: float):
+        """
+        Record a duration in seconds.
+
+        Parameters
+        ----------
+        name : string
+            Name of the instrumented path.
+        value : float
+            Duration in seconds.
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+
+            histogram.record(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """ Context manager that records the duration of its block. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def discard(self, name: str):
+        """ Forget the histogram of a path, if any. """
+        with self._lock:
+            self._histograms.pop(name, None)
+
+    def summary(self) -> dict:
+        """
+        Summary of all instrumented paths.
+
+        Returns
+        -------
+        dict
+            Count, total, mean, min, quantiles and max in seconds per path.
+        """
+        with self._lock:
+            return {name: histogram.to_dict()
+                    for name, histogram in sorted(self._histograms.items())}
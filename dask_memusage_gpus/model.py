@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+""" Online model of the GPU memory peak of each task prefix. """
+
+import math
+from typing import Optional
+
+import numpy as np
+from dask.utils import key_split
+
+MIB = 2 ** 20
+
+# One-sided 99% quantile of the normal distribution, the margin of the
+# predicted peaks over the fitted line
+CONFIDENCE_Z = 2.326
+
+# Minimum number of sampled tasks of a prefix to advise a chunk size
+MIN_TASKS = 5
+
+
+class PrefixModel:
+    """
+    Least squares line of the peak GPU memory over the input bytes of the
+    tasks of a prefix.
+
+    Only the means and the co-moments are kept and updated with Welford's
+    algorithm, so the model has a constant size and does not lose
+    precision over many tasks or chunks.
+
+    Parameters
+    ----------
+    count : int
+        Number of sampled tasks.
+    mean_x : float
+        Mean input bytes.
+    mean_y : float
+        Mean peak in MiB.
+    m2_x : float
+        Sum of the squared differences of the input bytes to their mean.
+    m2_y : float
+        Sum of the squared differences of the peaks to their mean.
+    c_xy : float
+        Sum of the products of the differences to the means.
+    peak : float
+        Highest peak in MiB.
+    """
+    __slots__ = ("count", "mean_x", "mean_y", "m2_x", "m2_y", "c_xy", "peak")
+
+    def __init__(self):
+        """ Constructor of the PrefixModel class. """
+        self.count: int = 0
+        self.mean_x: float = 0.0
+        self.mean_y: float = 0.0
+        self.m2_x: float = 0.0
+        self.m2_y: float = 0.0
+        self.c_xy: float = 0.0
+        self.peak: float = -1
+
+    def add(self, nbytes, peak):
+        """ Add a single task. """
+        self.merge(1, nbytes, peak, 0.0, 0.0, 0.0, peak)
+
+    def merge(self, count, mean_x, mean_y, m2_x, m2_y, c_xy, peak):
+        """ Merge the moments of another set of tasks. """
+        if count == 0:
+            return
+
+        total = self.count + count
+        dx = mean_x - self.mean_x
+        dy = mean_y - self.mean_y
+        weight = self.count * count / total
+
+        self.m2_x += m2_x + dx * dx * weight
+        self.m2_y += m2_y + dy * dy * weight
+        self.c_xy += c_xy + dx * dy * weight
+        self.mean_x += dx * count / total
+        self.mean_y += dy * count / total
+        self.count = total
+        self.peak = max(self.peak, peak)
+
+    @property
+    def slope(self) -> float:
+        """ MiB of peak per input byte, 0 if all the inputs had the same size. """
+        return self.c_xy / self.m2_x if self.m2_x > 0 else 0.0
+
+    @property
+    def intercept(self) -> float:
+        """ Peak in MiB of a task without inputs. """
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def residual_std(self) -> float:
+        """ Standard deviation of the peaks around the line. """
+        if self.count < 3:
+            return math.nan
+
+        return math.sqrt(max(self.m2_y - self.slope * self.c_xy, 0.0) / (self.count - 2))
+
+    def predict(self, nbytes) -> float:
+        """ Expected peak in MiB of a task with `nbytes` input bytes. """
+        return self.intercept + self.slope * nbytes
+
+    def upper(self, nbytes, z: float = CONFIDENCE_Z) -> float:
+        """
+        Upper bound of the prediction interval of the peak in MiB.
+
+        The interval widens with the distance of `nbytes` to the mean input
+        of the fitted tasks, so extrapolations are more conservative.
+        """
+        leverage = 1 + 1 / self.count
+        if self.m2_x > 0:
+            leverage += (nbytes - self.mean_x) ** 2 / self.m2_x
+
+        return self.predict(nbytes) + z * self.residual_std * math.sqrt(leverage)
+
+    def max_nbytes(self, memory_mb, z: float = CONFIDENCE_Z) -> float:
+        """
+        Largest input of a task whose peak stays below `memory_mb`.
+
+        Returns
+        -------
+        float
+            The input bytes, `math.inf` if the peak does not grow with the
+            input, 0 if even tasks without inputs do not fit, or NaN if
+            there are not enough tasks to estimate the spread.
+        """
+        if self.count < 3:
+            return math.nan
+
+        if self.upper(0, z) > memory_mb:
+            return 0.0
+
+        if self.slope <= 0:
+            return math.inf
+
+        # The bound is convex in the input bytes, so it is bisected between
+        # zero and the first power of two that does not fit
+        low, high = 0.0, max(self.mean_x, MIB)
+        while self.upper(high, z) <= memory_mb:
+            low, high = high, high * 2
+
+        for _ in range(64):
+            middle = (low + high) / 2
+            if self.upper(middle, z) <= memory_mb:
+                low = middle
+            else:
+                high = middle
+
+        return math.floor(low)
+
+
+class MemoryModel:
+    """
+    Peak GPU memory models of all the task prefixes.
+
+    Parameters
+    ----------
+    z : float, optional
+        Number of standard deviations of the residuals added to the
+        predicted peaks (default=`CONFIDENCE_Z`).
+    """
+    def __init__(self, z: float = CONFIDENCE_Z):
+        """ Constructor of the MemoryModel class. """
+        self.z: float = z
+        self.prefixes: dict[str, PrefixModel] = {}
+
+    def _prefix(self, prefix) -> PrefixModel:
+        """ Model of a prefix, created if it is new. """
+        model = self.prefixes.get(prefix)
+        if model is None:
+            model = self.prefixes[prefix] = PrefixModel()
+
+        return model
+
+    def add(self, key, nbytes, peak):
+        """
+        Fit a finished task.
+
+        Parameters
+        ----------
+        key : string
+            Key of the task.
+        nbytes : int
+            Total bytes of the inputs of the task.
+        peak : float
+            Peak GPU used memory of the task in MiB, -1 if it was missed.
+        """
+        if peak < 0 or nbytes < 0:
+            return
+
+        self._prefix(key_split(key)).add(nbytes, peak)
+
+    def add_chunk(self, chunk):
+        """
+        Fit a chunk of records.
+
+        Parameters
+        ----------
+        chunk : DataFrame
+            Records with `task_key`, `input_nbytes` and `max_gpu_memory_mb`
+            columns.
+        """
+        from dask_memusage_gpus import analysis
+
+        x = chunk["input_nbytes"].to_numpy(dtype=float)
+        y = chunk["max_gpu_memory_mb"].to_numpy(dtype=float)
+        sampled = (y >= 0) & (x >= 0)
+
+        prefixes = analysis.task_prefixes(chunk["task_key"][sampled]).array
+        codes = prefixes.codes
+        x, y = x[sampled], y[sampled]
+        n_prefixes = len(prefixes.categories)
+
+        count = np.bincount(codes, minlength=n_prefixes)
+        divisor = np.maximum(count, 1)
+        mean_x = np.bincount(codes, weights=x, minlength=n_prefixes) / divisor
+        mean_y = np.bincount(codes, weights=y, minlength=n_prefixes) / divisor
+
+        dx = x - mean_x[codes]
+        dy = y - mean_y[codes]
+        m2_x = np.bincount(codes, weights=dx * dx, minlength=n_prefixes)
+        m2_y = np.bincount(codes, weights=dy * dy, minlength=n_prefixes)
+        c_xy = np.bincount(codes, weights=dx * dy, minlength=n_prefixes)
+
+        peak = np.full(n_prefixes, -1.0)
+        np.maximum.at(peak, codes, y)
+
+        for i, prefix in enumerate(map(str, prefixes.categories)):
+            self._prefix(prefix).merge(int(count[i]), float(mean_x[i]), float(mean_y[i]),
+                                       float(m2_x[i]), float(m2_y[i]), float(c_xy[i]),
+                                       float(peak[i]))
+
+    def predict(self, prefix, nbytes) -> Optional[dict]:
+        """
+        Predicted peak of a task of a prefix.
+
+        Parameters
+        ----------
+        prefix : string
+            Task prefix, like `make_blobs`, or a task key.
+        nbytes : int
+            Total bytes of the inputs of the task.
+
+        Returns
+        -------
+        dict
+            The number of fitted `tasks`, the expected `peak_mb` and its
+            `upper_mb` bound, or None if no task of the prefix was fitted.
+        """
+        model = self.prefixes.get(prefix) or self.prefixes.get(key_split(prefix))
+        if model is None:
+            return None
+
+        return {"tasks": model.count,
+                "peak_mb": model.predict(nbytes),
+                "upper_mb": model.upper(nbytes, self.z)}
+
+    def advice(self, gpu_memory_mb=None, min_tasks: int = MIN_TASKS) -> dict:
+        """
+        Fitted model of each prefix and the largest input that fits a GPU.
+
+        Parameters
+        ----------
+        gpu_memory_mb : float, optional
+            Memory of a GPU in MiB (default=None, no recommendation).
+        min_tasks : int, optional
+            Minimum number of sampled tasks of a prefix to recommend an
+            input size (default=`MIN_TASKS`).
+
+        Returns
+        -------
+        dict
+            Per prefix, the number of `tasks`, the `mean_input_mb`, the
+            `intercept_mb`, the `slope` in MiB of peak per MiB of input, the
+            `residual_mb` and the `max_input_mb` whose upper bound fits
+            `gpu_memory_mb`.
+        """
+        advice = {}
+        for prefix, model in sorted(self.prefixes.items()):
+            max_input = math.nan
+            if gpu_memory_mb is not None and model.count >= min_tasks:
+                max_input = model.max_nbytes(gpu_memory_mb, self.z) / MIB
+
+            advice[prefix] = {"tasks": model.count,
+                              "mean_input_mb": model.mean_x / MIB,
+                              "intercept_mb": model.intercept,
+                              "slope": model.slope * MIB,
+                              "residual_mb": model.residual_std,
+                              "max_input_mb": max_input}
+
+        return advice
+
+    def table(self, gpu_memory_mb=None, min_tasks: int = MIN_TASKS):
+        """ Advice of all the prefixes as a DataFrame indexed by prefix. """
+        import pandas as pd
+
+        df = pd.DataFrame.from_dict(self.advice(gpu_memory_mb, min_tasks), orient="index")
+        df.index.name = "prefix"
+
+        return df
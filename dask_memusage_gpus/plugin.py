@@ -2,16 +2,47 @@
 
 """ Plugin class of the GPU Memory Usage. """
 
+import json
+import logging
 import os
+import socket
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
 from threading import Lock
+from typing import Optional
 
-import pandas as pd
+import dask
+from dask.utils import parse_timedelta
 from distributed.diagnostics.plugin import SchedulerPlugin
+from distributed.protocol import pickle
 from distributed.scheduler import Scheduler
+from tornado.ioloop import PeriodicCallback
 
+from dask_memusage_gpus import dashboard as dash
 from dask_memusage_gpus import definitions as defs
 from dask_memusage_gpus import gpu_handler as gpu
+from dask_memusage_gpus import metrics as mtr
+from dask_memusage_gpus import model as mdl
+from dask_memusage_gpus import worker_plugin as wp
+from dask_memusage_gpus import writers
+
+logger = logging.getLogger(__name__)
+
+
+def _callable_name(func):
+    """ Dotted name of a sampler, with the arguments of partials. """
+    if func is None:
+        return None
+
+    if isinstance(func, partial):
+        arguments = ", ".join(f"{name}={value!r}"
+                              for name, value in func.keywords.items())
+        return f"{_callable_name(func.func)}({arguments})"
+
+    return f"{func.__module__}.{getattr(func, '__qualname__', type(func).__qualname__)}"
 
 
 class MemoryUsageGPUsPlugin(SchedulerPlugin):
@@ -31,9 +62,63 @@ class MemoryUsageGPUsPlugin(SchedulerPlugin):
         daemon.
     mem_max : bool
         Collect maximum memory usage.
+    run_on_client : bool
+        Run plugin only when a client connects.
+    sampler : callable, optional
+        Function executed on each worker to fetch its GPU used memory.
+    idle_interval : float, optional
+        Poll only busy workers at every `interval` and idle workers once
+        every `idle_interval` seconds (default=None, poll every worker).
+    batch_size : int, optional
+        Number of finished tasks accumulated before writing them into the
+        record file. Pending tasks are also written at every scheduler tick
+        (default=1, write every task).
+    event_sampling : bool, optional
+        Install a worker plugin that samples the GPU used memory when each
+        task starts and finishes. Only the tasks running for longer than
+        `interval` are sampled periodically (default=False).
+    allocator : string, optional
+        Track the peak allocated by this allocator (one of
+        `defs.ALLOCATORS`) on the workers for each task. It implies
+        `event_sampling` and disables the periodic polling (default=None).
+    host_memory : bool, optional
+        Sample the host resident set size and pinned memory of the workers
+        in the same call as the GPU used memory and record them as the
+        `defs.HOST_MEMORY_COLUMNS` extra columns (default=False).
+    run_id : string, optional
+        Identifier of the run written into the metadata file next to the
+        record file (default=None, a random one).
+    in_process : bool, optional
+        Poll the workers from the scheduler event loop through its own
+        RPC instead of a thread with a loopback Client. It requires the
+        plugin to run inside the scheduler process (default=False).
+    dashboard : bool, optional
+        Add a live page with the GPU memory of each worker and the peak of
+        each task prefix to the Dask dashboard, at `dash.ROUTE`. It
+        requires Bokeh (default=False).
+    forensics_window : float, optional
+        Keep the latest samples of each worker in a ring and, when a task
+        errs, write the samples of its worker in the last
+        `forensics_window` seconds together with the exception into
+        `<path>.forensics.jsonl`, from a background thread
+        (default=None, disabled).
+    memory_model : bool, optional
+        Record the total bytes of the inputs of each task in the
+        `input_nbytes` column and fit a model of the peak of each task
+        prefix over them, which the scheduler serves through the
+        `defs.PREDICT_OP` and `defs.ADVICE_OP` handlers (default=False).
+    timestamps : bool, optional
+        Record the time of the peak sample and the compute window of each
+        task as the `defs.TIMESTAMP_COLUMNS` extra columns. Both are taken
+        by the workers and converted to the scheduler clock with the offset
+        of each worker, estimated from the polls (default=False).
     """
     def __init__(self, scheduler: Scheduler, path: str, filetype: str,
-                 interval: int, mem_max: bool, run_on_client: bool):
+                 interval: int, mem_max: bool, run_on_client: bool,
+                 sampler=None, idle_interval=None, batch_size=1,
+                 event_sampling=False, allocator=None, host_memory=False,
+                 run_id=None, in_process=False, dashboard=False,
+                 forensics_window=None, memory_model=False, timestamps=False):
         """ Constructor of the MemoryUsageGPUsPlugin class. """
         SchedulerPlugin.__init__(self)
 
@@ -43,33 +128,134 @@ class MemoryUsageGPUsPlugin(SchedulerPlugin):
         self._interval: int = interval
         self._mem_max: bool = mem_max
         self._run_on_client: bool = run_on_client
+        self._batch_size: int = max(1, batch_size)
+        self._sampler = sampler
+        self._allocator = allocator
+        self._event_sampling: bool = event_sampling or allocator is not None
+        self._polling: bool = allocator is None
+        self._host_memory: bool = host_memory
+        self._timestamps: bool = timestamps
 
         self._n_clients = 0
+        self._n_records = 0
 
         self._lock = Lock()
+        self._pending: list[tuple] = []
+        self._flush_callback: Optional[PeriodicCallback] = None
+        self._metrics = mtr.Metrics()
         self._plugin_start = time.perf_counter()
 
-        if os.path.exists(self._path):
-            # If there is an existing file, delete it.
-            os.remove(self._path)
+        self._feed = dash.MemoryFeed(start=self._plugin_start) if dashboard else None
+        self._dashboard_route = None
+
+        self._forensics_window = forensics_window
+        self._forensics_executor = None
+
+        for path in (self._path,
+                     self._path + defs.OVERHEAD_FILE_SUFFIX,
+                     self._path + defs.META_FILE_SUFFIX,
+                     self._path + defs.FORENSICS_FILE_SUFFIX,
+                     *(self._path + suffix for suffix in defs.SQLITE_WAL_SUFFIXES)):
+            if os.path.exists(path):
+                # If there is an existing file, delete it.
+                os.remove(path)
+
+        self._columns = ["task_key",
+                         "time",
+                         "min_gpu_memory_mb",
+                         "max_gpu_memory_mb",
+                         "worker_id"]
+        if self._host_memory:
+            self._columns += defs.HOST_MEMORY_COLUMNS
+
+        if self._timestamps:
+            self._columns += defs.TIMESTAMP_COLUMNS
+
+        self._memory_model = mdl.MemoryModel() if memory_model else None
+        if self._memory_model is not None:
+            self._columns.append("input_nbytes")
+
+        # Aggregates of the samples left by the departed workers, kept in the
+        # metadata with a constant size however many workers leave
+        self._removed_workers: dict = {"count": 0}
+
+        self._writer = writers.open_writer(self._filetype, self._path, self._columns)
+
+        self._metadata = {
+            "run_id": run_id or uuid.uuid4().hex,
+            "scheduler_id": getattr(scheduler, "id", None),
+            "host": socket.gethostname(),
+            "start": datetime.now(timezone.utc).isoformat(),
+            "end": None,
+            "records": 0,
+            "removed_workers": self._removed_workers,
+            "config": {
+                "filetype": self._filetype,
+                "interval": interval,
+                "mem_max": mem_max,
+                "run_on_client": run_on_client,
+                "sampler": _callable_name(sampler),
+                "idle_interval": idle_interval,
+                "batch_size": self._batch_size,
+                "event_sampling": self._event_sampling,
+                "allocator": allocator,
+                "host_memory": host_memory,
+                "in_process": in_process,
+                "dashboard": dashboard,
+                "forensics_window": forensics_window,
+                "memory_model": memory_model,
+                "timestamps": timestamps,
+                "columns": self._columns,
+            },
+        }
+        self._write_metadata()
+
+        monitor = gpu.WorkersLoop if in_process else gpu.WorkersThread
+        on_sample = self._feed.add_sample if self._feed is not None else None
+        ring_size = gpu.RING_SIZE if forensics_window else None
+
+        self._workers_thread = monitor(self._scheduler.address,
+                                       self._interval,
+                                       self._mem_max,
+                                       scheduler=self._scheduler,
+                                       sampler=sampler,
+                                       idle_interval=idle_interval,
+                                       metrics=self._metrics,
+                                       event_sampling=self._event_sampling,
+                                       host_memory=self._host_memory,
+                                       on_sample=on_sample,
+                                       ring_size=ring_size,
+                                       timestamps=self._timestamps)
 
-        self._record_df = pd.DataFrame(columns=["task_key",
-                                                "time",
-                                                "min_gpu_memory_mb",
-                                                "max_gpu_memory_mb",
-                                                "worker_id"])
+        if self._event_sampling:
+            self._scheduler.stream_handlers[defs.SAMPLE_STREAM_OP] = \
+                self._handle_task_sample
 
-        self._workers_thread = gpu.WorkersThread(self._scheduler.address,
-                                                 self._interval,
-                                                 self._mem_max)
+        if self._memory_model is not None:
+            self._scheduler.handlers[defs.PREDICT_OP] = self.predict_peak
+            self._scheduler.handlers[defs.ADVICE_OP] = self.chunk_advice
 
-        if not self._run_on_client:
+        if not self._run_on_client and self._polling:
             self._workers_thread.start()
 
-    def _record(self, key, min_gpu_mem_usage, max_gpu_mem_usage, worker_id):
+    @property
+    def run_id(self) -> str:
+        """ Identifier of the run in the metadata file. """
+        return str(self._metadata["run_id"])
+
+    def _write_metadata(self):
+        """ Write the run metadata next to the record file. """
+        with open(self._path + defs.META_FILE_SUFFIX, "w", encoding="utf-8") as fp:
+            json.dump(self._metadata, fp, indent=2, default=str)
+
+    def _record(self, key, min_gpu_mem_usage, max_gpu_mem_usage, worker_id,
+                host_mem_usage=(), timestamps=(), input_nbytes=-1):
         """
         Record a new data into the target file.
 
+        The row is queued and written together with the other pending rows
+        once `batch_size` rows are accumulated.
+
         Parameters
         ----------
         key : string
@@ -80,37 +266,94 @@ class MemoryUsageGPUsPlugin(SchedulerPlugin):
             Highest value of the GPU memory usage.
         worker_id : string
             Identification of the worker for that row.
+        host_mem_usage : tuple, optional
+            Values of the `defs.HOST_MEMORY_COLUMNS` columns.
+        timestamps : tuple, optional
+            Values of the `defs.TIMESTAMP_COLUMNS` columns.
+        input_nbytes : int, optional
+            Total bytes of the inputs of the task, recorded with the memory
+            model only (default=-1, unknown).
         """
-        with self._lock:
-            row = {'task_key': key,
-                   'time': time.perf_counter() - self._plugin_start,
-                   'min_gpu_memory_mb': min_gpu_mem_usage,
-                   'max_gpu_memory_mb': max_gpu_mem_usage,
-                   'worker_id': worker_id}
-
-            new_row = pd.DataFrame([row])
-            self._record_df = pd.concat([self._record_df,
-                                         new_row], axis=0, ignore_index=True)
-
-            if self._filetype == defs.CSV:
-                header: bool = not os.path.exists(self._path)
-
-                new_row.to_csv(self._path, mode='a', header=header)
-            # XXX: Only CSV has the option to append
-            elif self._filetype == defs.PARQUET:
-                self._record_df.to_parquet(self._path)
-            elif self._filetype == defs.JSON:
-                self._record_df.to_json(self._path)
-            elif self._filetype == defs.XML:
-                self._record_df.to_xml(self._path)
-            elif self._filetype == defs.EXCEL:
-                self._record_df.to_excel(self._path, sheet_name='Dask GPUs', header=True)
+        row = (key,
+               time.perf_counter() - self._plugin_start,
+               min_gpu_mem_usage,
+               max_gpu_mem_usage,
+               worker_id,
+               *host_mem_usage,
+               *timestamps)
+
+        if self._memory_model is not None:
+            row += (input_nbytes,)
+
+        self._pending.append(row)
+
+        if self._feed is not None:
+            self._feed.add_task(key, max_gpu_mem_usage)
+
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        """ Write all the pending rows into the target file at once. """
+        if not self._pending:
+            return
+
+        with self._lock, self._metrics.timer("record_write"):
+            pending, self._pending = self._pending, []
+
+            first = self._n_records
+            self._n_records += len(pending)
+
+            self._writer.write(first, pending)
+
+    async def start(self, scheduler: Scheduler) -> None:
+        """
+        Run when the scheduler starts up.
+        """
+        if self._batch_size > 1 and self._flush_callback is None:
+            tick = parse_timedelta(dask.config.get("distributed.admin.tick.interval"),
+                                   default="ms")
+
+            self._flush_callback = PeriodicCallback(self._flush, tick * 1000)
+            self._flush_callback.start()
+
+        if self._feed is not None and self._dashboard_route is None:
+            self._dashboard_route = dash.register(scheduler, self._feed)
+
+            if self._dashboard_route is not None:
+                logger.info(f"GPU memory usage page at {self._dashboard_route}")
+
+        if self._event_sampling:
+            worker_plugin = wp.TaskSamplerWorkerPlugin(self._sampler, self._allocator,
+                                                       self._host_memory)
+
+            await scheduler.register_worker_plugin(None,
+                                                   pickle.dumps(worker_plugin),
+                                                   name=worker_plugin.name,
+                                                   idempotent=False)
+
+    def _handle_task_sample(self, worker, key, event, sample, **kwargs):
+        """
+        Stream handler of the samples taken by workers at task boundaries.
+
+        Parameters
+        ----------
+        worker : string
+            Address of the worker that sent the sample.
+        key : string
+            Identifier of the task.
+        event : string
+            Either `defs.TASK_START` or `defs.TASK_END`.
+        sample : dict
+            Sample returned by `utils.timed_sample`.
+        """
+        self._workers_thread.add_task_sample(worker, key, event, sample)
 
     def add_client(self, scheduler: Scheduler, client: str) -> None:
         """
         Run when a new client connects.
         """
-        if self._n_clients == 0 and self._run_on_client:
+        if self._n_clients == 0 and self._run_on_client and self._polling:
             self._workers_thread.start()
 
         self._n_clients += 1
@@ -124,6 +367,43 @@ class MemoryUsageGPUsPlugin(SchedulerPlugin):
         if self._n_clients == 0 and self._run_on_client:
             self._workers_thread.stop()
 
+    def add_worker(self, scheduler: Scheduler, worker: str) -> None:
+        """
+        Run when a new worker enters the cluster.
+        """
+        self._workers_thread.add_worker(worker)
+
+    def remove_worker(self, scheduler: Scheduler, worker: str, **kwargs) -> None:
+        """
+        Run when a worker leaves the cluster.
+        """
+        pending = self._workers_thread.remove_worker(worker)
+
+        if self._feed is not None:
+            self._feed.remove_worker(worker)
+
+        removed = self._removed_workers
+        removed["count"] += 1
+
+        if pending is not None:
+            pending, timestamps = self._split_timestamps(pending, worker)
+
+            # The samples no finished task has claimed are not a task, so they
+            # are merged into the metadata instead of the records
+            columns = ["min_gpu_memory_mb", "max_gpu_memory_mb"]
+            if self._host_memory:
+                columns += defs.HOST_MEMORY_COLUMNS
+
+            for column, value in zip(columns, pending):
+                current = removed.get(column)
+                merge = min if column.startswith("min_") else max
+
+                if current is None or merge(current, value) != current:
+                    removed[column] = value
+
+                    if column == "max_gpu_memory_mb" and self._timestamps:
+                        removed["peak_time"] = timestamps[0]
+
     def transition(self, key, start, finish, *args, **kwargs):
         """
         Transition function when a task is being processed.
@@ -142,13 +422,205 @@ class MemoryUsageGPUsPlugin(SchedulerPlugin):
             worker ID, compute time, etc.
         """
         if start == 'processing' and finish in ("memory", "erred"):
-            worker_id = kwargs["worker"]
-            min_gpu_mem_usage, max_gpu_mem_usage = \
-                self._workers_thread.fetch_task_used_memory(worker_id)
-            self._record(key, min_gpu_mem_usage, max_gpu_mem_usage, worker_id)
+            with self._metrics.timer("transition"):
+                worker_id = kwargs["worker"]
+                memory = self._workers_thread.fetch_task_used_memory(worker_id, key)
+                memory, timestamps = self._split_timestamps(memory, worker_id,
+                                                            kwargs.get("startstops"))
+
+                if self._memory_model is None:
+                    self._record(key, memory[0], memory[1], worker_id, memory[2:],
+                                 timestamps)
+                else:
+                    nbytes = self._input_nbytes(key)
+                    self._record(key, memory[0], memory[1], worker_id, memory[2:],
+                                 timestamps, nbytes)
+
+                    # Erred tasks may have stopped before their peak
+                    if finish == "memory":
+                        self._memory_model.add(key, nbytes, memory[1])
+
+            if finish == "erred" and self._forensics_window:
+                self._dump_forensics(key, worker_id, kwargs)
+
+    def _split_timestamps(self, memory, worker_id, startstops=None):
+        """
+        Split the peak time off the aggregates of the monitor.
+
+        Returns
+        -------
+        tuple
+            The other aggregates and the values of the
+            `defs.TIMESTAMP_COLUMNS` columns, relative to the start of the
+            plugin like the `time` column, or -1 if unknown.
+        """
+        if not self._timestamps:
+            return memory, ()
+
+        memory, peak_time = memory[:-1], memory[-1]
+
+        compute = [startstop for startstop in startstops or ()
+                   if startstop.get("action") == "compute"]
+
+        window = (-1, -1)
+        if compute:
+            # Dask times the tasks with the wall clock of the workers
+            shift = self._workers_thread.wall_shift(worker_id) - self._plugin_start
+            window = (compute[-1]["start"] + shift, compute[-1]["stop"] + shift)
+
+        if peak_time >= 0:
+            peak_time -= self._plugin_start
+
+        return memory, (peak_time, *window)
+
+    def _input_nbytes(self, key) -> int:
+        """ Total bytes of the dependencies of a task, -1 if unknown. """
+        ts = self._scheduler.tasks.get(key)
+        if ts is None:
+            return -1
+
+        return sum(max(dep.nbytes, 0) for dep in ts.dependencies)
+
+    def predict_peak(self, prefix: str, nbytes: int) -> Optional[dict]:
+        """
+        Predict the peak GPU memory of a task from the memory model.
+
+        It is also served by the scheduler as the `defs.PREDICT_OP`
+        handler, e.g. `client.sync(client.scheduler.memusage_gpus_predict,
+        prefix="matmul", nbytes=2**30)`.
+
+        Parameters
+        ----------
+        prefix : string
+            Task prefix, like `make_blobs`, or a task key.
+        nbytes : int
+            Total bytes of the inputs of the task.
+
+        Returns
+        -------
+        dict
+            The number of fitted `tasks`, the expected `peak_mb` and its
+            `upper_mb` bound, or None if no task of the prefix finished.
+
+        Raises
+        ------
+        ValueError
+            If the plugin was created without `memory_model`.
+        """
+        if self._memory_model is None:
+            raise ValueError("The memory model is disabled.")
+
+        return self._memory_model.predict(prefix, nbytes)
+
+    def chunk_advice(self, gpu_memory_mb: Optional[float] = None,
+                     min_tasks: int = mdl.MIN_TASKS) -> dict:
+        """
+        Memory model of each task prefix and the largest input that fits.
+
+        It is also served by the scheduler as the `defs.ADVICE_OP` handler,
+        e.g. `client.sync(client.scheduler.memusage_gpus_advice,
+        gpu_memory_mb=16384)`.
+
+        Parameters
+        ----------
+        gpu_memory_mb : float, optional
+            Memory of a GPU in MiB (default=None, no recommendation).
+        min_tasks : int, optional
+            Minimum number of finished tasks of a prefix to recommend an
+            input size (default=`mdl.MIN_TASKS`).
+
+        Returns
+        -------
+        dict
+            The model of each prefix, see `mdl.MemoryModel.advice()`.
+
+        Raises
+        ------
+        ValueError
+            If the plugin was created without `memory_model`.
+        """
+        if self._memory_model is None:
+            raise ValueError("The memory model is disabled.")
+
+        return self._memory_model.advice(gpu_memory_mb, min_tasks)
+
+    def _dump_forensics(self, key, worker_id, kwargs):
+        """
+        Write the samples that preceded an erred task in the background.
+
+        Only a copy of the ring of the worker is taken here, the conversion
+        and the write run in a single writer thread.
+        """
+        samples = self._workers_thread.recent_samples(worker_id, self._forensics_window)
+
+        entry = {"key": key,
+                 "worker_id": worker_id,
+                 "time": time.perf_counter() - self._plugin_start,
+                 "window": self._forensics_window,
+                 "exception": kwargs.get("exception_text"),
+                 "traceback": kwargs.get("traceback_text"),
+                 "startstops": kwargs.get("startstops"),
+                 "samples": samples}
+
+        if self._forensics_executor is None:
+            self._forensics_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="memusage-gpus-forensics")
+
+        self._forensics_executor.submit(self._write_forensics, entry)
+
+    def _write_forensics(self, entry):
+        """ Append a forensics entry to its file. """
+        with self._metrics.timer("forensics_write"):
+            samples = entry["samples"]
+
+            if samples is not None:
+                # Samples are timed like the records
+                samples = dict(samples, time=samples["time"] - self._plugin_start)
+                entry["samples"] = {name: values.tolist()
+                                    for name, values in samples.items()}
+
+            path = self._path + defs.FORENSICS_FILE_SUFFIX
+            with open(path, "a", encoding="utf-8") as fp:
+                fp.write(json.dumps(entry, default=str) + "\n")
+
+    def overhead(self) -> dict:
+        """
+        Overhead of the plugin itself.
+
+        Returns
+        -------
+        dict
+            Histogram summary in seconds of each instrumented path:
+            `transition` handling, `fetch_lock_wait`, `record_write`,
+            `forensics_write`, `poll_round_trip` and the `sampler` run time
+            on the workers, in total and per worker.
+        """
+        return self._metrics.summary()
 
     async def before_close(self):
         """
         Shutdown plugin structures before closing the scheduler.
         """
+        if self._flush_callback is not None:
+            self._flush_callback.stop()
+
+        self._flush()
+
+        with self._lock:
+            self._writer.close()
+
         self._workers_thread.stop()
+
+        if self._forensics_executor is not None:
+            self._forensics_executor.shutdown(wait=True)
+
+        overhead = self.overhead()
+
+        logger.info(f"GPU memory usage plugin overhead: {overhead}")
+
+        with open(self._path + defs.OVERHEAD_FILE_SUFFIX, "w", encoding="utf-8") as fp:
+            json.dump(overhead, fp, indent=2)
+
+        self._metadata["end"] = datetime.now(timezone.utc).isoformat()
+        self._metadata["records"] = self._n_records
+        self._write_metadata()
@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+
+""" Read record files written by the plugin with filters. """
+
+import os
+
+from dask.utils import key_split
+
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import writers
+
+EXTENSIONS = {
+    ".csv": defs.CSV,
+    ".parquet": defs.PARQUET,
+    ".pq": defs.PARQUET,
+    ".json": defs.JSON,
+    ".xml": defs.XML,
+    ".xlsx": defs.EXCEL,
+    ".xls": defs.EXCEL,
+    ".sqlite": defs.SQLITE,
+    ".sqlite3": defs.SQLITE,
+    ".db": defs.SQLITE,
+}
+
+# Files written by the plugin next to the record file
+SIDECAR_SUFFIXES = (defs.OVERHEAD_FILE_SUFFIX, defs.META_FILE_SUFFIX,
+                    defs.FORENSICS_FILE_SUFFIX, *defs.SQLITE_WAL_SUFFIXES)
+
+# Number of rows read at once from the formats that can be streamed
+CHUNK_SIZE = 1_000_000
+
+
+def list_files(path):
+    """
+    List the record files of a single file or of a partitioned directory.
+
+    Parameters
+    ----------
+    path : string
+        Record file or directory with record files.
+
+    Returns
+    -------
+    list
+        Paths of the record files, sorted by name.
+    """
+    if not os.path.isdir(path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No such record file: '{path}'")
+
+        return [path]
+
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            if name.startswith((".", "_")) or name.endswith(SIDECAR_SUFFIXES):
+                continue
+
+            files.append(os.path.join(root, name))
+
+    return sorted(files)
+
+
+def infer_file_type(path):
+    """
+    Infer the type of a record file or partitioned directory.
+
+    The extension is used when it is known, otherwise the first bytes of
+    the file are inspected.
+
+    Parameters
+    ----------
+    path : string
+        Record file or directory with record files.
+
+    Returns
+    -------
+    string
+        One of `defs.FILE_TYPES`.
+
+    Raises
+    ------
+    FileTypeException
+        If the directory has no record file.
+    """
+    files = list_files(path)
+    if not files:
+        raise defs.FileTypeException(f"There is no record file in '{path}'.")
+
+    filetype = EXTENSIONS.get(os.path.splitext(files[0])[1].lower())
+    if filetype is not None:
+        return filetype
+
+    with open(files[0], "rb") as fp:
+        magic = fp.read(64)
+
+    if magic.startswith(b"PAR1"):
+        return defs.PARQUET
+    if magic.startswith(b"PK\x03\x04"):
+        return defs.EXCEL
+    if magic.startswith(b"SQLite format 3\x00"):
+        return defs.SQLITE
+
+    magic = magic.lstrip()
+    if magic.startswith(b"<"):
+        return defs.XML
+    if magic.startswith((b"{", b"[")):
+        return defs.JSON
+
+    return defs.CSV
+
+
+def _as_list(value):
+    """ Wrap a single value in a list. """
+    if value is None or isinstance(value, (list, tuple, set)):
+        return value
+
+    return [value]
+
+
+def _filter_frame(df, start=None, end=None, workers=None, prefixes=None, min_peak=None):
+    """ Apply the filters to a pandas DataFrame. """
+    mask = None
+
+    def both(condition):
+        """ Combine a new condition with the previous ones. """
+        return condition if mask is None else mask & condition
+
+    if start is not None:
+        mask = both(df["time"] >= start)
+    if end is not None:
+        mask = both(df["time"] <= end)
+    if workers is not None:
+        mask = both(df["worker_id"].isin(workers))
+    if min_peak is not None:
+        mask = both(df["max_gpu_memory_mb"] >= min_peak)
+    if prefixes is not None:
+        mask = both(df["task_key"].astype(str).map(key_split).isin(prefixes))
+
+    return df if mask is None else df[mask]
+
+
+def _drop_index(df):
+    """ Drop the index columns that each writer stores its own way. """
+    drop = [column for column in df.columns
+            if column == "index" or str(column).startswith(("Unnamed:", "__index_level"))]
+
+    return df.drop(columns=drop) if drop else df
+
+
+def _needed_columns(columns, start, end, workers, prefixes, min_peak):
+    """ Columns to read so that the filters can be evaluated. """
+    if columns is None:
+        return None
+
+    needed = list(columns)
+    for column, value in (("time", start if start is not None else end),
+                          ("worker_id", workers),
+                          ("task_key", prefixes),
+                          ("max_gpu_memory_mb", min_peak)):
+        if value is not None and column not in needed:
+            needed.append(column)
+
+    return needed
+
+
+def _parquet_filter(start, end, workers, prefixes, min_peak):
+    """
+    Build a PyArrow dataset expression from the filters.
+
+    Comparisons on `time`, `worker_id` and `max_gpu_memory_mb` skip whole
+    row groups through their statistics. The task prefixes are matched
+    loosely on the key, and exactly after reading.
+    """
+    import pyarrow.compute as pc  # type: ignore[import-untyped]
+    import pyarrow.dataset as ds  # type: ignore[import-untyped]
+
+    expression = None
+
+    def both(condition):
+        """ Combine a new condition with the previous ones. """
+        return condition if expression is None else expression & condition
+
+    if start is not None:
+        expression = both(ds.field("time") >= start)
+    if end is not None:
+        expression = both(ds.field("time") <= end)
+    if workers is not None:
+        expression = both(ds.field("worker_id").isin(list(workers)))
+    if min_peak is not None:
+        expression = both(ds.field("max_gpu_memory_mb") >= min_peak)
+    if prefixes is not None:
+        matches = None
+        for prefix in prefixes:
+            # Plain keys and stringified tuple keys
+            for pattern in (prefix, f"('{prefix}", f'("{prefix}'):
+                match = pc.starts_with(ds.field("task_key"), pattern)
+                matches = match if matches is None else matches | match
+
+        expression = both(matches)
+
+    return expression
+
+
+def _read_parquet(files, columns, filters):
+    """ Read Parquet files with the projection and filters pushed down. """
+    import pyarrow.dataset as ds  # type: ignore[import-untyped]
+
+    dataset = ds.dataset(files, format="parquet")
+
+    if columns is None:
+        columns = [name for name in dataset.schema.names
+                   if not name.startswith("__index_level")]
+
+    table = dataset.to_table(columns=columns, filter=_parquet_filter(**filters))
+
+    return table.to_pandas()
+
+
+def _connect_sqlite(path):
+    """ Open a SQLite record database read-only, it can be a live run. """
+    import pathlib
+    import sqlite3
+
+    return sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+
+
+def _sqlite_query(conn, columns, filters, limit=None):
+    """
+    Query of a SQLite record database with the filters pushed down.
+
+    The normalized tables are queried instead of the view, so the filters
+    of the prefixes and workers use the (prefix, time) and (worker, time)
+    indexes.
+
+    Returns
+    -------
+    tuple
+        The SQL query and its parameters.
+    """
+    if columns is None:
+        columns = [row[1] for row in
+                   conn.execute(f"PRAGMA table_info({writers.SQLITE_VIEW})")]
+
+    select = ", ".join("workers.address AS worker_id" if column == "worker_id" else
+                       f'records."{column}"' for column in columns)
+
+    conditions, params = [], []
+    for condition, value in (("records.time >= ?", filters.get("start")),
+                             ("records.time <= ?", filters.get("end")),
+                             ("records.max_gpu_memory_mb >= ?", filters.get("min_peak"))):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+
+    for condition, values in (("workers.address IN ({})", filters.get("workers")),
+                              ("records.prefix IN (SELECT id FROM prefixes "
+                               "WHERE name IN ({}))", filters.get("prefixes"))):
+        if values is not None:
+            conditions.append(condition.format(", ".join("?" * len(values))))
+            params += list(values)
+
+    sql = f"SELECT {select} FROM records JOIN workers ON records.worker = workers.id"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY records.id"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+
+    return sql, params
+
+
+def _read_file(path, filetype, columns, filters):
+    """ Read a single record file into pandas and apply the filters. """
+    import pandas as pd
+
+    if filetype == defs.PARQUET:
+        df = _read_parquet([path], columns, filters)
+    elif filetype == defs.CSV:
+        # Filter the chunks as they are read to bound the memory usage
+        chunks = [_filter_frame(chunk, **filters)
+                  for chunk in _iter_file(path, filetype, columns, filters, CHUNK_SIZE)]
+
+        return pd.concat(chunks, ignore_index=True) if chunks else \
+            pd.DataFrame(columns=columns)
+    elif filetype == defs.JSON:
+        df = pd.read_json(path)
+    elif filetype == defs.XML:
+        df = pd.read_xml(path)
+    elif filetype == defs.SQLITE:
+        conn = _connect_sqlite(path)
+        try:
+            sql, params = _sqlite_query(conn, columns, filters)
+
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+    elif filetype == defs.EXCEL:
+        # Large records are split into several worksheets
+        sheets = pd.read_excel(path, sheet_name=None)
+        df = pd.concat(sheets.values(), ignore_index=True) if len(sheets) > 1 else \
+            next(iter(sheets.values()))
+    else:
+        raise defs.FileTypeException(f"Filetype '{filetype}' is not supported.")
+
+    df = _drop_index(df)
+    if columns is not None:
+        df = df[columns]
+
+    return _filter_frame(df, **filters)
+
+
+def _meta(path, filetype, columns):
+    """ Empty DataFrame with the columns and types of a record file. """
+    if filetype == defs.CSV:
+        import pandas as pd
+
+        return _drop_index(pd.read_csv(path, usecols=columns, nrows=100)).iloc[:0]
+
+    if filetype == defs.SQLITE:
+        import pandas as pd
+
+        conn = _connect_sqlite(path)
+        try:
+            sql, params = _sqlite_query(conn, columns, {}, limit=100)
+
+            return pd.read_sql_query(sql, conn, params=params).iloc[:0]
+        finally:
+            conn.close()
+
+    # The other formats cannot be read partially
+    return _read_file(path, filetype, columns, {}).iloc[:0]
+
+
+def _check_file_type(path, filetype):
+    """ Infer or validate the type of the record files. """
+    if filetype is None:
+        filetype = infer_file_type(path)
+    filetype = filetype.lower()
+
+    if filetype not in defs.FILE_TYPES:
+        raise defs.FileTypeException(f"Filetype '{filetype}' is not supported.")
+
+    return filetype
+
+
+def _iter_file(path, filetype, columns, filters, chunksize):
+    """ Read the chunks of a single record file. """
+    if filetype == defs.CSV:
+        import pandas as pd
+
+        usecols = columns
+        if usecols is None:
+            def usecols(column):
+                """ Skip the index column. """
+                return not column.startswith("Unnamed:") and column != ""
+
+        yield from pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+    elif filetype == defs.PARQUET:
+        import pyarrow.dataset as ds  # type: ignore[import-untyped]
+
+        dataset = ds.dataset(path, format="parquet")
+        if columns is None:
+            columns = [name for name in dataset.schema.names
+                       if not name.startswith("__index_level")]
+
+        batches = dataset.to_batches(columns=columns, filter=_parquet_filter(**filters),
+                                     batch_size=chunksize)
+        for batch in batches:
+            yield batch.to_pandas()
+    elif filetype == defs.SQLITE:
+        import pandas as pd
+
+        conn = _connect_sqlite(path)
+        try:
+            sql, params = _sqlite_query(conn, columns, filters)
+
+            yield from pd.read_sql_query(sql, conn, params=params, chunksize=chunksize)
+        finally:
+            conn.close()
+    else:
+        # JSON, XML and Excel files can only be parsed as a whole
+        df = _read_file(path, filetype, columns, filters)
+
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def iter_records(path, filetype=None, columns=None, chunksize=CHUNK_SIZE, start=None,
+                 end=None, workers=None, prefixes=None, min_peak=None):
+    """
+    Stream a record file or partitioned directory in chunks.
+
+    Only one chunk is held in memory at a time for CSV and Parquet files,
+    so record sets larger than the memory can be aggregated. The filters
+    are the same as `read_records()`.
+
+    Parameters
+    ----------
+    path : string
+        Record file or directory with record files of the same type.
+    filetype : string, optional
+        One of `defs.FILE_TYPES` (default=None, inferred from the files).
+    columns : list, optional
+        Columns to return (default=None, all the record columns).
+    chunksize : int, optional
+        Maximum number of rows of each chunk (default=`CHUNK_SIZE`).
+    start, end, workers, prefixes, min_peak : optional
+        Filters of the rows, see `read_records()`.
+
+    Yields
+    ------
+    DataFrame
+        The filtered rows of each chunk, skipping empty ones.
+
+    Raises
+    ------
+    FileTypeException
+        If the filetype is not supported.
+    """
+    filetype = _check_file_type(path, filetype)
+
+    filters = {"start": start,
+               "end": end,
+               "workers": _as_list(workers),
+               "prefixes": _as_list(prefixes),
+               "min_peak": min_peak}
+
+    read_columns = _needed_columns(columns, **filters)
+
+    for file in list_files(path):
+        for chunk in _iter_file(file, filetype, read_columns, filters, chunksize):
+            chunk = _filter_frame(chunk, **filters)
+
+            if columns is not None:
+                chunk = chunk[list(columns)]
+
+            if len(chunk):
+                yield chunk.reset_index(drop=True)
+
+
+def read_records(path, filetype=None, columns=None, start=None, end=None,
+                 workers=None, prefixes=None, min_peak=None, lazy=False):
+    """
+    Read a record file or partitioned directory written by the plugin.
+
+    Parameters
+    ----------
+    path : string
+        Record file or directory with record files of the same type.
+    filetype : string, optional
+        One of `defs.FILE_TYPES` (default=None, inferred from the files).
+    columns : list, optional
+        Columns to return (default=None, all the record columns).
+    start : float, optional
+        Only rows recorded at or after this time in seconds.
+    end : float, optional
+        Only rows recorded at or before this time in seconds.
+    workers : string or list, optional
+        Only rows of these workers.
+    prefixes : string or list, optional
+        Only rows of tasks with these prefixes, like `make_blobs` or
+        `getitem`.
+    min_peak : float, optional
+        Only rows whose peak GPU used memory is at least this value in MiB.
+    lazy : bool, optional
+        Return a lazy `dask.dataframe` instead of a pandas DataFrame
+        (default=False).
+
+    Returns
+    -------
+    DataFrame
+        The filtered records, with a pandas or Dask DataFrame.
+
+    Raises
+    ------
+    FileTypeException
+        If the filetype is not supported.
+    """
+    filetype = _check_file_type(path, filetype)
+
+    filters = {"start": start,
+               "end": end,
+               "workers": _as_list(workers),
+               "prefixes": _as_list(prefixes),
+               "min_peak": min_peak}
+
+    read_columns = _needed_columns(columns, **filters)
+    files = list_files(path)
+
+    if lazy:
+        import dask
+        import dask.dataframe as dd
+
+        if filetype == defs.PARQUET:
+            dnf = [(column, op, value) for column, op, value in
+                   (("time", ">=", start),
+                    ("time", "<=", end),
+                    ("worker_id", "in", filters["workers"]),
+                    ("max_gpu_memory_mb", ">=", min_peak))
+                   if value is not None]
+
+            ddf = dd.read_parquet(files, columns=read_columns, filters=dnf or None)
+
+            if filters["prefixes"] is not None:
+                ddf = ddf.map_partitions(_filter_frame, prefixes=filters["prefixes"])
+        else:
+            parts = [dask.delayed(_read_file)(file, filetype, read_columns, filters)
+                     for file in files]
+            ddf = dd.from_delayed(parts, meta=_meta(files[0], filetype, read_columns))
+
+        return ddf if columns is None else ddf[list(columns)]
+
+    import pandas as pd
+
+    if filetype == defs.PARQUET:
+        # The whole dataset is scanned at once to prune row groups
+        df = _filter_frame(_read_parquet(files, read_columns, filters),
+                           prefixes=filters["prefixes"])
+    else:
+        frames = [_read_file(file, filetype, read_columns, filters) for file in files]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    if columns is not None:
+        df = df[list(columns)]
+
+    return df.reset_index(drop=True)
+
+
+def read_metadata(path):
+    """
+    Read the run metadata written by the plugin next to a record file.
+
+    Parameters
+    ----------
+    path : string
+        Record file.
+
+    Returns
+    -------
+    dict
+        The metadata of the run, or None if the record has no metadata.
+    """
+    import json
+
+    try:
+        with open(path + defs.META_FILE_SUFFIX, encoding="utf-8") as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+
+
+def read_forensics(path):
+    """
+    Read the samples that preceded the erred tasks of a record file.
+
+    Parameters
+    ----------
+    path : string
+        Record file.
+
+    Returns
+    -------
+    list
+        One dict per erred task, in the order they erred, with the `key`,
+        `worker_id`, `time`, `exception`, `traceback`, `startstops` and
+        the `samples` of the worker in the `window` seconds before it.
+        Empty if no task erred.
+    """
+    import json
+
+    try:
+        with open(path + defs.FORENSICS_FILE_SUFFIX, encoding="utf-8") as fp:
+            return [json.loads(line) for line in fp if line.strip()]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+""" Out-of-core summary of the records per task prefix and per worker. """
+
+import heapq
+import html
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from dask_memusage_gpus import analysis
+from dask_memusage_gpus import model as mdl
+
+MARKDOWN = "markdown"
+JSON = "json"
+HTML = "html"
+
+FORMATS = [MARKDOWN, JSON, HTML]
+
+# Upper bounds in MiB of the buckets of the peak histograms: 16 buckets per
+# power of two up to 1 TiB, so a quantile is off by less than 4.5%
+BUCKET_EDGES = 2 ** (np.arange(20 * 16 + 1) / 16)
+
+
+class GroupStats:
+    """
+    Constant size aggregate of the tasks of a group.
+
+    Parameters
+    ----------
+    count : int
+        Number of tasks.
+    missed : int
+        Number of tasks without any sample.
+    peak : float
+        Highest GPU used memory in MiB.
+    mib_seconds : float
+        Sum of the peak GPU used memory of each task times its duration.
+    buckets : numpy.ndarray
+        Histogram of the peaks of the tasks over `BUCKET_EDGES`.
+    """
+    __slots__ = ("count", "missed", "peak", "mib_seconds", "buckets")
+
+    def __init__(self):
+        """ Constructor of the GroupStats class. """
+        self.count: int = 0
+        self.missed: int = 0
+        self.peak: float = -1
+        self.mib_seconds: float = 0.0
+        self.buckets = np.zeros(len(BUCKET_EDGES), dtype=np.int64)
+
+    def quantile(self, q):
+        """
+        Approximated quantile of the peaks of the sampled tasks.
+
+        Returns
+        -------
+        float
+            Upper bound of the bucket that holds the quantile, clipped to the
+            peak, or -1 if no task was sampled.
+        """
+        sampled = self.buckets.sum()
+        if sampled == 0:
+            return -1
+
+        index = int(np.searchsorted(np.cumsum(self.buckets), q * sampled))
+
+        return float(min(BUCKET_EDGES[index], self.peak))
+
+    def to_dict(self) -> dict:
+        """ Summary of the group. """
+        return {"tasks": self.count,
+                "missed": self.missed,
+                "peak_gpu_memory_mb": self.peak,
+                "p95_gpu_memory_mb": self.quantile(0.95),
+                "gpu_memory_mb_s": self.mib_seconds}
+
+
+def _aggregate(stats, labels, memory, durations):
+    """ Merge the rows of a chunk into the statistics of their groups. """
+    codes, uniques = pd.factorize(labels)
+    n_groups = len(uniques)
+    n_buckets = len(BUCKET_EDGES)
+
+    sampled = memory >= 0
+    weights = np.where(sampled & ~np.isnan(durations), memory * durations, 0.0)
+
+    count = np.bincount(codes, minlength=n_groups)
+    missed = np.bincount(codes, weights=~sampled, minlength=n_groups)
+    mib_seconds = np.bincount(codes, weights=weights, minlength=n_groups)
+
+    peak = np.full(n_groups, -1.0)
+    np.maximum.at(peak, codes[sampled], memory[sampled])
+
+    index = np.minimum(np.searchsorted(BUCKET_EDGES, memory[sampled]), n_buckets - 1)
+    buckets = np.bincount(codes[sampled] * n_buckets + index,
+                          minlength=n_groups * n_buckets).reshape(n_groups, n_buckets)
+
+    for i, label in enumerate(map(str, uniques)):
+        group = stats.get(label)
+        if group is None:
+            group = stats[label] = GroupStats()
+
+        group.count += int(count[i])
+        group.missed += int(missed[i])
+        group.peak = max(group.peak, float(peak[i]))
+        group.mib_seconds += float(mib_seconds[i])
+        group.buckets += buckets[i]
+
+
+class RecordSummary:
+    """
+    Summary of record files that are read chunk by chunk.
+
+    The state has a constant size per task prefix and per worker, plus the
+    `top` heaviest tasks, so it does not grow with the number of records.
+    Durations are inferred from the completions on each worker, also across
+    chunks, unless the records have a `duration` column. Records with an
+    `input_nbytes` column also fit the memory model of each prefix.
+
+    Parameters
+    ----------
+    top : int, optional
+        Number of heaviest tasks kept (default=10).
+    gpu_memory_mb : float, optional
+        Memory of a GPU in MiB, to recommend the largest input of each
+        prefix (default=None, no recommendation).
+    min_tasks : int, optional
+        Minimum number of sampled tasks of a prefix to recommend an input
+        size (default=`mdl.MIN_TASKS`).
+    """
+    def __init__(self, top: int = 10, gpu_memory_mb: Optional[float] = None,
+                 min_tasks: int = mdl.MIN_TASKS):
+        """ Constructor of the RecordSummary class. """
+        self._top: int = top
+        self._gpu_memory_mb: Optional[float] = gpu_memory_mb
+        self._min_tasks: int = min_tasks
+        self.model = mdl.MemoryModel()
+        self._heaviest: list[tuple] = []
+        self._last_time: dict = {}
+        self.prefixes: dict[str, GroupStats] = {}
+        self.workers: dict[str, GroupStats] = {}
+        self.n_records: int = 0
+
+    def _durations(self, chunk):
+        """ Durations of a chunk, continuing from the previous chunks. """
+        durations = analysis.task_durations(chunk)
+
+        if "duration" in chunk.columns:
+            return durations
+
+        # The first task of each worker in the chunk follows the last one
+        # of the previous chunks
+        first = np.isnan(durations)
+        last_time = chunk["worker_id"][first].map(self._last_time).to_numpy(dtype=float)
+        durations[first] = chunk["time"].to_numpy(dtype=float)[first] - last_time
+
+        self._last_time.update(chunk.groupby("worker_id")["time"].max().to_dict())
+
+        return durations
+
+    def add(self, chunk):
+        """
+        Aggregate a chunk of records.
+
+        Parameters
+        ----------
+        chunk : DataFrame
+            Records with `task_key`, `time`, `max_gpu_memory_mb` and
+            `worker_id` columns.
+        """
+        memory = chunk["max_gpu_memory_mb"].to_numpy(dtype=float)
+        durations = self._durations(chunk)
+
+        _aggregate(self.prefixes, analysis.task_prefixes(chunk["task_key"]).to_numpy(),
+                   memory, durations)
+        _aggregate(self.workers, chunk["worker_id"].to_numpy(), memory, durations)
+
+        if "input_nbytes" in chunk.columns:
+            self.model.add_chunk(chunk)
+
+        heaviest = chunk[memory >= 0].nlargest(self._top, "max_gpu_memory_mb")
+        self._heaviest = heapq.nlargest(
+            self._top,
+            self._heaviest + list(zip(heaviest["max_gpu_memory_mb"].astype(float),
+                                      heaviest["task_key"].astype(str),
+                                      heaviest["worker_id"].astype(str),
+                                      heaviest["time"].astype(float)))
+        )
+
+        self.n_records += len(chunk)
+
+    def to_dict(self) -> dict:
+        """
+        Summary of all the chunks.
+
+        Returns
+        -------
+        dict
+            The number of `records`, the statistics of each of the
+            `prefixes` and `workers`, sorted by peak, the `heaviest` tasks
+            and the memory `model` of each prefix, if the records have the
+            input bytes.
+        """
+        def groups(stats):
+            """ Groups sorted from the heaviest. """
+            return {label: group.to_dict() for label, group in
+                    sorted(stats.items(), key=lambda item: -item[1].peak)}
+
+        summary = {"records": self.n_records,
+                   "prefixes": groups(self.prefixes),
+                   "workers": groups(self.workers),
+                   "heaviest": [{"task_key": key,
+                                 "worker_id": worker,
+                                 "time": time,
+                                 "max_gpu_memory_mb": peak}
+                                for peak, key, worker, time in self._heaviest]}
+
+        if self.model.prefixes:
+            summary["model"] = self.model.advice(self._gpu_memory_mb, self._min_tasks)
+
+        return summary
+
+    def tables(self):
+        """ Tables of the summary as pandas DataFrames. """
+        summary = self.to_dict()
+
+        def table(groups, name):
+            """ Table of groups indexed by their names. """
+            df = pd.DataFrame.from_dict(groups, orient="index")
+            df.index.name = name
+
+            return df
+
+        tables = {"Task prefixes": table(summary["prefixes"], "prefix"),
+                  "Workers": table(summary["workers"], "worker_id"),
+                  "Heaviest tasks": pd.DataFrame(summary["heaviest"])}
+
+        if "model" in summary:
+            tables["Memory model"] = table(summary["model"], "prefix")
+
+        return tables
+
+    def render(self, fmt: str = MARKDOWN) -> str:
+        """
+        Render the summary.
+
+        Parameters
+        ----------
+        fmt : string, optional
+            One of `FORMATS` (default=`MARKDOWN`).
+
+        Returns
+        -------
+        string
+            The rendered report.
+        """
+        if fmt == JSON:
+            return json.dumps(self.to_dict(), indent=2)
+
+        if fmt == HTML:
+            return html_page("GPU memory usage report", f"{self.n_records} records",
+                             self.tables())
+
+        if fmt != MARKDOWN:
+            raise ValueError(f"Format '{fmt}' is not supported.")
+
+        sections = [f"# GPU memory usage report\n\n{self.n_records} records\n"]
+        for title, table in self.tables().items():
+            sections.append(f"## {title}\n\n{markdown_table(table)}\n")
+
+        return "\n".join(sections)
+
+
+def markdown_table(df) -> str:
+    """ Render a DataFrame as a Markdown table. """
+    def cell(value):
+        """ Format a single cell. """
+        if isinstance(value, (float, np.floating)):
+            return f"{value:.2f}"
+
+        return str(value).replace("|", "\\|")
+
+    with_index = not isinstance(df.index, pd.RangeIndex)
+
+    header = [str(column) for column in df.columns]
+    if with_index:
+        header.insert(0, df.index.name or "")
+
+    lines = ["| " + " | ".join(header) + " |",
+             "|" + "|".join(["---"] * len(header)) + "|"]
+
+    for label, row in zip(df.index, df.itertuples(index=False)):
+        cells = [cell(value) for value in row]
+        if with_index:
+            cells.insert(0, cell(label))
+
+        lines.append("| " + " | ".join(cells) + " |")
+
+    return "\n".join(lines)
+
+
+def html_page(title: str, subtitle: str, tables: dict) -> str:
+    """ Render titled DataFrames as a standalone HTML page. """
+    body = "".join(f"<h2>{html.escape(name)}</h2>\n"
+                   f"{table.to_html(float_format=lambda v: f'{v:.2f}')}\n"
+                   for name, table in tables.items())
+
+    return ("<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(title)}</title></head>\n<body>\n"
+            f"<h1>{html.escape(title)}</h1>\n<p>{html.escape(subtitle)}</p>\n"
+            f"{body}</body>\n</html>\n")
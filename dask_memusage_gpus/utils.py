@@ -2,10 +2,11 @@
 
 """ All kinds of functions that are common to other modules. """
 
+import importlib
+import inspect
 import os
-import subprocess
-import xml.etree.ElementTree as ET
-from time import sleep
+import sys
+from time import perf_counter, sleep, time
 
 from dask_memusage_gpus import definitions as defs
 
@@ -29,6 +30,40 @@ def validate_file_type(filetype):
                                      "output file.")
 
 
+def load_sampler(name):
+    """
+    Import a sampler function from its dotted path.
+
+    Parameters
+    ----------
+    name : string
+        Path of the function as `package.module.function` or
+        `package.module:function`.
+
+    Returns
+    -------
+    callable
+        The sampler function.
+
+    Raises
+    ------
+    SamplerException
+        If the function cannot be imported.
+    """
+    module_name, _, func_name = name.replace(":", ".").rpartition(".")
+
+    try:
+        sampler = getattr(importlib.import_module(module_name), func_name)
+    except (ImportError, AttributeError, ValueError) as e:
+        raise defs.SamplerException(f"'{name}' is not a valid sampler: {e}") from e
+
+    if not callable(sampler):
+        raise defs.SamplerException(f"'{name}' is not a valid sampler: "
+                                    "it is not callable.")
+
+    return sampler
+
+
 def run_cmd(cmd, shell=True):
     """
     Run a command line using python Popen.
@@ -52,6 +87,8 @@ def run_cmd(cmd, shell=True):
     CMDException
         If the process returns an error.
     """
+    import subprocess
+
     with subprocess.Popen(cmd,
                           stdout=subprocess.PIPE,
                           stderr=subprocess.PIPE,
@@ -82,6 +119,8 @@ def generate_gpu_proccesses():
     for line in run_cmd(defs.NVIDIA_SMI_QUERY_XML_CMD):
         output += line.decode("utf-8")
 
+    import xml.etree.ElementTree as ET
+
     root = ET.fromstring(output)
 
     def fetch_process_info(process):
@@ -124,19 +163,200 @@ def generate_gpu_proccesses():
     return processes
 
 
-def get_worker_gpu_memory_used():
+class ProcessTree:
+    """
+    Cache of the processes that descend from a root process.
+
+    Parents are resolved through `/proc/<pid>/stat` only the first time a
+    process is seen, and processes that are gone are pruned from the cache,
+    so the tree is not walked again at every sample.
+
+    Parameters
+    ----------
+    root_pid : int
+        PID of the root process, usually the worker.
+    proc_path : string, optional
+        Mount point of the proc filesystem (default="/proc").
+    """
+    def __init__(self, root_pid, proc_path="/proc"):
+        """ Constructor of the ProcessTree class. """
+        self._root_pid: int = root_pid
+        self._proc_path: str = proc_path
+        self._descendants: dict[int, bool] = {root_pid: True}
+
+    def _parent(self, pid):
+        """ PID of the parent process, or 0 if it cannot be read. """
+        try:
+            with open(os.path.join(self._proc_path, str(pid), "stat"),
+                      encoding="utf-8") as fp:
+                stat = fp.read()
+        except OSError:
+            return 0
+
+        # The command name between parentheses may contain spaces
+        return int(stat.rsplit(")", 1)[1].split()[1])
+
+    def contains(self, pid):
+        """
+        Check if a process is the root or one of its descendants.
+
+        Parameters
+        ----------
+        pid : int
+            PID of the process.
+
+        Returns
+        -------
+        bool
+            True if the process belongs to the tree.
+        """
+        cached = self._descendants.get(pid)
+        if cached is not None:
+            return cached
+
+        parent = pid
+        while parent > 1 and parent != self._root_pid:
+            parent = self._parent(parent)
+
+        self._descendants[pid] = parent == self._root_pid
+
+        return self._descendants[pid]
+
+    def prune(self, pids):
+        """ Forget the processes that are not in `pids` anymore. """
+        pids = set(pids)
+
+        for pid in list(self._descendants):
+            if pid not in pids and pid != self._root_pid:
+                del self._descendants[pid]
+
+
+_PROCESS_TREES: dict[int, ProcessTree] = {}
+
+
+def get_worker_gpu_memory_used(name_filter="python", include_children=False):
     """
     Returns the GPU used memory per worker.
 
+    Parameters
+    ----------
+    name_filter : string, optional
+        Substring that the name of the worker process must contain to be
+        accounted. None or an empty string disables the filter
+        (default="python").
+    include_children : bool, optional
+        Sum the GPU used memory of every process that descends from the
+        worker, like MPI ranks or external CUDA binaries launched by tasks,
+        whatever their names (default=False).
+
     Returns
     -------
     integer
         The used memory in MiB.
     """
     processes = generate_gpu_proccesses()
+    pid = os.getpid()
+
+    def is_worker(process):
+        """ Check if the GPU process is the worker itself. """
+        return process.pid == pid and \
+            (not name_filter or name_filter in (process.name or ""))
 
+    if not include_children:
+        for process in processes:
+            if is_worker(process):
+                return int(process.memory_used)
+
+        return 0
+
+    tree = _PROCESS_TREES.get(pid)
+    if tree is None:
+        tree = _PROCESS_TREES[pid] = ProcessTree(pid)
+
+    tree.prune(process.pid for process in processes)
+
+    memory_used = 0
     for process in processes:
-        if process.pid == os.getpid() and "python" in process.name:
-            return int(process.memory_used)
+        if is_worker(process) or process.pid != pid and tree.contains(process.pid):
+            memory_used += process.memory_used
+
+    return int(memory_used)
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def get_host_memory_used():
+    """
+    Returns the host memory used by the worker.
+
+    The resident set size is read from `/proc/self/statm`, or from psutil
+    where there is no proc filesystem. The pinned memory is the host memory
+    held by the pinned memory pool of CuPy, only if CuPy was already
+    imported by a task.
+
+    Returns
+    -------
+    tuple
+        The resident set size and the pinned memory in MiB.
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as fp:
+            rss = int(fp.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        import psutil  # type: ignore[import-untyped]
+
+        rss = psutil.Process().memory_info().rss
+
+    pinned = 0
+    cupy = sys.modules.get("cupy")
+    if cupy is not None:
+        pool = cupy.get_default_pinned_memory_pool()
+        if hasattr(pool, "total_bytes"):
+            pinned = pool.total_bytes()
+
+    return rss / 2**20, pinned / 2**20
+
+
+def timed_sample(sampler, dask_worker=None, host_memory=False):
+    """
+    Run a sampler on the worker and measure how long it takes.
+
+    Parameters
+    ----------
+    sampler : callable
+        Function that returns the GPU used memory of the worker. It receives
+        the worker object if it accepts a `dask_worker` argument.
+    dask_worker : Worker, optional
+        Worker object injected by Dask.
+    host_memory : bool, optional
+        Also sample the `host_memory` and the `pinned_memory` of the worker
+        in MiB (default=False).
+
+    Returns
+    -------
+    dict
+        The sampled `memory`, the `elapsed` time of the sampling in seconds,
+        the `time` halfway through it in the `time.perf_counter()` clock of
+        the worker, the `clock` offset from that clock to its wall clock and
+        the `scheduler_delay` Dask added to the task timings of the worker.
+    """
+    kwargs = {}
+    if "dask_worker" in inspect.signature(sampler).parameters:
+        kwargs["dask_worker"] = dask_worker
+
+    start = perf_counter()
+    memory = sampler(**kwargs)
+    sample = {"memory": memory}
+
+    if host_memory:
+        sample["host_memory"], sample["pinned_memory"] = get_host_memory_used()
+
+    stop = perf_counter()
+
+    sample["elapsed"] = stop - start
+    sample["time"] = (start + stop) / 2
+    sample["clock"] = time() - stop
+    sample["scheduler_delay"] = getattr(dask_worker, "scheduler_delay", 0.0)
 
-    return 0
+    return sample
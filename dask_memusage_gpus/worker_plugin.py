@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+""" Worker plugin that samples the GPU used memory at task boundaries. """
+
+import logging
+
+from distributed.diagnostics.plugin import WorkerPlugin
+
+from dask_memusage_gpus import allocators
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import utils
+
+logger = logging.getLogger(__name__)
+
+
+class TaskSamplerWorkerPlugin(WorkerPlugin):
+    """
+    Task Boundaries Sampler Worker Plugin class
+
+    A sample is taken as soon as a task starts executing and as soon as it
+    finishes. Samples are sent through the worker batched stream before
+    the task-finished message, so the scheduler plugin always has them when
+    the task transitions to memory or erred.
+
+    Parameters
+    ----------
+    sampler : callable, optional
+        Function that fetches the GPU used memory of the worker
+        (default=`utils.get_worker_gpu_memory_used`).
+    allocator : string, optional
+        Read the counters of this allocator (one of `defs.ALLOCATORS`)
+        instead of running the sampler. The start sample is the memory
+        allocated when the task starts and the end sample is the peak
+        allocated while it was executing. If the allocator library is not
+        installed on the worker, the sampler is used (default=None).
+    host_memory : bool, optional
+        Sample the host memory of the worker together with the GPU used
+        memory (default=False).
+    """
+    name = "memusage-gpus-task-sampler"
+
+    def __init__(self, sampler=None, allocator=None, host_memory=False):
+        """ Constructor of the TaskSamplerWorkerPlugin class. """
+        self._sampler = sampler or utils.get_worker_gpu_memory_used
+        self._allocator = allocator
+        self._host_memory = host_memory
+        self._tracker = None
+        self._worker = None
+
+    def setup(self, worker):
+        """
+        Run when the plugin is attached to a worker.
+        """
+        self._worker = worker
+
+        if self._allocator is not None:
+            self._tracker = allocators.get_tracker(self._allocator)
+
+            if self._tracker is None:
+                logger.warning("Falling back to the sampler to fetch the GPU "
+                               "used memory.")
+
+    def _send(self, key, event, sampler):
+        """ Sample the GPU used memory and send it to the scheduler. """
+        try:
+            sample = utils.timed_sample(sampler, dask_worker=self._worker,
+                                        host_memory=self._host_memory)
+        except Exception as e:
+            logger.error(f"Failed to sample the GPU used memory: {e}")
+            return
+
+        self._worker.batched_stream.send({"op": defs.SAMPLE_STREAM_OP,
+                                          "key": key,
+                                          "event": event,
+                                          "sample": sample})
+
+    def transition(self, key, start, finish, **kwargs):
+        """
+        Transition function when a task changes its state on the worker.
+
+        Parameters
+        ----------
+        key: string
+            Identifier of the task.
+        start : string
+            Start state of the transition.
+        finish : string
+            Final state of the transition.
+        **kwargs : Any
+            More options passed when transitioning.
+        """
+        if self._worker is None:
+            return
+
+        if finish == "executing":
+            if self._tracker is None:
+                self._send(key, defs.TASK_START, self._sampler)
+            else:
+                self._tracker.reset_peak()
+                self._send(key, defs.TASK_START, self._tracker.current)
+        elif start in ("executing", "long-running") and finish != "long-running":
+            if self._tracker is None:
+                self._send(key, defs.TASK_END, self._sampler)
+            else:
+                self._send(key, defs.TASK_END, self._tracker.peak)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+
+""" Incremental writers of the record files. """
+
+import csv
+import logging
+import os
+import queue
+from threading import Thread
+from xml.sax.saxutils import escape
+
+from dask.utils import key_split
+
+from dask_memusage_gpus import definitions as defs
+
+logger = logging.getLogger(__name__)
+
+# Rows of an Excel worksheet, including the header
+EXCEL_MAX_ROWS = 1_048_576
+
+EXCEL_SHEET_NAME = "Dask GPUs"
+
+# Denormalized view of the SQLite records with the columns of the other types
+SQLITE_VIEW = "records_view"
+
+
+class RecordWriter:
+    """
+    Base class of the writers of record rows.
+
+    Parameters
+    ----------
+    path : string
+        Path of the record file.
+    columns : list
+        Names of the columns of the rows.
+    """
+    def __init__(self, path: str, columns: list):
+        """ Constructor of the RecordWriter class. """
+        self._path: str = path
+        self._columns: list = columns
+
+    def write(self, first: int, rows: list):
+        """
+        Append rows to the record file.
+
+        Parameters
+        ----------
+        first : int
+            Index of the first row.
+        rows : list
+            Tuples with the values of the columns.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Finalize the record file. """
+
+
+class CSVWriter(RecordWriter):
+    """ Append the rows in the layout of `DataFrame.to_csv()`. """
+    def write(self, first, rows):
+        """ Append rows to the record file. """
+        header: bool = not os.path.exists(self._path)
+
+        # Same layout as `DataFrame.to_csv()`, without loading pandas
+        with open(self._path, "a", newline="", encoding="utf-8") as fp:
+            writer = csv.writer(fp)
+
+            if header:
+                writer.writerow(["", *self._columns])
+
+            writer.writerows((first + i, *row) for i, row in enumerate(rows))
+
+
+class XMLWriter(RecordWriter):
+    """
+    Append the rows in the layout of `DataFrame.to_xml()`.
+
+    The closing tag of the root is written after every batch and
+    overwritten by the next one, so the file is always a valid document
+    and a batch costs the same no matter how many rows were written.
+    """
+    HEADER = b"<?xml version='1.0' encoding='utf-8'?>\n<data>\n"
+    FOOTER = b"</data>\n"
+
+    def __init__(self, path, columns):
+        """ Constructor of the XMLWriter class. """
+        super().__init__(path, columns)
+
+        self._fp = None
+        self._tags = [(f"    <{name}>", f"</{name}>\n") for name in ("index", *columns)]
+
+    def write(self, first, rows):
+        """ Append rows to the record file. """
+        if self._fp is None and first == 0:
+            self._fp = open(self._path, "wb")
+            self._fp.write(self.HEADER)
+        else:
+            if self._fp is None:
+                # Rows that came after the file was closed
+                self._fp = open(self._path, "r+b")
+
+            # Overwrite the closing tag of the previous batch
+            self._fp.seek(-len(self.FOOTER), os.SEEK_END)
+
+        elements = []
+        for i, row in enumerate(rows):
+            elements.append("  <row>\n")
+            for (start, end), value in zip(self._tags, (first + i, *row)):
+                elements.append(f"{start}{escape(str(value))}{end}")
+            elements.append("  </row>\n")
+
+        self._fp.write("".join(elements).encode("utf-8"))
+        self._fp.write(self.FOOTER)
+        self._fp.flush()
+
+    def close(self):
+        """ Close the record file. """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class ExcelWriter(RecordWriter):
+    """
+    Stream the rows into a write-only openpyxl workbook.
+
+    Rows are kept by openpyxl in temporary files instead of cells in
+    memory, and the workbook is only assembled when it is closed. A new
+    worksheet is started whenever one reaches `max_rows`.
+
+    Parameters
+    ----------
+    max_rows : int, optional
+        Rows of each worksheet, including the header
+        (default=`EXCEL_MAX_ROWS`).
+    """
+    def __init__(self, path, columns, max_rows: int = EXCEL_MAX_ROWS):
+        """ Constructor of the ExcelWriter class. """
+        super().__init__(path, columns)
+
+        self._max_rows: int = max_rows
+        self._workbook = None
+        self._sheet = None
+        self._sheet_rows: int = 0
+
+    def _new_sheet(self):
+        """ Start a new worksheet with the header. """
+        n_sheets = len(self._workbook.worksheets)
+        title = EXCEL_SHEET_NAME
+        if n_sheets:
+            title += f" {n_sheets + 1}"
+
+        self._sheet = self._workbook.create_sheet(title)
+        self._sheet.append([None, *self._columns])
+        self._sheet_rows = 1
+
+    def write(self, first, rows):
+        """ Append rows to the record file. """
+        if self._workbook is None:
+            from openpyxl import Workbook  # type: ignore[import-untyped]
+
+            self._workbook = Workbook(write_only=True)
+            self._new_sheet()
+
+        for i, row in enumerate(rows):
+            if self._sheet_rows >= self._max_rows:
+                self._new_sheet()
+
+            self._sheet.append([first + i, *row])
+            self._sheet_rows += 1
+
+    def close(self):
+        """ Save the workbook. """
+        if self._workbook is not None:
+            self._workbook.save(self._path)
+            self._workbook = None
+
+
+class SQLiteWriter(RecordWriter):
+    """
+    Insert the rows into a SQLite database from a background thread.
+
+    Task prefixes and workers are stored once in the `prefixes` and
+    `workers` tables and referenced by the `records` table, which is
+    indexed by (prefix, time) and (worker, time). `SQLITE_VIEW` joins
+    them back into the columns of the other record types.
+
+    The database is in WAL mode, so readers can query a live run while
+    the rows are written. The scheduler only queues the rows, and the
+    thread inserts all the queued batches at once with `executemany`.
+    """
+    def __init__(self, path, columns):
+        """ Constructor of the SQLiteWriter class. """
+        super().__init__(path, columns)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._failed: bool = False
+
+        self._key_index: int = columns.index("task_key")
+        self._worker_index: int = columns.index("worker_id")
+        self._prefix_ids: dict[str, int] = {}
+        self._worker_ids: dict[str, int] = {}
+
+        self._values = [f'"{name}"' for name in columns
+                        if name not in ("task_key", "worker_id")]
+        self._insert = (f"INSERT INTO records (task_key, prefix, worker, "
+                        f"{', '.join(self._values)}) "
+                        f"VALUES ({', '.join('?' * (len(self._values) + 3))})")
+
+    def _connect(self):
+        """ Open the database and create the tables. """
+        import sqlite3
+
+        select = ", ".join("workers.address AS worker_id" if name == "worker_id" else
+                           f'records."{name}"' for name in self._columns)
+
+        conn = sqlite3.connect(self._path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        # A single transaction, so readers never see a partial schema
+        conn.executescript(f"""
+            BEGIN;
+            CREATE TABLE IF NOT EXISTS prefixes (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE);
+            CREATE TABLE IF NOT EXISTS workers (
+                id INTEGER PRIMARY KEY,
+                address TEXT NOT NULL UNIQUE);
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                task_key TEXT NOT NULL,
+                prefix INTEGER NOT NULL REFERENCES prefixes(id),
+                worker INTEGER NOT NULL REFERENCES workers(id),
+                {", ".join(self._values)});
+            CREATE INDEX IF NOT EXISTS records_prefix_time ON records(prefix, time);
+            CREATE INDEX IF NOT EXISTS records_worker_time ON records(worker, time);
+            CREATE VIEW IF NOT EXISTS {SQLITE_VIEW} AS
+                SELECT {select}
+                FROM records JOIN workers ON records.worker = workers.id
+                ORDER BY records.id;
+            COMMIT;
+        """)
+
+        self._load_ids(conn)
+
+        return conn
+
+    def _load_ids(self, conn):
+        """ Load the ids of the prefixes and workers already stored. """
+        self._prefix_ids = dict(conn.execute("SELECT name, id FROM prefixes"))
+        self._worker_ids = dict(conn.execute("SELECT address, id FROM workers"))
+
+    def _id(self, conn, ids, table, column, value):
+        """ Id of a prefix or worker, inserting it if it is new. """
+        row_id = ids.get(value)
+        if row_id is None:
+            cursor = conn.execute(f"INSERT INTO {table} ({column}) VALUES (?)", (value,))
+            row_id = ids[value] = cursor.lastrowid
+
+        return row_id
+
+    def _insert_batches(self, conn, batches):
+        """ Insert several batches of rows in a single transaction. """
+        params = []
+        for rows in batches:
+            for row in rows:
+                key = str(row[self._key_index])
+                worker = str(row[self._worker_index])
+
+                params.append((key,
+                               self._id(conn, self._prefix_ids, "prefixes", "name",
+                                        key_split(key)),
+                               self._id(conn, self._worker_ids, "workers", "address",
+                                        worker),
+                               *(value for i, value in enumerate(row)
+                                 if i not in (self._key_index, self._worker_index))))
+
+        conn.executemany(self._insert, params)
+
+    def _run(self):
+        """ Insert the queued rows until the writer is closed. """
+        import sqlite3
+
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            logger.exception("Failed to open the GPU memory records '%s'.", self._path)
+
+            # Nothing drains the queue anymore, so the later rows are dropped
+            self._failed = True
+            self._drop_queued()
+            return
+
+        try:
+            done = False
+            while not done:
+                batches = [self._queue.get()]
+
+                # Merge the batches queued meanwhile into one transaction
+                while batches[-1] is not None:
+                    try:
+                        batches.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if batches[-1] is None:
+                    batches.pop()
+                    done = True
+
+                try:
+                    with conn:
+                        self._insert_batches(conn, batches)
+                except sqlite3.Error:
+                    logger.exception("Failed to insert GPU memory records into '%s'.",
+                                     self._path)
+
+                    # The ids inserted in the failed transaction were rolled back
+                    self._load_ids(conn)
+        finally:
+            conn.close()
+
+    def _drop_queued(self):
+        """ Drop the rows queued for a database that failed to open. """
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def write(self, first, rows):
+        """ Queue rows to be inserted by the background thread. """
+        if self._failed:
+            logger.debug("Dropping %d GPU memory records of '%s'.", len(rows), self._path)
+            return
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="memusage-gpus-sqlite",
+                                  daemon=True)
+            self._thread.start()
+
+        self._queue.put(rows)
+
+    def close(self):
+        """ Insert the queued rows and close the database. """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+            # The end mark is left behind if the thread failed before it
+            if self._failed:
+                self._drop_queued()
+
+
+class DataFrameWriter(RecordWriter):
+    """ Rewrite the whole record file with pandas at every batch. """
+    def __init__(self, path, columns, filetype):
+        """ Constructor of the DataFrameWriter class. """
+        super().__init__(path, columns)
+
+        self._filetype: str = filetype
+        self._record_df = None
+
+    def write(self, first, rows):
+        """ Append rows to the record file. """
+        import pandas as pd
+
+        new_rows = pd.DataFrame(dict(zip(self._columns, zip(*rows))),
+                                index=pd.RangeIndex(first, first + len(rows)))
+
+        # XXX: Only CSV has the option to append
+        if self._record_df is None:
+            self._record_df = new_rows
+        else:
+            self._record_df = pd.concat([self._record_df, new_rows], axis=0)
+
+        if self._filetype == defs.PARQUET:
+            self._record_df.to_parquet(self._path)
+        elif self._filetype == defs.JSON:
+            self._record_df.to_json(self._path)
+
+
+def open_writer(filetype: str, path: str, columns: list) -> RecordWriter:
+    """
+    Writer of a record type.
+
+    Parameters
+    ----------
+    filetype : string
+        One of `defs.FILE_TYPES`.
+    path : string
+        Path of the record file.
+    columns : list
+        Names of the columns of the rows.
+
+    Returns
+    -------
+    RecordWriter
+        The writer of the record file.
+
+    Raises
+    ------
+    FileTypeException
+        If the filetype is not supported.
+    """
+    if filetype == defs.CSV:
+        return CSVWriter(path, columns)
+
+    if filetype == defs.XML:
+        return XMLWriter(path, columns)
+
+    if filetype == defs.EXCEL:
+        return ExcelWriter(path, columns)
+
+    if filetype == defs.SQLITE:
+        return SQLiteWriter(path, columns)
+
+    if filetype in (defs.PARQUET, defs.JSON):
+        return DataFrameWriter(path, columns, filetype)
+
+    raise defs.FileTypeException(f"Filetype '{filetype}' is not supported.")
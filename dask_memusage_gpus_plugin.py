@@ -2,6 +2,8 @@
 
 """ Scheduler Plugin Base Module. """
 
+from functools import partial
+
 import click
 from distributed.scheduler import Scheduler
 
@@ -12,15 +14,44 @@ from dask_memusage_gpus import plugin, utils
 @click.command()
 @click.option("--memusage-gpus-path", default=defs.DEFAULT_DATA_FILE)
 @click.option("--memusage-gpus-record-type", default=defs.CSV)
-@click.option("--memusage-gpus-interval", default=1)
+@click.option("--memusage-gpus-interval", default=1.0)
 @click.option("--memusage-gpus-max", is_flag=True)
 @click.option("--memusage-gpus-run-on-client", is_flag=True)
+@click.option("--memusage-gpus-idle-interval", type=float, default=None)
+@click.option("--memusage-gpus-batch-size", default=1)
+@click.option("--memusage-gpus-sampler", type=str, default=None)
+@click.option("--memusage-gpus-event-sampling", is_flag=True)
+@click.option("--memusage-gpus-allocator", type=click.Choice(defs.ALLOCATORS),
+              default=None)
+@click.option("--memusage-gpus-process-name", type=str, default="python")
+@click.option("--memusage-gpus-process-tree", is_flag=True)
+@click.option("--memusage-gpus-host-memory", is_flag=True)
+@click.option("--memusage-gpus-run-id", type=str, default=None)
+@click.option("--memusage-gpus-in-process", is_flag=True)
+@click.option("--memusage-gpus-dashboard", is_flag=True)
+@click.option("--memusage-gpus-forensics-window", type=float, default=None)
+@click.option("--memusage-gpus-memory-model", is_flag=True)
+@click.option("--memusage-gpus-timestamps", is_flag=True)
 def dask_setup(scheduler: Scheduler,
                memusage_gpus_path: str,
                memusage_gpus_record_type: str,
-               memusage_gpus_interval: int,
+               memusage_gpus_interval: float,
                memusage_gpus_max: bool,
-               memusage_gpus_run_on_client: bool):
+               memusage_gpus_run_on_client: bool,
+               memusage_gpus_idle_interval: float,
+               memusage_gpus_batch_size: int,
+               memusage_gpus_sampler: str,
+               memusage_gpus_event_sampling: bool,
+               memusage_gpus_allocator: str,
+               memusage_gpus_process_name: str,
+               memusage_gpus_process_tree: bool,
+               memusage_gpus_host_memory: bool,
+               memusage_gpus_run_id: str,
+               memusage_gpus_in_process: bool,
+               memusage_gpus_dashboard: bool,
+               memusage_gpus_forensics_window: float,
+               memusage_gpus_memory_model: bool,
+               memusage_gpus_timestamps: bool):
     """
     Setup Dask Scheduler Plugin.
 
@@ -31,22 +62,83 @@ def dask_setup(scheduler: Scheduler,
     memusage_gpus_path : string
         Path of the record file.
     memusage_gpus_record_type : string
-        Type of the record file. It can be CSV, PARQUET, JSON, XML or EXCEL
+        Type of the record file. It can be CSV, PARQUET, JSON, XML, EXCEL or
+        SQLITE
         (default=CSV).
-    memusage_gpus_interval : int
+    memusage_gpus_interval : float
         Interval of the time to fetch the GPU used memory by the plugin
         daemon in seconds (default=1).
     memusage_gpus_max : bool
         Run plugin collection maximum memory usage.
     memusage_gpus_run_on_client : bool
         Run plugin only when a client connects.
+    memusage_gpus_idle_interval : float
+        Poll only workers with tasks in processing and poll idle workers
+        once every this interval in seconds (default=None, poll all workers).
+    memusage_gpus_batch_size : int
+        Number of finished tasks written together into the record file
+        (default=1).
+    memusage_gpus_sampler : string
+        Dotted path of the function executed on each worker to fetch its GPU
+        used memory (default=None, use `nvidia-smi`).
+    memusage_gpus_event_sampling : bool
+        Sample when tasks start and finish on workers and poll periodically
+        only the tasks that run for longer than the interval.
+    memusage_gpus_allocator : string
+        Track the per-task peak allocated by RMM or CuPy on the workers
+        instead of polling `nvidia-smi` (default=None).
+    memusage_gpus_process_name : string
+        Substring of the name of the worker processes in `nvidia-smi`. An
+        empty string accounts any name (default="python").
+    memusage_gpus_process_tree : bool
+        Also account the GPU memory used by the processes spawned by the
+        workers.
+    memusage_gpus_host_memory : bool
+        Also record the host and pinned memory used by the workers.
+    memusage_gpus_run_id : string
+        Identifier of the run in the metadata file written next to the
+        record file (default=None, a random one).
+    memusage_gpus_in_process : bool
+        Poll the workers from the scheduler event loop instead of a thread
+        with a loopback client.
+    memusage_gpus_dashboard : bool
+        Add a live GPU memory page to the Dask dashboard. It requires Bokeh.
+    memusage_gpus_forensics_window : float
+        Write the samples of the last this many seconds of the worker of
+        each erred task into `<path>.forensics.jsonl` (default=None).
+    memusage_gpus_memory_model : bool
+        Record the input bytes of each task and fit a model of the peak of
+        each task prefix over them to advise chunk sizes.
+    memusage_gpus_timestamps : bool
+        Record the time of the peak and the compute window of each task,
+        aligned to the scheduler clock.
     """
     utils.validate_file_type(memusage_gpus_record_type.lower())
 
-    memory_plugin = plugin.MemoryUsageGPUsPlugin(scheduler,
-                                                 memusage_gpus_path,
-                                                 memusage_gpus_record_type,
-                                                 memusage_gpus_interval,
-                                                 memusage_gpus_max,
-                                                 memusage_gpus_run_on_client)
+    if memusage_gpus_sampler:
+        sampler = utils.load_sampler(memusage_gpus_sampler)
+    else:
+        sampler = partial(utils.get_worker_gpu_memory_used,
+                          name_filter=memusage_gpus_process_name,
+                          include_children=memusage_gpus_process_tree)
+
+    memory_plugin = plugin.MemoryUsageGPUsPlugin(
+        scheduler,
+        memusage_gpus_path,
+        memusage_gpus_record_type,
+        memusage_gpus_interval,
+        memusage_gpus_max,
+        memusage_gpus_run_on_client,
+        sampler=sampler,
+        idle_interval=memusage_gpus_idle_interval,
+        batch_size=memusage_gpus_batch_size,
+        event_sampling=memusage_gpus_event_sampling,
+        allocator=memusage_gpus_allocator,
+        host_memory=memusage_gpus_host_memory,
+        run_id=memusage_gpus_run_id,
+        in_process=memusage_gpus_in_process,
+        dashboard=memusage_gpus_dashboard,
+        forensics_window=memusage_gpus_forensics_window,
+        memory_model=memusage_gpus_memory_model,
+        timestamps=memusage_gpus_timestamps)
     scheduler.add_plugin(memory_plugin)
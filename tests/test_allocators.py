@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside allocators submodule. """
+
+import sys
+import unittest
+from types import SimpleNamespace
+
+from mock import patch
+
+from dask_memusage_gpus import allocators
+from dask_memusage_gpus import definitions as defs
+
+MIB = 2**20
+
+
+class FakeAllocator:
+    """ Pure-Python allocator with the allocator API of `cupy.cuda`. """
+    def __init__(self):
+        """ Constructor of the FakeAllocator class. """
+        self.allocator = self.malloc
+        self.allocated = 0
+
+    def malloc(self, size):
+        """ Allocate `size` bytes. """
+        self.allocated += size
+        return size
+
+    def get_allocator(self):
+        """ Current allocator. """
+        return self.allocator
+
+    def set_allocator(self, allocator):
+        """ Install an allocator. """
+        self.allocator = allocator
+
+    def tracker(self):
+        """ CuPy tracker of this allocator. """
+        return allocators.CuPyTracker(self.get_allocator, self.set_allocator,
+                                      FakePointer)
+
+
+class FakePointer:
+    """ Pointer returned to CuPy by the tracker. """
+    def __init__(self, pointer, size, release):
+        """ Constructor of the FakePointer class. """
+        self.pointer = pointer
+        self.size = size
+        self.release = release
+
+    def free(self):
+        """ Free the memory, as CuPy does when the pointer is collected. """
+        self.release()
+
+
+class FakeStatistics:
+    """ Pure-Python allocator with the API of `rmm.statistics`. """
+    def __init__(self):
+        """ Constructor of the FakeStatistics class. """
+        self.enabled = False
+        self.stack = [[0, 0]]
+
+    def enable_statistics(self):
+        """ Enable the statistics. """
+        self.enabled = True
+
+    def malloc(self, size):
+        """ Allocate `size` bytes in every scope. """
+        for counters in self.stack:
+            counters[0] += size
+            counters[1] = max(counters[1], counters[0])
+
+    def free(self, size):
+        """ Free `size` bytes in every scope. """
+        for counters in self.stack:
+            counters[0] -= size
+
+    def get_statistics(self):
+        """ Counters of the current scope. """
+        current, peak = self.stack[-1]
+        return SimpleNamespace(current_bytes=current, peak_bytes=peak)
+
+    def push_statistics(self):
+        """ Start a new scope. """
+        self.stack.append([0, 0])
+
+    def pop_statistics(self):
+        """ Close the current scope. """
+        current, peak = self.stack.pop()
+        return SimpleNamespace(current_bytes=current, peak_bytes=peak)
+
+
+class TestAllocators(unittest.TestCase):
+    """ Test class for allocators submodule. """
+    def test_cupy_tracker(self):
+        """ Test the per-task peak of the CuPy tracker. """
+        allocator = FakeAllocator()
+
+        tracker = allocator.tracker()
+
+        # The installed allocator is wrapped, not replaced by a pool
+        malloc = allocator.get_allocator()
+
+        malloc(100 * MIB).free()
+        pointer = malloc(10 * MIB)
+
+        self.assertEqual(allocator.allocated, 110 * MIB)
+        self.assertEqual(pointer.pointer, 10 * MIB)
+        self.assertEqual(tracker.peak(), 100)
+
+        tracker.reset_peak()
+
+        self.assertEqual(tracker.current(), 10)
+        self.assertEqual(tracker.peak(), 10)
+
+        malloc(30 * MIB).free()
+
+        self.assertEqual(tracker.current(), 10)
+        self.assertEqual(tracker.peak(), 40)
+
+    def test_cupy_tracker_replaced(self):
+        """ Test that an allocator installed by a task is wrapped in turn. """
+        allocator = FakeAllocator()
+
+        tracker = allocator.tracker()
+
+        other = FakeAllocator()
+        allocator.set_allocator(other.malloc)
+
+        with self.assertLogs(allocators.logger, "WARNING"):
+            tracker.reset_peak()
+
+        allocator.get_allocator()(20 * MIB)
+
+        self.assertEqual(other.allocated, 20 * MIB)
+        self.assertEqual(tracker.current(), 20)
+        self.assertEqual(tracker.peak(), 20)
+
+    def test_rmm_tracker(self):
+        """ Test the per-task peak of the RMM tracker. """
+        statistics = FakeStatistics()
+
+        tracker = allocators.RMMTracker(statistics)
+
+        self.assertTrue(statistics.enabled)
+
+        statistics.malloc(100 * MIB)
+        statistics.free(90 * MIB)
+
+        tracker.reset_peak()
+
+        self.assertEqual(tracker.current(), 10)
+        self.assertEqual(tracker.peak(), 10)
+
+        statistics.malloc(50 * MIB)
+        statistics.free(50 * MIB)
+
+        self.assertEqual(tracker.peak(), 60)
+
+        # The scope of the previous task is closed on the next reset
+        tracker.reset_peak()
+
+        self.assertEqual(len(statistics.stack), 2)
+        self.assertEqual(tracker.current(), 10)
+        self.assertEqual(tracker.peak(), 10)
+
+    def test_get_tracker(self):
+        """ Test creating trackers with and without their libraries. """
+        with self.assertRaises(defs.AllocatorException):
+            allocators.get_tracker("foo")
+
+        with patch.dict(sys.modules, {"cupy": None, "rmm": None, "rmm.statistics": None}):
+            self.assertIsNone(allocators.get_tracker("cupy"))
+            self.assertIsNone(allocators.get_tracker("rmm"))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside analysis submodule. """
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from dask.utils import key_split
+from parameterized import parameterized
+
+from dask_memusage_gpus import analysis
+
+
+class TestAnalysis(unittest.TestCase):
+    """ Test class for analysis submodule. """
+    def test_task_prefixes(self):
+        """ Test the vectorized prefixes match key_split. """
+        keys = ["('make_blobs-3a9c', 0)", "('make_blobs-3a9c', 1)", "sum-aggregate-77f1",
+                "hello-world-1", "x-abcdefab", "x-abcdefgh", "('x', 1)", "_(x)",
+                "a-b-c-d-e-f-1", "ae05086432ca935f6eba409a8ecd4896", "", "-x", ",b-c"]
+
+        prefixes = analysis.task_prefixes(pd.Series(keys))
+
+        self.assertEqual(list(prefixes), [key_split(key) for key in keys])
+        self.assertEqual(prefixes.dtype, "category")
+        self.assertEqual(len(analysis.task_prefixes(pd.Series([], dtype=str))), 0)
+
+    def test_task_durations(self):
+        """ Test inferring durations from the completions per worker. """
+        df = pd.DataFrame({"time": [3.0, 1.0, 2.0, 5.0, 4.0],
+                           "worker_id": ["a", "b", "a", "b", "a"]})
+
+        np.testing.assert_array_equal(analysis.task_durations(df),
+                                      [1.0, np.nan, np.nan, 4.0, 1.0])
+
+        df["duration"] = 0.5
+
+        np.testing.assert_array_equal(analysis.task_durations(df), [0.5] * 5)
+
+    def test_coverage(self):
+        """ Test the expected coverage of sampling intervals. """
+        durations = [0.5, 1.0, 2.0, np.nan]
+
+        np.testing.assert_allclose(analysis.coverage(durations, [0.5, 1.0, 4.0]),
+                                   [1.0, 5 / 6, 0.875 / 3])
+
+    def test_recommend_interval(self):
+        """ Test the largest interval that reaches the target coverage. """
+        self.assertAlmostEqual(analysis.recommend_interval([1.0, 1.0, 1.0], 0.95),
+                               1 / 0.95)
+        self.assertTrue(np.isnan(analysis.recommend_interval([np.nan])))
+
+        durations = np.random.default_rng(0).exponential(1.0, 1000)
+        interval = analysis.recommend_interval(durations, 0.9)
+
+        self.assertAlmostEqual(np.mean(np.minimum(1, durations / interval)), 0.9)
+        self.assertLess(analysis.coverage(durations, interval * 1.01)[0], 0.9)
+
+    def test_miss_report(self):
+        """ Test the miss rate and durations per prefix. """
+        df = pd.DataFrame({"task_key": ["a-1", "a-2", "a-3", "b-1", "b-2"],
+                           "time": [1.0, 2.0, 4.0, 1.5, 1.6],
+                           "max_gpu_memory_mb": [10, -1, -1, 10, 10],
+                           "worker_id": ["w1", "w1", "w1", "w2", "w2"]})
+
+        report = analysis.miss_report(df, interval=1.0)
+
+        self.assertEqual(list(report.index), ["a", "b"])
+        self.assertEqual(list(report.tasks), [3, 2])
+        self.assertEqual(list(report.misses), [2, 0])
+        self.assertAlmostEqual(report.loc["a", "p50"], 1.5)
+        self.assertAlmostEqual(report.loc["a", "coverage"], 1.0)
+        self.assertAlmostEqual(report.loc["b", "shorter_than_interval"], 1.0)
+        self.assertAlmostEqual(report.loc["b", "recommended_interval"], 0.1 / 0.95)
+
+    @parameterized.expand([
+        ("minmax", analysis.minmax_downsample),
+        ("lttb", analysis.lttb_downsample),
+    ])
+    def test_downsample(self, name, downsampler):
+        """ Test the points kept by the downsamplers. """
+        rng = np.random.default_rng(0)
+        x = np.arange(10_000) * 0.1
+        y = rng.normal(1000, 10, len(x))
+        y[4321] = 5000
+
+        for n_points in (4, 5, 100, 2000):
+            indices = downsampler(x, y, n_points)
+
+            self.assertLessEqual(len(indices), n_points)
+            self.assertTrue((np.diff(indices) > 0).all())
+            self.assertEqual(indices[0], 0)
+            self.assertEqual(indices[-1], len(y) - 1)
+            self.assertIn(4321, indices)
+
+        # Short series are kept whole
+        np.testing.assert_array_equal(downsampler(x[:10], y[:10], 100), np.arange(10))
+
+    def test_minmax_downsample_bins(self):
+        """ Test that the minmax downsampler keeps the extremes of each bin. """
+        y = np.array([5, 1, 9, 5, 5, 2, 8, 5, 5, 3])
+
+        np.testing.assert_array_equal(analysis.minmax_downsample(None, y, 6),
+                                      [0, 1, 2, 5, 6, 9])
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+""" Test the command line tools. """
+
+import json
+import os
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from dask_memusage_gpus import cli
+from tests.test_summary import RECORDS
+
+
+class TestCLI(unittest.TestCase):
+    """ Test class for cli submodule. """
+    def setUp(self):
+        """ Setup test method. """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "memusage")
+
+        RECORDS.to_csv(self.path)
+
+    def tearDown(self):
+        """ Tear down the test class. """
+        self.tmpdir.cleanup()
+
+    def test_report(self):
+        """ Test the report subcommand. """
+        runner = CliRunner()
+
+        result = runner.invoke(cli.main, ["report", self.path, "--chunksize", "2"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("## Task prefixes", result.output)
+
+        output = os.path.join(self.tmpdir.name, "report.json")
+        result = runner.invoke(cli.main, ["report", self.path, "--format", "json",
+                                          "--top", "1", "-o", output])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(output, encoding="utf-8") as fp:
+            self.assertEqual(len(json.load(fp)["heaviest"]), 1)
+
+    def test_report_memory_model(self):
+        """ Test the report of records with the input bytes of the tasks. """
+        RECORDS.assign(input_nbytes=RECORDS.max_gpu_memory_mb * 2 ** 20).to_csv(self.path)
+
+        with open(self.path + ".meta.json", "w", encoding="utf-8") as fp:
+            json.dump({"run_id": "run",
+                       "config": {"columns": [*RECORDS.columns, "input_nbytes"]}}, fp)
+
+        result = CliRunner().invoke(cli.main, ["report", self.path, "--format", "json",
+                                               "--gpu-memory", "1024",
+                                               "--min-tasks", "3"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        model = json.loads(result.output)["model"]
+
+        self.assertEqual(model["make_blobs"]["tasks"], 3)
+        self.assertAlmostEqual(model["make_blobs"]["slope"], 1)
+        self.assertAlmostEqual(model["make_blobs"]["max_input_mb"], 1024, delta=1)
+
+        result = CliRunner().invoke(cli.main, ["report", self.path])
+
+        self.assertIn("## Memory model", result.output)
+
+    def test_compare(self):
+        """ Test the compare subcommand. """
+        regressed = os.path.join(self.tmpdir.name, "regressed")
+        RECORDS.assign(max_gpu_memory_mb=RECORDS.max_gpu_memory_mb * 2).to_csv(regressed)
+
+        runner = CliRunner()
+
+        result = runner.invoke(cli.main, ["compare", self.path, self.path,
+                                          "--fail-on-regression"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("## Changes", result.output)
+
+        result = runner.invoke(cli.main, ["compare", self.path, regressed,
+                                          "--min-tasks", "2", "--alpha", "0.5",
+                                          "--format", "json", "--fail-on-regression"])
+
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertEqual(json.loads(result.output)["runs"][1]["run"], regressed)
+
+    def test_analyze(self):
+        """ Test the analyze subcommand. """
+        result = CliRunner().invoke(cli.main, ["analyze", self.path,
+                                               "--interval", "0.5", "--target", "0.9"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("make_blobs", result.output)
+        self.assertIn("6 tasks, 16.7% missed.", result.output)
+        self.assertIn("Expected coverage of the 0.5 s interval", result.output)
+        self.assertIn("Interval to sample 90% of the tasks", result.output)
+
+    def test_report_missing_file(self):
+        """ Test the report of a file that does not exist. """
+        result = CliRunner().invoke(cli.main, ["report", self.path + ".missing"])
+
+        self.assertNotEqual(result.exit_code, 0)
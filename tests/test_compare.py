@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside compare submodule. """
+
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dask_memusage_gpus import compare, summary
+
+
+def make_run(label, peaks, chunksize=None):
+    """ Aggregate the peaks of each prefix as a run. """
+    records = pd.DataFrame([(f"('{prefix}-{i:x}', {i})", peak)
+                            for prefix, values in peaks.items()
+                            for i, peak in enumerate(values)],
+                           columns=["task_key", "max_gpu_memory_mb"])
+
+    run = compare.RunStats(label)
+    chunksize = chunksize or len(records)
+    for start in range(0, len(records), chunksize):
+        run.add(records.iloc[start:start + chunksize])
+
+    return run
+
+
+class TestCompare(unittest.TestCase):
+    """ Test class for compare submodule. """
+    def test_run_stats(self):
+        """ Test the streaming mean and variance match a single pass. """
+        peaks = np.random.default_rng(0).normal(1000, 50, 100)
+
+        run = make_run("a", {"make_blobs": list(peaks) + [-1]}, chunksize=7)
+        stats = run.prefixes["make_blobs"]
+
+        self.assertEqual(run.n_missed, 1)
+        self.assertEqual(stats.count, 100)
+        self.assertAlmostEqual(stats.mean, peaks.mean())
+        self.assertAlmostEqual(stats.variance, peaks.var(ddof=1))
+        self.assertEqual(stats.peak, peaks.max())
+
+    def test_welch_test(self):
+        """ Test the t statistic and its p-value. """
+        baseline = make_run("a", {"x": [1, 2, 3, 4]}).prefixes["x"]
+        candidate = make_run("b", {"x": [2, 3, 4, 5]}).prefixes["x"]
+
+        t, p_value = compare.welch_test(baseline, candidate)
+
+        self.assertAlmostEqual(t, 1 / np.sqrt(2 * (5 / 3) / 4))
+        self.assertAlmostEqual(p_value, 0.3153, places=4)
+        self.assertEqual(compare.welch_test(baseline, baseline), (0.0, 1.0))
+
+    def test_welch_test_small_samples(self):
+        """ Test the Student's t p-value of a few tasks per run. """
+        baseline = make_run("a", {"x": [1, 2, 3, 4, 5]}).prefixes["x"]
+        candidate = make_run("b", {"x": [3.9, 4.9, 5.9, 6.9, 7.9]}).prefixes["x"]
+
+        t, p_value = compare.welch_test(baseline, candidate)
+
+        # With 8 degrees of freedom, not the 0.0037 of the normal distribution
+        self.assertAlmostEqual(t, 2.9)
+        self.assertAlmostEqual(p_value, 0.01989, places=5)
+
+        # Unequal variances and counts, about 6 degrees of freedom
+        baseline = make_run("a", {"x": [10, 12, 9, 11]}).prefixes["x"]
+        candidate = make_run("b", {"x": [14, 20, 11, 18, 25, 16]}).prefixes["x"]
+
+        _, p_value = compare.welch_test(baseline, candidate)
+
+        self.assertAlmostEqual(p_value, 0.01728, places=5)
+
+    def test_compare_runs(self):
+        """ Test flagging the prefixes whose peak changed. """
+        rng = np.random.default_rng(0)
+
+        def peaks(mean):
+            """ Noisy peaks around a mean. """
+            return list(rng.normal(mean, 10, 50))
+
+        runs = [make_run("base", {"make_blobs": peaks(1000), "sum": peaks(200),
+                                  "getitem": peaks(10)}),
+                make_run("next", {"make_blobs": peaks(1000), "sum": peaks(300),
+                                  "astype": peaks(10)}),
+                make_run("fix", {"make_blobs": peaks(900), "sum": peaks(200),
+                                 "getitem": peaks(10)})]
+
+        result = compare.compare_runs(runs)
+        status = result.set_index(["run", "prefix"])["status"]
+
+        self.assertEqual(status["next", "sum"], compare.REGRESSION)
+        self.assertEqual(status["next", "make_blobs"], compare.UNCHANGED)
+        self.assertEqual(status["next", "astype"], compare.NEW)
+        self.assertEqual(status["next", "getitem"], compare.REMOVED)
+        self.assertEqual(status["fix", "make_blobs"], compare.IMPROVEMENT)
+        self.assertEqual(status["fix", "sum"], compare.UNCHANGED)
+
+        # Large relative changes only
+        result = compare.compare_runs(runs, min_change=0.5)
+
+        self.assertNotIn(compare.REGRESSION, set(result["status"]))
+
+    def test_render(self):
+        """ Test rendering a comparison. """
+        runs = [make_run("base", {"sum": [1, 2, 3, 4, 5]}),
+                make_run("next", {"sum": [11, 12, 13, 14, 15]})]
+        result = compare.compare_runs(runs)
+
+        rendered = json.loads(compare.render(runs, result, summary.JSON))
+
+        self.assertEqual(rendered["baseline"], "base")
+        self.assertIn("| next | sum |", compare.render(runs, result))
+        self.assertIn("<h2>Changes</h2>", compare.render(runs, result, summary.HTML))
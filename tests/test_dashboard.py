@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside dashboard submodule. """
+
+import os
+import tempfile
+import time
+import unittest
+import urllib.request
+
+from mock import Mock, patch
+
+try:
+    import bokeh  # noqa: F401
+
+    BOKEH_SUPPORT = True
+except ImportError:
+    BOKEH_SUPPORT = False
+
+from distributed import Client, LocalCluster
+
+from dask_memusage_gpus import dashboard, plugin
+
+
+def constant_sampler():
+    """Fake sampler with a constant value."""
+    return 100
+
+
+class TestDashboard(unittest.TestCase):
+    """ Test class for dashboard submodule. """
+    def test_feed_segments(self):
+        """ Test pulling only the new segments of the timelines. """
+        feed = dashboard.MemoryFeed(rollover=3)
+
+        for memory in (100, 200, 300):
+            feed.add_sample('w1', memory)
+        feed.add_sample('w2', 50)
+
+        sequence, segments = feed.segments_since(0)
+
+        self.assertEqual(sequence, 2)
+        self.assertEqual([(y0, y1, worker) for _, y0, _, y1, worker, _ in segments],
+                         [(100, 200, 'w1'), (200, 300, 'w1')])
+        self.assertEqual(feed.segments_since(sequence), (2, []))
+
+        feed.remove_worker('w1')
+        for memory in (400, 500, 600, 700):
+            feed.add_sample('w1', memory)
+
+        # Segments dropped by the rollover are skipped
+        sequence, segments = feed.segments_since(sequence)
+
+        self.assertEqual(sequence, 5)
+        self.assertEqual([(y0, y1) for _, y0, _, y1, _, _ in segments],
+                         [(400, 500), (500, 600), (600, 700)])
+
+    def test_feed_prefixes(self):
+        """ Test pulling only the changed prefixes. """
+        feed = dashboard.MemoryFeed()
+
+        feed.add_task("('make_blobs-3a9c', 0)", 100)
+        feed.add_task("sum-77f1", -1)
+
+        version, changed = feed.prefixes_since(0)
+
+        self.assertEqual(changed, [('make_blobs', 1, 0, 100), ('sum', 1, 1, -1)])
+
+        feed.add_task("('make_blobs-3a9c', 1)", 300)
+
+        self.assertEqual(feed.prefixes_since(version), (3, [('make_blobs', 2, 0, 300)]))
+
+    def test_page_update(self):
+        """ Test the page streams and patches only the changes. """
+        if not BOKEH_SUPPORT:
+            raise unittest.SkipTest("Bokeh is not installed.")
+
+        feed = dashboard.MemoryFeed()
+        page = dashboard.MemoryPage(feed)
+
+        for memory in (100, 200, 300):
+            feed.add_sample('w1', memory)
+        feed.add_task("sum-1", 100)
+
+        page.update()
+
+        self.assertEqual(page.segments.data['y1'], [200, 300])
+        self.assertEqual(page.prefixes.data['peak'], [100])
+
+        feed.add_sample('w1', 400)
+        feed.add_task("sum-2", 400)
+        feed.add_task("getitem-1", 10)
+
+        source = type(page.segments)
+
+        with patch.object(source, 'stream', autospec=True,
+                          side_effect=source.stream) as stream, \
+                patch.object(source, 'patch', autospec=True,
+                             side_effect=source.patch) as patch_rows:
+            page.update()
+
+        # Only the new segment and the changed prefix are sent
+        self.assertEqual(stream.call_args_list[0].args[1]['y1'], [400])
+        self.assertEqual(stream.call_args_list[1].args[1]['prefix'], ['getitem'])
+        patch_rows.assert_called_once_with(page.prefixes, {'tasks': [(0, 2)],
+                                                           'missed': [(0, 0)],
+                                                           'peak': [(0, 400)]})
+        self.assertEqual(page.segments.data['y1'], [200, 300, 400])
+        self.assertEqual(page.prefixes.data['prefix'], ['sum', 'getitem'])
+
+    def test_register_without_http_server(self):
+        """ Test the page is skipped without a dashboard. """
+        self.assertIsNone(dashboard.register(object(), dashboard.MemoryFeed()))
+
+    def test_register_without_bokeh(self):
+        """ Test the page is skipped without Bokeh. """
+        scheduler = Mock(http_application=Mock(applications=[]))
+
+        with patch.dict('sys.modules', {'distributed.dashboard.core': None}):
+            self.assertIsNone(dashboard.register(scheduler, dashboard.MemoryFeed()))
+
+        scheduler.http_application.add_application.assert_not_called()
+
+    def test_plugin_dashboard(self):
+        """ Test serving the page from the scheduler of a LocalCluster. """
+        if not BOKEH_SUPPORT:
+            raise unittest.SkipTest("Bokeh is not installed.")
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                             dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            path = os.path.join(tmpdir, "memusage")
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=path,
+                                                       filetype='csv',
+                                                       interval=0.1,
+                                                       mem_max=False,
+                                                       run_on_client=False,
+                                                       sampler=constant_sampler,
+                                                       in_process=True,
+                                                       dashboard=True)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+            cluster.sync(dask_plugin.start, cluster.scheduler)
+
+            client.gather(client.map(time.sleep, [0.3] * 2, pure=False))
+
+            self.assertEqual(dask_plugin._dashboard_route, dashboard.ROUTE)
+            self.assertGreater(dask_plugin._feed.segments_since(0)[0], 0)
+
+            port = cluster.scheduler.http_server.port
+            url = f"http://localhost:{port}{dashboard.ROUTE}"
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn(b"bokeh", response.read())
+
+            cluster.sync(dask_plugin.before_close)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+""" Test the startup cost and the options of the preload module. """
+
+import subprocess
+import sys
+import unittest
+
+from mock import Mock, patch
+
+import dask_memusage_gpus_plugin
+
+# Milliseconds spent importing the preload module once Dask is loaded
+IMPORT_TIME_BUDGET_MS = 200
+
+# Modules that are only needed when a record is written
+LAZY_MODULES = ["pandas", "pyarrow", "openpyxl", "lxml", "sqlite3"]
+
+
+class TestPreloadImport(unittest.TestCase):
+    """ Test class for the import of dask_memusage_gpus_plugin. """
+    def import_preload(self):
+        """
+        Import the preload module in a new interpreter.
+
+        Returns
+        -------
+        tuple
+            Cumulative import time of the preload module in milliseconds and
+            the names of the modules loaded.
+        """
+        code = ("import sys, distributed.scheduler, click; "
+                "import dask_memusage_gpus_plugin; "
+                "print(','.join(sys.modules))")
+
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              capture_output=True, text=True, check=True)
+
+        cumulative = None
+        for line in proc.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "dask_memusage_gpus_plugin":
+                cumulative = int(fields[1]) / 1000
+
+        return cumulative, proc.stdout.strip().split(",")
+
+    def test_import_time_budget(self):
+        """ Test the preload module is imported within the budget. """
+        # The first run may also compile the bytecode
+        self.import_preload()
+
+        elapsed, _ = self.import_preload()
+
+        self.assertIsNotNone(elapsed)
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET_MS)
+
+    def test_lazy_modules(self):
+        """ Test the writer backends are not imported at startup. """
+        _, modules = self.import_preload()
+
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+
+class TestPreloadOptions(unittest.TestCase):
+    """ Test class for the options of dask_memusage_gpus_plugin. """
+    @patch("dask_memusage_gpus.plugin.MemoryUsageGPUsPlugin")
+    def test_idle_interval(self, memory_plugin):
+        """ Test that the idle interval accepts fractions of seconds. """
+        scheduler = Mock()
+
+        # The same way Dask runs the preload of the scheduler
+        context = dask_memusage_gpus_plugin.dask_setup.make_context(
+            "dask_setup", ["--memusage-gpus-idle-interval", "0.5"])
+        dask_memusage_gpus_plugin.dask_setup.callback(scheduler, **context.params)
+
+        self.assertEqual(memory_plugin.call_args.kwargs["idle_interval"], 0.5)
+        scheduler.add_plugin.assert_called_once_with(memory_plugin.return_value)
@@ -2,13 +2,25 @@
 
 """ Test all the structures and funtions inside gpu_handler submodule. """
 
+import asyncio
 import time
 import unittest
+from collections import Counter
 
-from mock import patch
+import numpy as np
+from distributed import Client, LocalCluster
+from mock import Mock, patch
 
 from dask_memusage_gpus import gpu_handler as gpu
 
+SAMPLER_CALLS = Counter()
+
+
+def counting_sampler(dask_worker):
+    """ Fake sampler that counts how many times each worker is polled. """
+    SAMPLER_CALLS[dask_worker.address] += 1
+    return 100
+
 
 class TestGPUHandler(unittest.TestCase):
     """ Test class for gpu_handler submodule. """
@@ -107,3 +119,309 @@ class TestGPUHandler(unittest.TestCase):
 
         self.assertEqual(worker.fetch_task_used_memory('1.2.3.5'), (0, 0))
         self.assertEqual(worker.fetch_task_used_memory('1.2.3.6'), (0, 0))
+
+    def test_worker_add_and_remove(self):
+        """ Test the per-worker state follows the workers of the cluster. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False)
+
+        worker.add_worker('1.2.3.5')
+
+        # A fresh worker has a state but no sample yet
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5'), (-1, -1))
+
+        worker._worker_memory['1.2.3.5'].add(100)
+        worker._worker_memory['1.2.3.5'].add(300)
+
+        self.assertEqual(worker.remove_worker('1.2.3.5'), (100, 300))
+        self.assertEqual(worker._worker_memory, {})
+
+        # Nothing is left to flush for the second time
+        self.assertIsNone(worker.remove_worker('1.2.3.5'))
+
+    def test_removed_worker_late_samples(self):
+        """ Test that late samples of a departed worker are ignored for a while. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False)
+
+        worker.add_worker('1.2.3.5')
+        worker.remove_worker('1.2.3.5')
+
+        worker.add_task_sample('1.2.3.5', 'x', 'end', {"memory": 100, "elapsed": 0.1})
+
+        self.assertEqual(worker._worker_memory, {})
+
+        # The departed workers are forgotten once their time to live expires
+        later = time.monotonic() + gpu.REMOVED_TTL + 1
+        with patch("dask_memusage_gpus.gpu_handler.time.monotonic", return_value=later):
+            worker.add_task_sample('1.2.3.6', 'x', 'end', {"memory": 100, "elapsed": 0.1})
+
+        self.assertEqual(len(worker._removed_workers), 0)
+
+        # A worker that joins again is sampled right away
+        worker.remove_worker('1.2.3.6')
+        worker.add_worker('1.2.3.6')
+        worker.add_task_sample('1.2.3.6', 'x', 'end', {"memory": 100, "elapsed": 0.1})
+
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.6'), (100, 100))
+
+    def test_worker_host_memory(self):
+        """ Test the aggregates of the host memory samples. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False, host_memory=True)
+
+        worker.add_worker('1.2.3.5')
+
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5'), (-1,) * 5)
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.6'), (0,) * 5)
+
+        worker.add_task_sample('1.2.3.5', 'x', 'start',
+                               {"memory": 100, "elapsed": 0.1,
+                                "host_memory": 900, "pinned_memory": 0})
+        worker.add_task_sample('1.2.3.5', 'x', 'end',
+                               {"memory": 300, "elapsed": 0.1,
+                                "host_memory": 700, "pinned_memory": 64})
+
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5', 'x'),
+                         (100, 300, 700, 900, 64))
+
+        # Samples without host memory leave the host aggregates empty
+        worker._worker_memory['1.2.3.5'].add(200)
+
+        self.assertEqual(worker.remove_worker('1.2.3.5'), (200, 200, -1, -1, -1))
+
+    def test_concurrent_finished_tasks(self):
+        """ Test tasks finished by several threads before transitioning. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False)
+
+        worker.add_worker('1.2.3.5')
+
+        worker.add_task_sample('1.2.3.5', 'x', 'start', {"memory": 100, "elapsed": 0.1})
+        worker.add_task_sample('1.2.3.5', 'y', 'start', {"memory": 200, "elapsed": 0.1})
+        worker.add_task_sample('1.2.3.5', 'x', 'end', {"memory": 300, "elapsed": 0.1})
+        worker.add_task_sample('1.2.3.5', 'z', 'start', {"memory": 50, "elapsed": 0.1})
+        worker.add_task_sample('1.2.3.5', 'y', 'end', {"memory": 400, "elapsed": 0.1})
+        worker.add_task_sample('1.2.3.5', 'z', 'end', {"memory": 60, "elapsed": 0.1})
+
+        # A task that never transitions, e.g. released meanwhile
+        _, task_memory = worker._finished['1.2.3.5']['z']
+        worker._finished['1.2.3.5']['z'] = \
+            (time.monotonic() - gpu.FINISHED_TTL - 1, task_memory)
+
+        # The end samples of y survive the transition of x
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5', 'x'), (100, 300))
+        self.assertEqual(list(worker._finished['1.2.3.5']), ['y'])
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5', 'y'), (50, 400))
+
+    @patch("dask_memusage_gpus.gpu_handler.Client")
+    def test_workers_thread_removed_worker(self, client):
+        """ Test that samples of a removed worker do not allocate new state. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False)
+
+        def run(*args, **kwargs):
+            """ Remove the worker while the poll is in flight. """
+            worker.remove_worker('1.2.3.6')
+            return {'1.2.3.5': 234, '1.2.3.6': 567}
+
+        client.return_value.run.side_effect = run
+
+        worker.start()
+
+        time.sleep(0.5)
+
+        worker.cancel()
+        worker.stop()
+
+        self.assertEqual(list(worker._worker_memory), ['1.2.3.5'])
+
+    def test_workers_thread_busy_workers_only(self):
+        """ Test that idle workers are only polled by the heartbeat. """
+        SAMPLER_CALLS.clear()
+
+        with LocalCluster(n_workers=2, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            busy, idle = sorted(cluster.scheduler.workers)
+
+            worker = gpu.WorkersThread(cluster.scheduler.address, 0.1, False,
+                                       scheduler=cluster.scheduler,
+                                       sampler=counting_sampler,
+                                       idle_interval=60)
+
+            future = client.submit(time.sleep, 3, workers=[busy], pure=False)
+
+            # Wait for the task to be assigned before polling
+            while not cluster.scheduler.workers[busy].processing:
+                time.sleep(0.01)
+
+            worker.start()
+
+            future.result()
+
+            worker.cancel()
+            worker.stop()
+            worker.join()
+
+        # Only the first heartbeat reaches the idle worker
+        self.assertEqual(SAMPLER_CALLS[idle], 1)
+        self.assertGreater(SAMPLER_CALLS[busy], 10)
+
+    def test_workers_thread_busy_snapshot(self):
+        """ Test that the busy workers are read on the scheduler loop. """
+        scheduler = Mock()
+        scheduler.workers = {"1.2.3.5": Mock(processing={"func"}),
+                             "1.2.3.6": Mock(processing=set())}
+        scheduler.loop.add_callback.side_effect = lambda callback: callback()
+
+        worker = gpu.WorkersThread("1.2.3.4", 1, False, scheduler=scheduler,
+                                   idle_interval=60)
+
+        busy = asyncio.run(worker._busy_workers())
+
+        self.assertEqual(busy, {"1.2.3.5": True, "1.2.3.6": False})
+        scheduler.loop.add_callback.assert_called_once()
+
+    def test_workers_loop(self):
+        """ Test polling from the scheduler event loop without a client. """
+        SAMPLER_CALLS.clear()
+
+        with LocalCluster(n_workers=2, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster:
+            clients = set(cluster.scheduler.clients)
+
+            worker = gpu.WorkersLoop(cluster.scheduler.address, 0.1, False,
+                                     scheduler=cluster.scheduler,
+                                     sampler=counting_sampler)
+            worker.start()
+
+            time.sleep(1)
+
+            self.assertTrue(worker.is_alive())
+            self.assertEqual(set(cluster.scheduler.clients), clients)
+
+            for address in cluster.scheduler.workers:
+                self.assertEqual(worker.fetch_task_used_memory(address), (100, 100))
+
+                # Workers share the clock of the scheduler in process
+                clock = worker._clocks[address]
+
+                self.assertGreater(len(clock.round_trips), 5)
+                self.assertLessEqual(abs(clock.offset), clock.error + 1e-6)
+
+            worker.stop()
+
+            time.sleep(0.2)
+
+            self.assertFalse(worker.is_alive())
+
+        self.assertEqual(len(SAMPLER_CALLS), 2)
+        self.assertGreater(min(SAMPLER_CALLS.values()), 5)
+
+    def test_clock_offset(self):
+        """ Test the offset estimated from round trips and one-way samples. """
+        clock = gpu.ClockOffset(window=3)
+
+        self.assertIsNone(clock.offset)
+        self.assertIsNone(clock.to_scheduler(1.0))
+
+        # Samples sent on their own only bound the offset
+        clock.add_one_way(105.3, 5.0)
+        clock.add_one_way(110.1, 10.0)
+
+        self.assertAlmostEqual(clock.offset, 100.1)
+        self.assertIsNone(clock.error)
+
+        # The round trip with the lowest delay wins, whatever its order
+        clock.add_round_trip(119.0, 121.0, 20.0)
+        clock.add_round_trip(129.8, 130.4, 30.0, elapsed=0.2)
+        clock.add_round_trip(139.0, 141.6, 40.0, elapsed=0.1)
+
+        self.assertAlmostEqual(clock.offset, 100.1)
+        self.assertAlmostEqual(clock.error, 0.2)
+        self.assertAlmostEqual(clock.to_scheduler(50.0), 150.1)
+
+        # Older round trips leave the window
+        clock.add_round_trip(159.0, 161.0, 50.0)
+        clock.add_round_trip(169.0, 172.0, 60.0)
+
+        self.assertAlmostEqual(clock.offset, 110.0)
+
+        self.assertIsNone(clock.wall_shift())
+
+        clock.add_clock({"clock": 1000.0, "scheduler_delay": 0.5})
+
+        self.assertAlmostEqual(clock.wall_shift(), 110.0 - 1000.0 - 0.5)
+
+    def test_timestamps(self):
+        """ Test that samples are timed in the scheduler clock. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False, ring_size=8, timestamps=True)
+
+        self.assertEqual(worker.fetch_task_used_memory('1.2.3.5'), (0, 0, -1))
+
+        def sample(memory, when):
+            """ Sample of a worker whose clock is 1000 seconds behind. """
+            return {"memory": memory, "elapsed": 0.0, "time": when - 1000.0,
+                    "clock": 5000.0, "scheduler_delay": 0.0}
+
+        with worker._mutex:
+            worker._add_sample('1.2.3.5', sample(100, 10.0), 10.2, 9.8)
+            worker._add_sample('1.2.3.5', sample(300, 11.0), 11.1, 10.9)
+            worker._add_sample('1.2.3.5', sample(300, 12.0), 12.5, 11.5)
+            worker._add_sample('1.2.3.5', sample(200, 13.0), 13.1, 12.9)
+
+        # Peak of the first sample of the maximum, within the lowest delay
+        memory = worker.fetch_task_used_memory('1.2.3.5')
+
+        self.assertEqual(memory[:2], (100, 300))
+        self.assertAlmostEqual(memory[2], 11.0)
+
+        self.assertAlmostEqual(worker.wall_shift('1.2.3.5'), 1000.0 - 5000.0)
+        self.assertAlmostEqual(worker.wall_shift('1.2.3.6'),
+                               time.perf_counter() - time.time(), places=2)
+
+        np.testing.assert_allclose(worker.recent_samples('1.2.3.5', 1e9)["time"],
+                                   [10.0, 11.0, 12.0, 13.0])
+
+    def test_workers_loop_requires_scheduler(self):
+        """ Test the in-process mode without the scheduler object. """
+        with self.assertRaises(ValueError):
+            gpu.WorkersLoop("1.2.3.4", 1, False)
+
+    def test_sample_ring(self):
+        """ Test the ring keeps the latest samples in order. """
+        ring = gpu.SampleRing(size=4, n_values=2)
+
+        for i in range(6):
+            ring.add(float(i), 100 * i, None if i == 5 else i)
+
+        times, (memory, host) = ring.window(3)
+
+        np.testing.assert_array_equal(times, [3, 4, 5])
+        np.testing.assert_array_equal(memory, [300, 400, 500])
+        np.testing.assert_array_equal(host, [3, 4, -1])
+
+        times, _ = ring.window(0)
+
+        np.testing.assert_array_equal(times, [2, 3, 4, 5])
+
+    def test_recent_samples(self):
+        """ Test the samples of a worker from the last seconds. """
+        worker = gpu.WorkersThread("1.2.3.4", 1, False, ring_size=8, host_memory=True)
+
+        self.assertIsNone(worker.recent_samples('1.2.3.5', 60))
+
+        worker.add_task_sample('1.2.3.5', 'x', 'start',
+                               {"memory": 100, "elapsed": 0.1,
+                                "host_memory": 900, "pinned_memory": 0})
+        worker.add_task_sample('1.2.3.5', 'x', 'end',
+                               {"memory": 300, "elapsed": 0.1,
+                                "host_memory": 700, "pinned_memory": 64})
+
+        worker.remove_worker('1.2.3.5')
+
+        # The ring outlives the worker for the tasks erred by its departure
+        samples = worker.recent_samples('1.2.3.5', 60)
+
+        self.assertEqual(list(samples), ["time", "gpu_memory_mb", "host_memory_mb",
+                                         "pinned_memory_mb"])
+        np.testing.assert_array_equal(samples["gpu_memory_mb"], [100, 300])
+        np.testing.assert_array_equal(samples["pinned_memory_mb"], [0, 64])
+
+        self.assertEqual(len(worker.recent_samples('1.2.3.5', 0)["time"]), 0)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside metrics submodule. """
+
+import math
+import unittest
+
+from dask_memusage_gpus import metrics as mtr
+
+
+class TestMetrics(unittest.TestCase):
+    """ Test class for metrics submodule. """
+    def test_histogram(self):
+        """ Test the summary of a histogram. """
+        histogram = mtr.Histogram()
+
+        self.assertEqual(histogram.to_dict(), {"count": 0})
+        self.assertTrue(math.isnan(histogram.quantile(0.5)))
+
+        for value in [1e-7, 1e-5, 1e-5, 1e-5, 1e-3]:
+            histogram.record(value)
+
+        summary = histogram.to_dict()
+
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["min"], 1e-7)
+        self.assertEqual(summary["max"], 1e-3)
+        self.assertAlmostEqual(summary["total"], 1.0301e-3)
+        # Quantiles are the upper bound of the bucket, up to 2x the value
+        self.assertGreaterEqual(summary["p50"], 1e-5)
+        self.assertLess(summary["p50"], 2e-5)
+        self.assertEqual(summary["p99"], 1e-3)
+
+    def test_metrics_timer(self):
+        """ Test timing a block of code and discarding a path. """
+        metrics = mtr.Metrics()
+
+        with metrics.timer("foo"):
+            pass
+
+        metrics.record("bar", 0.5)
+        metrics.record("bar", 1.5)
+
+        summary = metrics.summary()
+
+        self.assertEqual(list(summary), ["bar", "foo"])
+        self.assertEqual(summary["foo"]["count"], 1)
+        self.assertEqual(summary["bar"]["mean"], 1.0)
+
+        metrics.discard("foo")
+        metrics.discard("foo")
+
+        self.assertEqual(list(metrics.summary()), ["bar"])
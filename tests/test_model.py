@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside model submodule. """
+
+import math
+import unittest
+
+import numpy as np
+import pandas as pd
+from parameterized import parameterized
+
+from dask_memusage_gpus import model
+
+MIB = model.MIB
+
+
+def synthetic_records(n_tasks=200, seed=42):
+    """
+    Records of two prefixes: `matmul` peaks at 300 MiB plus three times its
+    input, with noise, and `ones` always peaks at 64 MiB.
+    """
+    rng = np.random.default_rng(seed)
+
+    nbytes = rng.integers(1, 512, size=n_tasks) * MIB
+    peaks = 300 + 3 * nbytes / MIB + rng.normal(0, 4, size=n_tasks)
+
+    return pd.DataFrame({
+        "task_key": [f"('matmul-3a9c', {i})" for i in range(n_tasks)] +
+                    [f"('ones-77f1', {i})" for i in range(n_tasks)] + ["getitem-11ab"],
+        "input_nbytes": np.concatenate([nbytes, np.zeros(n_tasks), [MIB]]),
+        "max_gpu_memory_mb": np.concatenate([peaks, np.full(n_tasks, 64.0), [-1]]),
+    })
+
+
+class TestModel(unittest.TestCase):
+    """ Test class for model submodule. """
+    def test_fit(self):
+        """ Test the online fit matches a least squares fit. """
+        records = synthetic_records()
+        matmul = records[records.task_key.str.contains("matmul")]
+
+        memory_model = model.MemoryModel()
+        for row in records.itertuples():
+            memory_model.add(row.task_key, row.input_nbytes, row.max_gpu_memory_mb)
+
+        fitted = memory_model.prefixes["matmul"]
+        slope, intercept = np.polyfit(matmul.input_nbytes, matmul.max_gpu_memory_mb, 1)
+        residuals = matmul.max_gpu_memory_mb - (intercept + slope * matmul.input_nbytes)
+
+        self.assertEqual(fitted.count, len(matmul))
+        self.assertAlmostEqual(fitted.slope, slope)
+        self.assertAlmostEqual(fitted.intercept, intercept, places=6)
+        self.assertAlmostEqual(fitted.residual_std,
+                               math.sqrt((residuals ** 2).sum() / (len(matmul) - 2)))
+
+        # Missed tasks are not fitted
+        self.assertNotIn("getitem", memory_model.prefixes)
+
+    @parameterized.expand([(1,), (7,), (401,)])
+    def test_chunks(self, chunksize):
+        """ Test fitting in chunks matches fitting task by task. """
+        records = synthetic_records()
+
+        online = model.MemoryModel()
+        for row in records.itertuples():
+            online.add(row.task_key, row.input_nbytes, row.max_gpu_memory_mb)
+
+        chunked = model.MemoryModel()
+        for start in range(0, len(records), chunksize):
+            chunked.add_chunk(records.iloc[start:start + chunksize])
+
+        self.assertEqual(sorted(chunked.prefixes), sorted(online.prefixes))
+
+        for prefix, fitted in chunked.prefixes.items():
+            for name in fitted.__slots__:
+                expected = getattr(online.prefixes[prefix], name)
+
+                self.assertTrue(math.isclose(getattr(fitted, name), expected,
+                                             rel_tol=1e-9, abs_tol=1e-6), name)
+
+    def test_predict(self):
+        """ Test the predictions of a prefix or task key. """
+        memory_model = model.MemoryModel()
+        memory_model.add_chunk(synthetic_records())
+
+        prediction = memory_model.predict("('matmul-ffff', 0)", 100 * MIB)
+
+        self.assertEqual(prediction["tasks"], 200)
+        self.assertAlmostEqual(prediction["peak_mb"], 600, delta=2)
+        self.assertGreater(prediction["upper_mb"], prediction["peak_mb"])
+        self.assertLess(prediction["upper_mb"], prediction["peak_mb"] + 15)
+
+        self.assertIsNone(memory_model.predict("unknown", MIB))
+
+    def test_advice(self):
+        """ Test the largest input that fits a GPU. """
+        memory_model = model.MemoryModel()
+        memory_model.add_chunk(synthetic_records())
+
+        advice = memory_model.advice(gpu_memory_mb=16384)
+
+        # (16384 - 300) / 3 MiB minus the margin of the noise
+        self.assertAlmostEqual(advice["matmul"]["max_input_mb"], 5361, delta=30)
+        self.assertLess(advice["matmul"]["max_input_mb"], 5361)
+        self.assertAlmostEqual(advice["matmul"]["slope"], 3, delta=0.01)
+        self.assertEqual(advice["ones"]["max_input_mb"], math.inf)
+
+        fitted = memory_model.prefixes["matmul"]
+        max_nbytes = fitted.max_nbytes(16384)
+
+        self.assertLessEqual(fitted.upper(max_nbytes), 16384)
+        self.assertGreater(fitted.upper(max_nbytes + MIB), 16384)
+        self.assertEqual(fitted.max_nbytes(100), 0)
+
+        # No recommendation without the memory of the GPU or enough tasks
+        self.assertTrue(math.isnan(memory_model.advice()["matmul"]["max_input_mb"]))
+        self.assertTrue(math.isnan(memory_model.advice(16384, min_tasks=1000)
+                                   ["matmul"]["max_input_mb"]))
+
+        self.assertEqual(list(memory_model.table(16384).index), ["matmul", "ones"])
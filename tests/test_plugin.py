@@ -3,10 +3,12 @@
 """ Test all the structures and funtions inside gpu_handler submodule. """
 
 import asyncio
+import json
 import os
 import time
 import unittest
 
+import numpy as np
 import pandas as pd
 from parameterized import parameterized
 
@@ -20,10 +22,10 @@ except ImportError:
 
 from dask import compute
 from dask.bag import from_sequence
-from dask.distributed import Client
+from dask.distributed import Client, LocalCluster
 from mock import Mock, patch
 
-from dask_memusage_gpus import plugin
+from dask_memusage_gpus import plugin, reader
 
 
 def allocate_50mb(x):
@@ -37,6 +39,35 @@ def no_allocate(y):
     return y * 2
 
 
+SAMPLES = []
+
+
+def event_sampler():
+    """Fake sampler that returns a new value at every call."""
+    SAMPLES.append(len(SAMPLES))
+    return SAMPLES[-1]
+
+
+def input_sampler(dask_worker):
+    """Fake sampler that uses 300 MiB plus 3 times the inputs executing."""
+    executing = list(dask_worker.state.executing)
+
+    return 300 + sum(3 * dep.nbytes // 2**20
+                     for ts in executing for dep in ts.dependencies)
+
+
+def hold(x):
+    """Hold the input long enough to be sampled."""
+    time.sleep(0.3)
+    return len(x)
+
+
+def out_of_memory(x):
+    """Fail like a task that ran out of GPU memory."""
+    time.sleep(0.5)
+    raise MemoryError(f"Out of memory allocating {x} bytes")
+
+
 def make_bag():
     """Create a bag."""
     return from_sequence(
@@ -62,8 +93,11 @@ class TestPlugin(unittest.TestCase):
 
     def tearDown(self):
         """ Tear down the test class. """
-        if os.path.exists(self.path):
-            os.remove(self.path)
+        for suffix in ("", ".overhead.json", ".meta.json", ".forensics.jsonl",
+                       "-wal", "-shm"):
+            path = self.path + suffix
+            if os.path.exists(path):
+                os.remove(path)
 
     @parameterized.expand([
          ("csv", pd.read_csv),
@@ -71,6 +105,7 @@ class TestPlugin(unittest.TestCase):
          ("json", pd.read_json),
          ("xml", pd.read_xml),
          ("excel", pd.read_excel),
+         ("sqlite", reader.read_records),
      ])
     @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
     def test_plugin_record_to_file(self, file, func, thread):
@@ -99,6 +134,9 @@ class TestPlugin(unittest.TestCase):
         except ImportError:
             raise PipRequirementException(f"Failed because it requires '{self.required_packages[file]}'.")
 
+        # Excel workbooks are only assembled when the plugin closes
+        asyncio.run(dask_plugin.before_close())
+
         df = func(self.path)
 
         if file == 'excel':
@@ -107,7 +145,443 @@ class TestPlugin(unittest.TestCase):
 
         self.assertEqual(len(df), 1)
 
-        dask_plugin.before_close()
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_plugin_remove_worker_flush(self, thread):
+        """ Test that pending samples are flushed when a worker leaves. """
+        thread.return_value = Mock(start=Mock(),
+                                   remove_worker=Mock(side_effect=[(200, 400), None,
+                                                                   (100, 300)]))
+
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=2,
+                                                   mem_max=False,
+                                                   run_on_client=False)
+
+        dask_plugin.add_worker(scheduler, 'tcp://1.2.3.4:34567')
+        for port in (34567, 34568, 34569):
+            dask_plugin.remove_worker(scheduler, f'tcp://1.2.3.4:{port}',
+                                      stimulus_id='test')
+
+        thread.return_value.add_worker.assert_called_once_with('tcp://1.2.3.4:34567')
+
+        # The pending samples are not recorded as a task
+        self.assertFalse(os.path.exists(self.path))
+
+        # The metadata is only rewritten when the plugin closes
+        self.assertEqual(reader.read_metadata(self.path)['removed_workers'],
+                         {'count': 0})
+
+        asyncio.run(dask_plugin.before_close())
+
+        removed = reader.read_metadata(self.path)['removed_workers']
+
+        self.assertEqual(removed, {'count': 3,
+                                   'min_gpu_memory_mb': 100,
+                                   'max_gpu_memory_mb': 400})
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_plugin_batch_record(self, thread):
+        """ Test that finished tasks are written in batches. """
+        thread.return_value = Mock(start=Mock(),
+                                   fetch_task_used_memory=Mock(return_value=(200, 400)))
+
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=2,
+                                                   mem_max=False,
+                                                   run_on_client=False,
+                                                   batch_size=3)
+
+        for i in range(5):
+            dask_plugin.transition(f'func{i}', 'processing', 'memory',
+                                   worker='tcp://1.2.3.4:34567')
+
+        self.assertEqual(len(pd.read_csv(self.path)), 3)
+
+        asyncio.run(dask_plugin.before_close())
+
+        csv = pd.read_csv(self.path, index_col=0)
+
+        self.assertEqual(list(csv.task_key), [f'func{i}' for i in range(5)])
+        self.assertEqual(list(csv.index), list(range(5)))
+
+        # Every finished task was timed and the summary was written
+        self.assertEqual(dask_plugin.overhead()['transition']['count'], 5)
+        self.assertEqual(dask_plugin.overhead()['record_write']['count'], 2)
+
+        with open(self.path + ".overhead.json", encoding="utf-8") as fp:
+            self.assertEqual(json.load(fp), dask_plugin.overhead())
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_plugin_metadata(self, thread):
+        """ Test the run metadata written next to the record file. """
+        thread.return_value = Mock(start=Mock(),
+                                   fetch_task_used_memory=Mock(return_value=(200, 400)))
+
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+        scheduler.id = 'Scheduler-1234'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=2,
+                                                   mem_max=False,
+                                                   run_on_client=False,
+                                                   sampler=event_sampler,
+                                                   run_id='nightly-42')
+
+        with open(self.path + ".meta.json", encoding="utf-8") as fp:
+            metadata = json.load(fp)
+
+        self.assertEqual(dask_plugin.run_id, 'nightly-42')
+        self.assertEqual(metadata['scheduler_id'], 'Scheduler-1234')
+        self.assertIsNone(metadata['end'])
+        self.assertEqual(metadata['config']['interval'], 2)
+        self.assertEqual(metadata['config']['sampler'], f'{__name__}.event_sampler')
+
+        dask_plugin.transition('func', 'processing', 'memory',
+                               worker='tcp://1.2.3.4:34567')
+
+        asyncio.run(dask_plugin.before_close())
+
+        with open(self.path + ".meta.json", encoding="utf-8") as fp:
+            metadata = json.load(fp)
+
+        self.assertEqual(metadata['records'], 1)
+        self.assertGreaterEqual(metadata['end'], metadata['start'])
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_plugin_batch_record_on_tick(self, thread):
+        """ Test that pending tasks are written at the scheduler tick. """
+        thread.return_value = Mock(start=Mock(),
+                                   fetch_task_used_memory=Mock(return_value=(200, 400)))
+
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=2,
+                                                   mem_max=False,
+                                                   run_on_client=False,
+                                                   batch_size=100)
+
+        async def run():
+            """ Finish a task while the scheduler is running. """
+            await dask_plugin.start(scheduler)
+
+            dask_plugin.transition('func', 'processing', 'memory',
+                                   worker='tcp://1.2.3.4:34567')
+
+            self.assertFalse(os.path.exists(self.path))
+
+            await asyncio.sleep(0.5)
+
+            self.assertEqual(len(pd.read_csv(self.path)), 1)
+
+            await dask_plugin.before_close()
+
+        asyncio.run(run())
+
+    def test_event_sampling(self):
+        """ Test sampling at task boundaries on a LocalCluster. """
+        SAMPLES.clear()
+
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       interval=60,
+                                                       mem_max=False,
+                                                       run_on_client=False,
+                                                       sampler=event_sampler,
+                                                       event_sampling=True)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+            cluster.sync(dask_plugin.start, cluster.scheduler)
+
+            futures = client.map(no_allocate, range(10))
+            client.gather(futures)
+
+            # Tasks are shorter than the interval, so there is no polling
+            self.assertNotIn('poll_round_trip', dask_plugin.overhead())
+
+        csv = pd.read_csv(self.path)
+
+        self.assertEqual(len(csv), 10)
+        self.assertEqual(len(SAMPLES), 20)
+        self.assertTrue((csv.min_gpu_memory_mb >= 0).all())
+        # Each task gets exactly its own start and end samples
+        self.assertEqual(list(csv.max_gpu_memory_mb - csv.min_gpu_memory_mb), [1] * 10)
+
+    def test_event_sampling_host_memory(self):
+        """ Test recording the host memory in the same samples. """
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       interval=60,
+                                                       mem_max=False,
+                                                       run_on_client=False,
+                                                       sampler=event_sampler,
+                                                       event_sampling=True,
+                                                       host_memory=True)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+            cluster.sync(dask_plugin.start, cluster.scheduler)
+
+            futures = client.map(no_allocate, range(10))
+            client.gather(futures)
+
+        csv = pd.read_csv(self.path)
+
+        self.assertEqual(len(csv), 10)
+        self.assertTrue((csv.min_host_memory_mb > 0).all())
+        self.assertTrue((csv.max_host_memory_mb >= csv.min_host_memory_mb).all())
+        self.assertTrue((csv.max_pinned_memory_mb == 0).all())
+
+    def test_in_process(self):
+        """ Test polling from the scheduler event loop on a LocalCluster. """
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       interval=0.05,
+                                                       mem_max=False,
+                                                       run_on_client=True,
+                                                       sampler=event_sampler,
+                                                       in_process=True)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+
+            self.assertFalse(dask_plugin._workers_thread.is_alive())
+
+            with Client(cluster) as client:
+                client.gather(client.map(time.sleep, [0.5] * 3, pure=False))
+
+                # The plugin does not connect a client of its own
+                self.assertEqual(dask_plugin._n_clients, 1)
+                self.assertTrue(dask_plugin._workers_thread.is_alive())
+
+            time.sleep(0.2)
+
+            self.assertFalse(dask_plugin._workers_thread.is_alive())
+
+        csv = pd.read_csv(self.path)
+
+        self.assertEqual(len(csv), 3)
+        self.assertTrue((csv.max_gpu_memory_mb >= 0).all())
+
+    def test_forensics(self):
+        """ Test the samples that preceded an erred task are written. """
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       interval=0.05,
+                                                       mem_max=False,
+                                                       run_on_client=False,
+                                                       sampler=event_sampler,
+                                                       in_process=True,
+                                                       forensics_window=60)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+            cluster.sync(dask_plugin.start, cluster.scheduler)
+
+            with self.assertRaises(MemoryError):
+                client.submit(out_of_memory, 1024).result()
+
+            cluster.sync(dask_plugin.before_close)
+
+        forensics = reader.read_forensics(self.path)
+
+        self.assertEqual(len(forensics), 1)
+        self.assertTrue(forensics[0]['key'].startswith('out_of_memory-'))
+        self.assertIn("Out of memory allocating 1024 bytes", forensics[0]['exception'])
+
+        samples = forensics[0]['samples']
+
+        self.assertGreater(len(samples['time']), 5)
+        self.assertEqual(len(samples['gpu_memory_mb']), len(samples['time']))
+        self.assertLessEqual(samples['time'][-1], forensics[0]['time'])
+        self.assertEqual(samples['time'], sorted(samples['time']))
+
+        self.assertEqual(dask_plugin.overhead()['forensics_write']['count'], 1)
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_allocator_without_polling(self, thread):
+        """ Test that tracking an allocator disables the periodic polling. """
+        scheduler = Mock(stream_handlers={})
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=1,
+                                                   mem_max=False,
+                                                   run_on_client=True,
+                                                   allocator='rmm')
+
+        dask_plugin.add_client(scheduler, 'client')
+
+        thread.return_value.start.assert_not_called()
+        self.assertIn('memusage-gpus-sample', scheduler.stream_handlers)
+        self.assertTrue(thread.call_args.kwargs['event_sampling'])
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_memory_model(self, thread):
+        """ Test the peaks are modeled over the input bytes of the tasks. """
+        mib = 2 ** 20
+        peaks = iter([(100, 300 + 3 * i) for i in range(1, 11)] + [(100, 9999)])
+        thread.return_value = Mock(start=Mock(),
+                                   fetch_task_used_memory=Mock(side_effect=peaks))
+
+        scheduler = Mock(handlers={})
+        scheduler.address = '1.2.3.4'
+        scheduler.tasks = {f"('matmul-3a9c', {i})":
+                           Mock(dependencies=[Mock(nbytes=i * mib), Mock(nbytes=-1)])
+                           for i in range(1, 12)}
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=1,
+                                                   mem_max=True,
+                                                   run_on_client=False,
+                                                   memory_model=True)
+
+        for i in range(1, 12):
+            dask_plugin.transition(f"('matmul-3a9c', {i})", 'processing',
+                                   'memory' if i < 11 else 'erred',
+                                   worker='tcp://1.2.3.4:34567')
+
+        self.assertEqual(scheduler.handlers['memusage_gpus_predict'],
+                         dask_plugin.predict_peak)
+
+        prediction = dask_plugin.predict_peak("matmul", 100 * mib)
+
+        # The erred task is recorded but not fitted
+        self.assertEqual(prediction['tasks'], 10)
+        self.assertAlmostEqual(prediction['peak_mb'], 600)
+
+        advice = dask_plugin.chunk_advice(gpu_memory_mb=16384)
+
+        self.assertAlmostEqual(advice['matmul']['max_input_mb'], (16384 - 300) / 3,
+                               delta=1)
+
+        csv = pd.read_csv(self.path)
+
+        self.assertEqual(list(csv.input_nbytes), [i * mib for i in range(1, 12)])
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def test_memory_model_disabled(self, thread):
+        """ Test the model API requires the memory model. """
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=self.path,
+                                                   filetype='csv',
+                                                   interval=1,
+                                                   mem_max=True,
+                                                   run_on_client=False)
+
+        with self.assertRaises(ValueError):
+            dask_plugin.chunk_advice(gpu_memory_mb=16384)
+
+    def test_memory_model_cluster(self):
+        """ Test the chunk size advice with synthetic data on a CPU-only cluster. """
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       interval=0.05,
+                                                       mem_max=True,
+                                                       run_on_client=False,
+                                                       sampler=input_sampler,
+                                                       in_process=True,
+                                                       memory_model=True)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+
+            arrays = client.map(np.ones, [i * 2 ** 20 for i in range(1, 7)],
+                                dtype=np.uint8, pure=False)
+            client.gather(client.map(hold, arrays))
+
+            advice = client.sync(client.scheduler.memusage_gpus_advice,
+                                 gpu_memory_mb=16384)
+            prediction = client.sync(client.scheduler.memusage_gpus_predict,
+                                     prefix="hold", nbytes=100 * 2 ** 20)
+
+        self.assertEqual(advice['hold']['tasks'], 6)
+        self.assertAlmostEqual(advice['hold']['slope'], 3)
+        self.assertAlmostEqual(advice['hold']['intercept_mb'], 300)
+        self.assertAlmostEqual(advice['hold']['max_input_mb'], (16384 - 300) / 3, delta=1)
+        self.assertAlmostEqual(prediction['peak_mb'], 600)
+
+    @parameterized.expand([
+        ("round_trips", dict(interval=0.05, in_process=True)),
+        ("one_way", dict(interval=60, event_sampling=True)),
+    ])
+    def test_timestamps(self, name, options):
+        """ Test the peak and compute window in the scheduler clock. """
+        with LocalCluster(n_workers=1, threads_per_worker=1, processes=False,
+                          dashboard_address=":0") as cluster, \
+                Client(cluster) as client:
+            dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=cluster.scheduler,
+                                                       path=self.path,
+                                                       filetype='csv',
+                                                       mem_max=False,
+                                                       run_on_client=False,
+                                                       sampler=event_sampler,
+                                                       timestamps=True,
+                                                       **options)
+
+            cluster.scheduler.add_plugin(dask_plugin)
+            cluster.sync(dask_plugin.start, cluster.scheduler)
+
+            client.gather(client.map(time.sleep, [0.3] * 3, pure=False))
+
+        csv = pd.read_csv(self.path)
+
+        self.assertEqual(list(csv.columns[-3:]), ['peak_time', 'compute_start',
+                                                  'compute_stop'])
+
+        self.assertEqual(len(csv), 3)
+
+        # Samples left when the worker is removed only have a peak time
+        removed = reader.read_metadata(self.path)['removed_workers']
+        if 'max_gpu_memory_mb' in removed:
+            self.assertGreaterEqual(removed['peak_time'], 0)
+
+        duration = csv.compute_stop - csv.compute_start
+
+        self.assertTrue(((duration > 0.29) & (duration < 0.4)).all())
+        self.assertTrue((csv.compute_stop <= csv.time + 0.01).all())
+
+        # The sampler grows, so the peak is the last sample of each task
+        self.assertTrue((csv.peak_time >= csv.compute_start - 0.06).all())
+        self.assertTrue((csv.peak_time <= csv.compute_stop + 0.06).all())
 
     def test_install_plugin(self):
         """ Test install plugin from scheduler. """
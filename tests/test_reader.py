@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside reader submodule. """
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+from parameterized import parameterized
+
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import plugin, reader
+
+ROWS = [
+    ("('make_blobs-3a9c', 0)", 100, 300, "tcp://1.2.3.4:1"),
+    ("('make_blobs-3a9c', 1)", 100, 500, "tcp://1.2.3.4:2"),
+    ("sum-aggregate-77f1", 500, 700, "tcp://1.2.3.4:1"),
+    ("getitem-11ab", -1, -1, "tcp://1.2.3.4:2"),
+]
+
+
+class TestReader(unittest.TestCase):
+    """ Test class for reader submodule. """
+    def setUp(self):
+        """ Setup test method. """
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Tear down the test class. """
+        shutil.rmtree(self.tmpdir)
+
+    @patch('dask_memusage_gpus.gpu_handler.WorkersThread')
+    def write_records(self, path, filetype, thread):
+        """ Write ROWS with the plugin, one second apart. """
+        scheduler = Mock()
+        scheduler.address = '1.2.3.4'
+
+        dask_plugin = plugin.MemoryUsageGPUsPlugin(scheduler=scheduler,
+                                                   path=path,
+                                                   filetype=filetype,
+                                                   interval=1,
+                                                   mem_max=False,
+                                                   run_on_client=False,
+                                                   batch_size=len(ROWS))
+
+        with patch('time.perf_counter') as perf_counter:
+            for i, row in enumerate(ROWS):
+                perf_counter.return_value = dask_plugin._plugin_start + i
+                dask_plugin._record(*row)
+
+        asyncio.run(dask_plugin.before_close())
+
+        return path
+
+    @parameterized.expand([(filetype,) for filetype in defs.FILE_TYPES])
+    def test_infer_file_type(self, filetype):
+        """ Test inferring the type of files without extension. """
+        path = os.path.join(self.tmpdir, "memusage")
+
+        # Excel needs the extension to pick the writer engine
+        os.rename(self.write_records(path + ".xlsx", filetype), path)
+
+        self.assertEqual(reader.infer_file_type(path), filetype)
+
+        df = reader.read_records(path)
+
+        self.assertEqual(list(df.columns), ["task_key", "time", "min_gpu_memory_mb",
+                                            "max_gpu_memory_mb", "worker_id"])
+        self.assertEqual(list(df.max_gpu_memory_mb), [300, 500, 700, -1])
+
+    @parameterized.expand([(defs.CSV,), (defs.PARQUET,), (defs.SQLITE,)])
+    def test_filters(self, filetype):
+        """ Test the projection and the filters. """
+        path = self.write_records(os.path.join(self.tmpdir, "memusage"), filetype)
+
+        df = reader.read_records(path, columns=["task_key"], prefixes="make_blobs")
+
+        self.assertEqual(list(df.columns), ["task_key"])
+        self.assertEqual(list(df.task_key), [ROWS[0][0], ROWS[1][0]])
+
+        df = reader.read_records(path, start=1, end=2, workers="tcp://1.2.3.4:1")
+
+        self.assertEqual(list(df.task_key), [ROWS[2][0]])
+
+        df = reader.read_records(path, columns=["max_gpu_memory_mb"], min_peak=500)
+
+        self.assertEqual(list(df.max_gpu_memory_mb), [500, 700])
+
+        df = reader.read_records(path, prefixes=["sum-aggregate", "getitem"], lazy=True)
+
+        self.assertEqual(list(df.compute(scheduler="sync").task_key),
+                         [ROWS[2][0], ROWS[3][0]])
+
+    def test_partitioned_directory(self):
+        """ Test reading every partition of a directory. """
+        for i in range(3):
+            self.write_records(os.path.join(self.tmpdir, f"part.{i}.parquet"),
+                               defs.PARQUET)
+
+        # Sidecar files are ignored
+        with open(os.path.join(self.tmpdir, "part.0.parquet" + defs.OVERHEAD_FILE_SUFFIX),
+                  "w", encoding="utf-8") as fp:
+            fp.write("{}")
+
+        df = reader.read_records(self.tmpdir, min_peak=600)
+
+        self.assertEqual(len(df), 3)
+
+        ddf = reader.read_records(self.tmpdir, columns=["task_key"], min_peak=600,
+                                  lazy=True)
+
+        self.assertEqual(len(ddf.compute(scheduler="sync")), 3)
+
+    def test_invalid_file_type(self):
+        """ Test errors on invalid types and empty directories. """
+        with self.assertRaises(defs.FileTypeException):
+            reader.read_records(self.tmpdir)
+
+        with self.assertRaises(defs.FileTypeException):
+            reader.read_records(self.tmpdir, filetype="hdf5")
+
+    @parameterized.expand([(defs.CSV,), (defs.PARQUET,), (defs.JSON,)])
+    def test_iter_records(self, filetype):
+        """ Test streaming the records in chunks. """
+        path = self.write_records(os.path.join(self.tmpdir, "memusage"), filetype)
+
+        chunks = list(reader.iter_records(path, columns=["task_key"], chunksize=3,
+                                          min_peak=0))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3])
+        self.assertEqual(list(chunks[0].columns), ["task_key"])
+
+        chunks = list(reader.iter_records(path, chunksize=1, prefixes="make_blobs"))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1])
+
+    def test_read_metadata(self):
+        """ Test reading the run metadata written by the plugin. """
+        path = self.write_records(os.path.join(self.tmpdir, "memusage"), defs.CSV)
+
+        metadata = reader.read_metadata(path)
+
+        self.assertEqual(len(metadata["run_id"]), 32)
+        self.assertEqual(metadata["config"]["filetype"], defs.CSV)
+        self.assertIsNone(reader.read_metadata(path + ".missing"))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside summary submodule. """
+
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dask_memusage_gpus import summary
+
+RECORDS = pd.DataFrame({
+    "task_key": ["('make_blobs-3a9c', 0)", "('make_blobs-3a9c', 1)", "sum-77f1",
+                 "('make_blobs-3a9c', 2)", "sum-88a2", "getitem-11ab"],
+    "time": [1.0, 1.5, 2.0, 3.0, 4.0, 4.5],
+    "max_gpu_memory_mb": [100, 200, 400, 300, 50, -1],
+    "worker_id": ["w1", "w2", "w1", "w2", "w1", "w2"],
+})
+
+
+class TestSummary(unittest.TestCase):
+    """ Test class for summary submodule. """
+    def summarize(self, chunksize):
+        """ Summary of RECORDS added in chunks. """
+        record_summary = summary.RecordSummary(top=2)
+
+        for start in range(0, len(RECORDS), chunksize):
+            chunk = RECORDS.iloc[start:start + chunksize]
+            record_summary.add(chunk.reset_index(drop=True))
+
+        return record_summary
+
+    def test_group_stats(self):
+        """ Test the statistics per prefix and per worker. """
+        result = self.summarize(len(RECORDS)).to_dict()
+
+        self.assertEqual(result["records"], 6)
+        self.assertEqual(list(result["prefixes"]), ["sum", "make_blobs", "getitem"])
+
+        blobs = result["prefixes"]["make_blobs"]
+        self.assertEqual(blobs["tasks"], 3)
+        self.assertEqual(blobs["peak_gpu_memory_mb"], 300)
+        # w2 finished its tasks at 1.5 and 3.0
+        self.assertAlmostEqual(blobs["gpu_memory_mb_s"], 300 * 1.5)
+
+        self.assertEqual(result["prefixes"]["getitem"]["missed"], 1)
+        self.assertEqual(result["prefixes"]["getitem"]["p95_gpu_memory_mb"], -1)
+        self.assertEqual(result["workers"]["w1"]["tasks"], 3)
+
+        self.assertEqual([task["max_gpu_memory_mb"] for task in result["heaviest"]],
+                         [400, 300])
+
+    def test_chunks(self):
+        """ Test the summary does not depend on the chunks. """
+        self.assertEqual(self.summarize(1).to_dict(),
+                         self.summarize(len(RECORDS)).to_dict())
+
+    def test_quantile(self):
+        """ Test the error of the histogram quantiles. """
+        stats = summary.GroupStats()
+
+        memory = np.arange(1, 1001, dtype=float)
+        summary._aggregate({"x": stats}, np.array(["x"] * 1000), memory,
+                           np.full(1000, np.nan))
+
+        self.assertLess(abs(stats.quantile(0.95) - 950) / 950, 0.045)
+        self.assertEqual(stats.quantile(1), 1000)
+
+    def test_render(self):
+        """ Test rendering the summary. """
+        record_summary = self.summarize(len(RECORDS))
+
+        self.assertEqual(json.loads(record_summary.render(summary.JSON))["records"], 6)
+        self.assertIn("| make_blobs | 3 | 0 | 300.00 |",
+                      record_summary.render(summary.MARKDOWN))
+        self.assertIn("<h2>Workers</h2>", record_summary.render(summary.HTML))
+
+        with self.assertRaises(ValueError):
+            record_summary.render("pdf")
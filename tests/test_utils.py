@@ -3,6 +3,9 @@
 """ Test all the structures and funtions inside utils submodule. """
 
 import os
+import subprocess
+import tempfile
+import time
 import unittest
 
 from mock import patch
@@ -22,6 +25,17 @@ class TestUtils(unittest.TestCase):
         for ftype in ["csv", "parquet", "json", "excel", "xml"]:
             utils.validate_file_type(ftype)
 
+    def test_load_sampler(self):
+        """ Test importing a sampler from its dotted path. """
+        for name in ["dask_memusage_gpus.utils.get_worker_gpu_memory_used",
+                     "dask_memusage_gpus.utils:get_worker_gpu_memory_used"]:
+            self.assertIs(utils.load_sampler(name), utils.get_worker_gpu_memory_used)
+
+        for name in ["dask_memusage_gpus.utils.foo", "foo.bar", "foo",
+                     "dask_memusage_gpus.definitions.CSV"]:
+            with self.assertRaises(defs.SamplerException):
+                utils.load_sampler(name)
+
     def test_generate_gpu_proccesses(self):
         """ Test general usage of function generate_gpu_proccesses(). """
         fixture = os.path.join(os.path.dirname(__file__), "fixtures/nvidia_smi.1.xml")
@@ -123,3 +137,100 @@ class TestUtils(unittest.TestCase):
                 getpid.return_value = 2222
 
                 self.assertEqual(utils.get_worker_gpu_memory_used(), 0)
+
+    def test_timed_sample(self):
+        """ Test the sampler wrapper executed on workers. """
+        sample = utils.timed_sample(lambda: 310)
+
+        self.assertEqual(sample["memory"], 310)
+        self.assertGreaterEqual(sample["elapsed"], 0)
+        self.assertLessEqual(sample["time"], time.perf_counter())
+        self.assertAlmostEqual(sample["time"] + sample["clock"], time.time(), places=2)
+        self.assertEqual(sample["scheduler_delay"], 0)
+
+        sample = utils.timed_sample(lambda dask_worker: dask_worker, dask_worker="foo")
+
+        self.assertEqual(sample["memory"], "foo")
+        self.assertNotIn("host_memory", sample)
+
+        sample = utils.timed_sample(lambda: 310, host_memory=True)
+
+        self.assertGreater(sample["host_memory"], 0)
+        self.assertEqual(sample["pinned_memory"], 0)
+
+    def test_get_host_memory_used(self):
+        """ Test the host memory sampled from proc and from psutil. """
+        rss, pinned = utils.get_host_memory_used()
+
+        self.assertGreater(rss, 0)
+        self.assertEqual(pinned, 0)
+
+        with patch("dask_memusage_gpus.utils.open", side_effect=OSError, create=True):
+            rss_psutil, _ = utils.get_host_memory_used()
+
+        self.assertAlmostEqual(rss_psutil, rss, delta=rss / 2)
+
+    def test_get_worker_gpu_memory_used_name_filter(self):
+        """ Test the name filter of function get_worker_gpu_memory_used(). """
+        processes = [defs.GPUProcess(pid=2222,
+                                     name="/opt/bin/dask-worker",
+                                     memory_used=310)]
+
+        with patch("dask_memusage_gpus.utils.generate_gpu_proccesses") as p_gen:
+            with patch("os.getpid") as getpid:
+                p_gen.return_value = processes
+                getpid.return_value = 2222
+
+                self.assertEqual(utils.get_worker_gpu_memory_used(), 0)
+                self.assertEqual(utils.get_worker_gpu_memory_used(name_filter="dask"),
+                                 310)
+                self.assertEqual(utils.get_worker_gpu_memory_used(name_filter=""), 310)
+
+    def test_get_worker_gpu_memory_used_children(self):
+        """ Test accounting the GPU memory used by child processes. """
+        with subprocess.Popen(["sleep", "10"]) as child:
+            processes = [defs.GPUProcess(pid=os.getpid(),
+                                         name="python3",
+                                         memory_used=310),
+                         defs.GPUProcess(pid=child.pid,
+                                         name="/usr/bin/cuda-binary",
+                                         memory_used=100),
+                         defs.GPUProcess(pid=1,
+                                         name="init",
+                                         memory_used=25)]
+
+            with patch("dask_memusage_gpus.utils.generate_gpu_proccesses") as p_gen:
+                p_gen.return_value = processes
+
+                self.assertEqual(utils.get_worker_gpu_memory_used(), 310)
+                self.assertEqual(utils.get_worker_gpu_memory_used(include_children=True),
+                                 410)
+
+            child.kill()
+
+    def test_process_tree(self):
+        """ Test resolving and caching descendants from a proc directory. """
+        # 10 -> 20 -> 30 (name with spaces and parentheses), 40 -> 1
+        parents = {20: 10, 30: 20, 40: 1}
+
+        with tempfile.TemporaryDirectory() as proc:
+            for pid, ppid in parents.items():
+                os.makedirs(os.path.join(proc, str(pid)))
+                with open(os.path.join(proc, str(pid), "stat"), "w") as fp:
+                    fp.write(f"{pid} (my (cuda) app) S {ppid} {pid} 1 0 -1\n")
+
+            tree = utils.ProcessTree(10, proc_path=proc)
+
+            self.assertTrue(tree.contains(10))
+            self.assertTrue(tree.contains(30))
+            self.assertFalse(tree.contains(40))
+            self.assertFalse(tree.contains(50))
+
+            # Cached results do not read the proc directory again
+            os.remove(os.path.join(proc, "30", "stat"))
+            self.assertTrue(tree.contains(30))
+
+            # Processes that are gone are forgotten
+            tree.prune([40])
+            self.assertFalse(tree.contains(30))
+            self.assertTrue(tree.contains(10))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside worker_plugin submodule. """
+
+import unittest
+
+from mock import Mock, patch
+
+from dask_memusage_gpus import worker_plugin as wp
+from tests.test_allocators import MIB, FakeAllocator
+
+
+class TestWorkerPlugin(unittest.TestCase):
+    """ Test class for worker_plugin submodule. """
+    def test_task_boundaries(self):
+        """ Test that a sample is sent when a task starts and finishes. """
+        worker = Mock()
+
+        worker_plugin = wp.TaskSamplerWorkerPlugin(sampler=lambda: 100)
+
+        # Nothing is sent before the setup
+        worker_plugin.transition('func', 'ready', 'executing')
+
+        worker_plugin.setup(worker)
+
+        worker_plugin.transition('func', 'waiting', 'ready')
+        worker_plugin.transition('func', 'ready', 'executing')
+        worker_plugin.transition('func', 'executing', 'long-running')
+        worker_plugin.transition('func', 'long-running', 'memory')
+
+        messages = [call.args[0] for call in worker.batched_stream.send.call_args_list]
+
+        self.assertEqual([msg['event'] for msg in messages], ['start', 'end'])
+        self.assertEqual([msg['op'] for msg in messages], ['memusage-gpus-sample'] * 2)
+        self.assertEqual([msg['sample']['memory'] for msg in messages], [100, 100])
+
+    def test_sampler_failure(self):
+        """ Test that a failing sampler does not break the worker. """
+        worker = Mock()
+
+        def sampler():
+            """ Sampler that always fails. """
+            raise RuntimeError("nvidia-smi not found")
+
+        worker_plugin = wp.TaskSamplerWorkerPlugin(sampler=sampler)
+        worker_plugin.setup(worker)
+
+        worker_plugin.transition('func', 'ready', 'executing')
+
+        worker.batched_stream.send.assert_not_called()
+
+    def test_allocator_peak(self):
+        """ Test that the allocator peak of each task is sent. """
+        worker = Mock()
+        allocator = FakeAllocator()
+
+        tracker = allocator.tracker()
+        malloc = allocator.get_allocator()
+
+        worker_plugin = wp.TaskSamplerWorkerPlugin(allocator='cupy')
+
+        with patch("dask_memusage_gpus.allocators.get_tracker", return_value=tracker):
+            worker_plugin.setup(worker)
+
+        malloc(10 * MIB)
+
+        worker_plugin.transition('func', 'ready', 'executing')
+
+        malloc(100 * MIB).free()
+
+        worker_plugin.transition('func', 'executing', 'memory')
+
+        messages = [call.args[0] for call in worker.batched_stream.send.call_args_list]
+
+        self.assertEqual([msg['sample']['memory'] for msg in messages], [10, 110])
+
+    def test_allocator_fallback(self):
+        """ Test that the sampler is used when the allocator is missing. """
+        worker = Mock()
+
+        worker_plugin = wp.TaskSamplerWorkerPlugin(sampler=lambda: 100, allocator='rmm')
+
+        with patch("dask_memusage_gpus.allocators.get_tracker", return_value=None):
+            worker_plugin.setup(worker)
+
+        worker_plugin.transition('func', 'ready', 'executing')
+
+        message = worker.batched_stream.send.call_args.args[0]
+
+        self.assertEqual(message['sample']['memory'], 100)
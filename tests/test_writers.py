@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+""" Test all the structures and funtions inside writers submodule. """
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+from dask_memusage_gpus import definitions as defs
+from dask_memusage_gpus import reader, writers
+
+COLUMNS = ["task_key", "time", "min_gpu_memory_mb", "max_gpu_memory_mb", "worker_id"]
+
+ROWS = [
+    ("('make_blobs-3a9c', 0)", 0.5, 100, 300, "tcp://1.2.3.4:1"),
+    ("('make_blobs-3a9c', 1)", 1.5, 100, 500, "tcp://1.2.3.4:2"),
+    ("sum-aggregate-<&>", 2.5, 500, 700, "tcp://1.2.3.4:1"),
+    ("getitem-11ab", 3.5, -1, -1, "tcp://1.2.3.4:2"),
+]
+
+
+class TestWriters(unittest.TestCase):
+    """ Test class for writers submodule. """
+    def setUp(self):
+        """ Setup test method. """
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "memusage")
+
+    def tearDown(self):
+        """ Tear down the test class. """
+        shutil.rmtree(self.tmpdir)
+
+    def test_csv_layout(self):
+        """ Test that the batches match `DataFrame.to_csv()`. """
+        writer = writers.open_writer(defs.CSV, self.path, COLUMNS)
+        writer.write(0, ROWS[:2])
+        writer.write(2, ROWS[2:])
+        writer.close()
+
+        expected = pd.DataFrame(ROWS, columns=COLUMNS)
+
+        with open(self.path, encoding="utf-8") as fp:
+            self.assertEqual(fp.read(), expected.to_csv())
+
+    def test_xml_valid_after_each_batch(self):
+        """ Test that the XML document is complete after every batch. """
+        writer = writers.open_writer(defs.XML, self.path, COLUMNS)
+
+        for i, row in enumerate(ROWS):
+            writer.write(i, [row])
+
+            df = pd.read_xml(self.path)
+
+            self.assertEqual(len(df), i + 1)
+            self.assertEqual(df.task_key.iloc[-1], row[0])
+
+        writer.close()
+
+        # Rows written after closing are appended to the same document
+        writer.write(len(ROWS), ROWS[:1])
+        writer.close()
+
+        df = pd.read_xml(self.path)
+
+        self.assertEqual(list(df["index"]), list(range(len(ROWS) + 1)))
+        self.assertEqual(list(df.max_gpu_memory_mb), [300, 500, 700, -1, 300])
+
+    def test_excel_sheets(self):
+        """ Test that the rows are split over several worksheets. """
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            self.skipTest("Requires openpyxl.")
+
+        path = self.path + ".xlsx"
+
+        writer = writers.ExcelWriter(path, COLUMNS, max_rows=3)
+        writer.write(0, ROWS[:3])
+        writer.write(3, ROWS[3:])
+
+        self.assertFalse(os.path.exists(path))
+
+        writer.close()
+
+        sheets = pd.read_excel(path, sheet_name=None)
+
+        self.assertEqual(list(sheets), ["Dask GPUs", "Dask GPUs 2"])
+        self.assertEqual([len(sheet) for sheet in sheets.values()], [2, 2])
+
+        df = reader.read_records(path)
+
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(list(df.task_key), [row[0] for row in ROWS])
+
+    def test_unknown_type(self):
+        """ Test that unknown record types are refused. """
+        with self.assertRaises(defs.FileTypeException):
+            writers.open_writer("hdf5", self.path, COLUMNS)
+
+    def test_sqlite_live_queries(self):
+        """ Test querying a SQLite record while it is written. """
+        writer = writers.open_writer(defs.SQLITE, self.path, COLUMNS)
+        writer.write(0, ROWS[:2])
+
+        # Wait for the background thread to insert the first batch
+        for _ in range(100):
+            try:
+                with sqlite3.connect(self.path) as conn:
+                    if conn.execute("SELECT COUNT(*) FROM records").fetchone()[0] == 2:
+                        break
+            except sqlite3.Error:
+                pass
+
+            time.sleep(0.05)
+
+        self.assertEqual(reader.infer_file_type(self.path), defs.SQLITE)
+        self.assertEqual(len(reader.read_records(self.path)), 2)
+
+        writer.close()
+
+        # The writer reopens the database and appends after closing
+        writer.write(2, ROWS[2:])
+        writer.close()
+
+        with sqlite3.connect(self.path) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+            prefixes = [name for name, in conn.execute("SELECT name FROM prefixes")]
+            workers = [address for address, in
+                       conn.execute("SELECT address FROM workers")]
+            indexes = [name for name, in conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = 'records'")]
+            rows = conn.execute(f"SELECT * FROM {writers.SQLITE_VIEW}").fetchall()
+
+        self.assertEqual(prefixes, ["make_blobs", "sum-aggregate", "getitem"])
+        self.assertEqual(workers, ["tcp://1.2.3.4:1", "tcp://1.2.3.4:2"])
+        self.assertEqual(sorted(indexes), ["records_prefix_time", "records_worker_time"])
+        self.assertEqual(rows, ROWS)
+
+        df = reader.read_records(self.path, prefixes="make_blobs", start=1.0)
+
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(list(df.task_key), [ROWS[1][0]])
+
+    def test_sqlite_open_failure(self):
+        """ Test that rows are dropped when the database cannot be opened. """
+        path = os.path.join(self.tmpdir, "missing", "memusage")
+
+        writer = writers.open_writer(defs.SQLITE, path, COLUMNS)
+        with self.assertLogs(writers.logger, "ERROR"):
+            writer.write(0, ROWS[:2])
+            writer.close()
+
+        self.assertTrue(writer._failed)
+
+        # Later rows are dropped instead of queued for a thread that never runs
+        writer.write(2, ROWS[2:])
+        writer.close()
+
+        self.assertTrue(writer._queue.empty())
+        self.assertIsNone(writer._thread)
+        self.assertFalse(os.path.exists(path))
@@ -6,9 +6,11 @@ import argparse
 import sys
 
 try:
-    import pandas as pd
+    from dask_memusage_gpus import analysis
+    from dask_memusage_gpus import definitions as defs
+    from dask_memusage_gpus import reader
 except ImportError:
-    print("Do you have `pandas` installed?")
+    print("Do you have `dask_memusage_gpus` installed? Run `pip install .` first.")
     sys.exit(-1)
 
 try:
@@ -19,41 +21,66 @@ except ImportError:
     sys.exit(-1)
 
 
-def check_missing_hits(dataframe):
+def check_missing_hits(dataframe, target=0.95):
     """ Function to check if there is no missing function to record. """
-    t_array = dataframe[dataframe['max_gpu_memory_mb'] == -1]['time'].values
+    missed = dataframe['max_gpu_memory_mb'].to_numpy() == analysis.MISSED
 
-    if len(t_array) == 0:
+    if not missed.any():
         return
 
-    min_time = max(t_array)
-    for i in range(1, len(t_array)):
-        if (min_time > t_array[i] - t_array[i - 1]):
-            min_time = t_array[i] - t_array[i - 1]
+    interval = analysis.recommend_interval(analysis.task_durations(dataframe), target)
 
-    min_time = round(min_time / 2, 5)
+    print(f"WARNING: {missed.mean():.1%} of the tasks have no sample. We suggest to use "
+          f"the interval of {interval:.5g} (s) to sample {target:.0%} of them.")
 
-    print(f"WARNING: There are some missing hits. We suggest to use the interval of {min_time} (s).")
 
+DOWNSAMPLERS = {
+    "minmax": analysis.minmax_downsample,
+    "lttb": analysis.lttb_downsample,
+    "none": None,
+}
 
-def plot(dataframe, output_path, title=''):
-    """ Plot dataframe in `output_path` with or without a `title`. """
+
+def plot(dataframe, output_path, title='', max_points=2000, downsample="minmax"):
+    """
+    Plot dataframe in `output_path` with or without a `title`.
+
+    Each worker series is downsampled to at most about `max_points`
+    points. HTML outputs are interactive and rendered with WebGL. Records
+    with timestamps are placed at the time of their peak, aligned across
+    the workers, instead of the time they were recorded.
+    """
     fig = go.Figure()
 
+    html = output_path.lower().endswith(".html")
+    scatter = go.Scattergl if html else go.Scatter
+    colors = px.colors.qualitative.G10
+    downsampler = DOWNSAMPLERS[downsample]
+
     dataframe = dataframe[dataframe["max_gpu_memory_mb"] >= 0]
 
+    if "peak_time" in dataframe:
+        dataframe = dataframe.assign(time=dataframe["peak_time"].where(
+            dataframe["peak_time"] >= 0, dataframe["time"]))
+
+    dataframe = dataframe.sort_values("time", kind="stable")
+
     # Add traces
-    i = 0
-    for worker_id in pd.unique(dataframe['worker_id']):
-        fig.add_trace(go.Scatter(x=dataframe[dataframe['worker_id'] == worker_id]['time'],
-                                 y=dataframe[dataframe['worker_id'] == worker_id]['max_gpu_memory_mb'],
-                                 mode='lines+markers',
-                                 name='GPU ' + str(i),
-                                 marker=dict(color=px.colors.qualitative.G10[i]))
+    for i, (_, group) in enumerate(dataframe.groupby('worker_id', sort=False)):
+        x = group['time'].to_numpy()
+        y = group['max_gpu_memory_mb'].to_numpy()
+
+        if downsampler is not None:
+            keep = downsampler(x, y, max_points)
+            x, y = x[keep], y[keep]
+
+        fig.add_trace(scatter(x=x,
+                              y=y,
+                              mode='lines+markers',
+                              name='GPU ' + str(i),
+                              marker=dict(color=colors[i % len(colors)]))
         )
 
-        i += 1
-
     fig.update_layout(
         height=500,
         width=900,
@@ -64,36 +91,46 @@ def plot(dataframe, output_path, title=''):
         yaxis_title="GPU Memory Usage (MiB)",
     )
 
-    fig.write_image(output_path)
+    if html:
+        fig.write_html(output_path)
+    else:
+        fig.write_image(output_path)
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Process some integers.')
+    parser = argparse.ArgumentParser(
+        description='Plot the GPU memory usage of each worker.')
     parser.add_argument('file', metavar='FILE', type=str, 
                         help='The file to be parsed.')
     parser.add_argument('--output', '-o', type=str, required=True,
                         help='Path and name of the output file.')
     parser.add_argument('--title', type=str, default='',
                         help='Title of the chart.')
-    parser.add_argument('--type', type=str, default='csv',
-                        help='Type of the file to be parsed.')
+    parser.add_argument('--type', type=str, default=None,
+                        help='Type of the file to be parsed (inferred by default).')
+    parser.add_argument('--max-points', type=int, default=2000,
+                        help='Maximum number of points of each worker series.')
+    parser.add_argument('--downsample', type=str, default='minmax',
+                        choices=list(DOWNSAMPLERS),
+                        help='Downsampling method of each worker series.')
 
     args = parser.parse_args()
 
-    if args.type.upper() == 'CSV':
-        dataframe = pd.read_csv(args.file)
-    elif args.type.upper() == 'EXCEL':
-        dataframe = pd.read_excel(args.file)
-    elif args.type.upper() == 'JSON':
-        dataframe = pd.read_json(args.file)
-    elif args.type.upper() == 'PARQUET':
-        dataframe = pd.read_parquet(args.file)
-    elif args.type.upper() == 'XML':
-        dataframe = pd.read_xml(args.file)
-    else:
-        print('ERROR: file type {args.type} is not supported.')
+    columns = ['time', 'max_gpu_memory_mb', 'worker_id']
+
+    # The peak times are only recorded with the timestamps
+    files = reader.list_files(args.file)
+    metadata = reader.read_metadata(files[0]) if files else None
+    if metadata and 'peak_time' in metadata['config'].get('columns', []):
+        columns.append('peak_time')
+
+    try:
+        dataframe = reader.read_records(args.file, filetype=args.type, columns=columns)
+    except defs.FileTypeException:
+        print(f'ERROR: file type {args.type} is not supported.')
         sys.exit(-2)
 
     check_missing_hits(dataframe)
 
-    plot(dataframe, args.output, title=args.title)
+    plot(dataframe, args.output, title=args.title, max_points=args.max_points,
+         downsample=args.downsample)